@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレーサー（固定レート制御ループ版）
+
+説明
+
+　motors.source にジェネレータを与える方法では、制御の周期は gpiozero の
+  スレッドと source_delay 任せになり、周期のばらつきは保証されません。
+  ControlLoop は指定したレート（例えば 500 Hz〜1 kHz）で step() を
+  呼び出す専用の制御ループです。
+
+    - 絶対時刻の締め切り　# 周期の開始時刻を「開始時刻 + n x 周期」で決め、
+                            処理時間のばらつきで周期がずれていかない
+    - 待ち方　　　　　　　# 締め切りの spin_us 手前までは sleep、残りは空回り
+    - オーバーラン　　　　# 処理が次の周期の開始に間に合わなかった回数
+                            （間に合わなかった周期は飛ばして位相を保つ）
+    - ジッタ　　　　　　　# 周期の開始の締め切りからの遅れ
+
+  統計量は直近 window 周期分をあらかじめ確保した配列に記録し、
+  stats() で平均・標準偏差・99% 点・最大値を求めます。
+
+  プログラムを実行する際は、以下のコマンドを実行して下さい。
+  [Ctrl+C] で停止し、制御ループの統計量を表示します。
+
+　　$ python3 eiclab_control_loop.py
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+参考サイト
+	https://gpiozero.readthedocs.io/en/stable/index.html
+"""
+from time import perf_counter_ns, sleep
+import threading
+import numpy as np
+import gc
+import os
+
+# 制御ループのレート Hz
+RATE = 1000
+
+class ControlLoop:
+	""" 固定レート制御ループ
+
+		step() を rate [Hz] の周期で呼び出します。run() はその場で、
+		start() は別スレッドで実行し、stop() で停止します。
+
+		realtime=True のときは可能であれば SCHED_FIFO で実行し
+		（要管理者権限）、disable_gc=True のときは実行中のガベージ
+		コレクションを止めます。
+
+		時刻 ns を返す clock と待機 sleep(s) は差し替えられます
+		（テストで実時間によらない時計を与える場合など）。
+	"""
+
+	def __init__(self, step, rate = RATE, window = 4096, spin_us = 200, \
+			realtime = False, disable_gc = False, clock = perf_counter_ns, sleep = sleep):
+		self._step = step
+		self._clock = clock
+		self._sleep = sleep
+		self._rate = rate
+		self._period_ns = int(round(1e9/rate))
+		self._spin_ns = int(spin_us*1000)
+		self._realtime = realtime
+		self._disable_gc = disable_gc
+		self._window = window
+		self._lateness = np.zeros(window,dtype=np.int64) # 締め切りからの遅れ ns
+		self._busy = np.zeros(window,dtype=np.int64)     # step() の処理時間 ns
+		self._running = False
+		self._thread = None
+		self.reset()
+
+	def reset(self):
+		""" 統計量の消去 """
+		self._iterations = 0
+		self._overruns = 0
+		self._skipped = 0
+		self._elapsed_ns = 0
+
+	@property
+	def rate(self):
+		return self._rate
+
+	@property
+	def period(self):
+		""" 周期 s """
+		return self._period_ns*1e-9
+
+	@property
+	def iterations(self):
+		""" step() を呼び出した回数 """
+		return self._iterations
+
+	@property
+	def overruns(self):
+		""" 次の周期の開始に間に合わなかった回数 """
+		return self._overruns
+
+	@property
+	def skipped(self):
+		""" オーバーランで飛ばした周期の数 """
+		return self._skipped
+
+	@property
+	def running(self):
+		return self._running
+
+	def run(self, duration = None, iterations = None):
+		""" 制御ループの実行（duration 秒、iterations 回、または stop() まで） """
+		period = self._period_ns
+		spin = self._spin_ns
+		window = self._window
+		lateness = self._lateness
+		busy = self._busy
+		step = self._step
+		clock = self._clock
+		sleep = self._sleep
+		limit = None if iterations is None else self._iterations + iterations
+		self._running = True
+		self._set_realtime()
+		gc_enabled = gc.isenabled()
+		if self._disable_gc:
+			gc.disable()
+		start = clock()
+		try:
+			end_time = None if duration is None else start + int(duration*1e9)
+			deadline = start
+			while self._running:
+				# 締め切りまで待機（手前までは sleep、残りは空回り）
+				remaining = deadline - clock()
+				if remaining > spin:
+					sleep((remaining-spin)*1e-9)
+				while clock() < deadline:
+					pass
+
+				# 制御
+				t0 = clock()
+				step()
+				t1 = clock()
+				idx = self._iterations % window
+				lateness[idx] = t0 - deadline
+				busy[idx] = t1 - t0
+				self._iterations += 1
+
+				# 次の締め切り（間に合わなかった周期は飛ばす）
+				deadline += period
+				if t1 > deadline:
+					missed = (t1-deadline)//period + 1
+					deadline += missed*period
+					self._overruns += 1
+					self._skipped += missed
+				if limit is not None and self._iterations >= limit:
+					break
+				if end_time is not None and deadline >= end_time:
+					break
+		finally:
+			self._elapsed_ns += clock() - start
+			self._running = False
+			if gc_enabled and self._disable_gc:
+				gc.enable()
+
+	def start(self, duration = None):
+		""" 別スレッドでの実行 """
+		self._running = True
+		self._thread = threading.Thread(target=self.run,args=(duration,),daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		""" 停止（別スレッドで実行中なら終了を待つ） """
+		self._running = False
+		if self._thread is not None and self._thread is not threading.current_thread():
+			self._thread.join()
+			self._thread = None
+
+	def stats(self):
+		""" 統計量（時間は us）
+
+			出力　{ "iterations": 呼び出し回数, "overruns": オーバーラン回数,
+					"skipped": 飛ばした周期の数, "rate": 実際のレート Hz,
+					"jitter_mean", "jitter_std", "jitter_p99", "jitter_max": 締め切りからの遅れ,
+					"busy_mean", "busy_max": step() の処理時間 }
+		"""
+		n = min(self._iterations,self._window)
+		lateness = 1e-3*self._lateness[:n]
+		busy = 1e-3*self._busy[:n]
+		nan = float('nan')
+		rate = self._iterations/(self._elapsed_ns*1e-9) if self._elapsed_ns > 0 else nan
+		return { "iterations": self._iterations, \
+				 "overruns": self._overruns, \
+				 "skipped": self._skipped, \
+				 "rate": rate, \
+				 "jitter_mean": float(lateness.mean()) if n else nan, \
+				 "jitter_std": float(lateness.std()) if n else nan, \
+				 "jitter_p99": float(np.percentile(lateness,99)) if n else nan, \
+				 "jitter_max": float(lateness.max()) if n else nan, \
+				 "busy_mean": float(busy.mean()) if n else nan, \
+				 "busy_max": float(busy.max()) if n else nan }
+
+	def _set_realtime(self):
+		""" 実時間スケジューリングの設定（できなければそのまま） """
+		if not self._realtime or not hasattr(os,'sched_setscheduler'):
+			return
+		try:
+			priority = os.sched_get_priority_max(os.SCHED_FIFO)
+			os.sched_setscheduler(0,os.SCHED_FIFO,os.sched_param(priority))
+		except (OSError, PermissionError):
+			pass
+
+def main():
+	""" メイン関数 """
+	from gpiozero import Robot
+	from eiclab_line_follower_advanced import LineFollower
+	from eiclab_photorefs_array import PhotoRefArray
+	from eiclab_photorefs_sampler import PhotoRefSampler
+	from eiclab_photorefs_calib import PhotoRefCalibration, CALIB_FILE
+
+	# モータードライバ接続ピン
+	PIN_AIN1 = 6
+	PIN_AIN2 = 5
+	PIN_BIN1 = 26
+	PIN_BIN2 = 27
+
+	# A/D変換チャネル数
+	NUM_CH = 4
+
+	# 左右モーター設定
+	motors = Robot(left=(PIN_AIN1,PIN_AIN2),right=(PIN_BIN1,PIN_BIN2))
+	# フォトリフレクタ（複数）設定（A/D変換、ハードウェア SPI で全チャネルを一括読み出し）
+	photorefs = PhotoRefArray(NUM_CH,hardware=True)
+	# 別スレッドで読み出し続け、制御では直近 4 回分の平均を待たずに使う
+	sampler = PhotoRefSampler(photorefs,average=4)
+	# 較正ファイル（eiclab_photorefs_calib.py で作成）があれば白で 1、黒で 0 に正規化
+	source = sampler
+	if os.path.exists(CALIB_FILE):
+		source = PhotoRefCalibration.load(sampler,CALIB_FILE)
+
+	# ライントレース処理（固定レート）
+	lf = LineFollower(source)
+	def step():
+		motors.value = lf.prs2mtrs()
+	loop = ControlLoop(step,rate=RATE,realtime=True)
+
+	# 停止(Ctr+c)まで実行
+	sampler.start()
+	try:
+		loop.run()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		motors.stop()
+		sampler.stop()
+		stats = loop.stats()
+		print('rate {:.1f} Hz, overruns {} ({} periods skipped) / {} iterations'.format( \
+			stats['rate'],stats['overruns'],stats['skipped'],stats['iterations']))
+		print('jitter mean {:.1f} us, std {:.1f} us, p99 {:.1f} us, max {:.1f} us'.format( \
+			stats['jitter_mean'],stats['jitter_std'],stats['jitter_p99'],stats['jitter_max']))
+		print('step mean {:.1f} us, max {:.1f} us'.format(stats['busy_mean'],stats['busy_max']))
+
+if __name__ == '__main__':
+	main()
@@ -10,16 +10,14 @@
         https://gpiozero.readthedocs.io/en/stable/recipes_advanced.html#bluedot-robot
 """
 import gpiozero
-from gpiozero import MCP3004, Robot
+from gpiozero import Robot
+from eiclab_photorefs_array import PhotoRefArray
 from signal import pause
 
 def prs2mtrs(photorefs):
         """ フォトリフレクタの値をモーター制御の強度値に変換 """
-        # フォトリフレクタの値を読み出し
-        pr0 = photorefs[0].value
-        pr1 = photorefs[1].value
-        pr2 = photorefs[2].value
-        pr3 = photorefs[3].value
+        # フォトリフレクタの値を読み出し（全チャネルを一括）
+        pr0, pr1, pr2, pr3 = photorefs.read()
 
         # モーター制御の強度値を計算（ここを工夫）
         left = (pr0+pr1)/2.0
@@ -51,7 +49,7 @@ def main():
                        right=(PIN_BIN1,PIN_BIN2) ) #, \
                        # pwm=True)
         # フォトリフレクタ（複数）設定（A/D変換）
-        photorefs = [ MCP3004(channel=idx) for idx in range(NUM_CH) ]    
+        photorefs = PhotoRefArray(NUM_CH)
 
         # ライントレース処理
         motors.source = line_follow(photorefs)
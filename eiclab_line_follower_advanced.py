@@ -9,37 +9,40 @@
         https://gpiozero.readthedocs.io/en/stable/index.html
         https://gpiozero.readthedocs.io/en/stable/recipes_advanced.html#bluedot-robot
 """
-import numpy as np
 import gpiozero
-from gpiozero import MCP3004, Robot
+from gpiozero import Robot
+from lfcontrol import LFController, clamped
+from eiclab_photorefs_array import PhotoRefArray
 from signal import pause
 
-class LineFollower:
+class LineFollower(LFController):
+        """ ライントレース制御クラス
 
-        def __init__(self,photorefs):
-                self.prs = photorefs                
-                
-        def prs2mtrs(self):
-                """ フォトリフレクタの値をモーター制御の強度値に変換 """
-                # フォトリフレクタの値を読み出しとベクトル化
-                vec_x = np.array([ self.prs[idx].value \
-                                 for idx in range(len(self.prs)) ])
-                
-                # モーター制御の強度値を計算（ここを工夫）
-                mat_A = np.array([[0.4, 0.3, 0.2, 0.1],\
-                                  [0.1, 0.2, 0.3, 0.4]])
-                vec_y = np.dot(mat_A,vec_x)
+                シミュレータと共通の制御器（lfcontrol.LFController）を、
+                実機の係数 MAT_A（バイアスなし）で使います。係数行列と
+                入出力のバッファは構築時に一度だけ確保し、prs2mtrs() の
+                呼び出しごとにはメモリを確保しません。制御ループ
+                （eiclab_control_loop.py）から高いレートで呼び出しても
+                時間のばらつきが生じにくくなります。
+
+                photorefs に read(out) を持つ一括読み出しのオブジェクト
+                （eiclab_photorefs_array.PhotoRefArray など）を与えると、
+                全チャネルを 1 回の SPI 通信のまとまりで読み出します。
+                シミュレータで調整した制御器をそのまま使う場合は、
+                その制御器の photorefs にフォトリフレクタを設定して下さい。
+        """
+
+        # モーター制御の強度値を計算する係数（ここを工夫）
+        MAT_A = ((0.4, 0.3, 0.2, 0.1),
+                 (0.1, 0.2, 0.3, 0.4))
+        BIAS = 0.0
+
+        def __init__(self,photorefs,mat_A = None,bias = None):
+                super().__init__(photorefs,mat_A=mat_A,bias=bias)
 
-                # 出力範囲を[-1,1]に直して出力
-                left, right = vec_y[0], vec_y[1]
-                return (clamped(left),clamped(right))
-                  
         def line_follow(self):
                 while True:
-                        yield self.prs2mtrs()
-
-def clamped(v):
-        return max(-1,min(1,v))
+                        yield tuple(self.prs2mtrs())
 
 def main():
         """ メイン関数 """
@@ -57,7 +60,7 @@ def main():
                        right=(PIN_BIN1,PIN_BIN2)) #, \
                        # pwm=True)
         # フォトリフレクタ（複数）設定（A/D変換）
-        photorefs = [ MCP3004(channel=idx) for idx in range(NUM_CH) ]    
+        photorefs = PhotoRefArray(NUM_CH)
 
         # ライントレース処理
         lf = LineFollower(photorefs)
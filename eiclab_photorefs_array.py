@@ -0,0 +1,152 @@
+# coding: UTF-8
+"""
+フォトリフレクタの一括読み出し（MCP3004/MCP3008）
+
+説明
+
+　MCP3004(channel=idx).value をチャネルごとに読み出すと、1 チャネルごとに
+  gpiozero のデバイスオブジェクトを経由した SPI 通信（ビット列の組み立てと
+  分解を含む）が行われます。PhotoRefArray は全チャネルの変換要求を
+  あらかじめ組み立てておき、1 回のロックの中で続けて送受信して、
+  結果を NumPy 配列に書き込みます。
+
+    - channels  # 読み出すチャネル数（MCP3008 なら 8 まで）、またはチャネル番号の並び
+    - hardware  # True: ハードウェア SPI（spidev）のみ（使えなければ SPIBadArgs）、
+                  False: ソフトウェア SPI（ビットバング）でもよい（切り替えを警告しない）、
+                  None: gpiozero の既定（ハードウェア SPI が使えなければ警告して
+                  ソフトウェア SPI）
+
+  SPI の接続は gpiozero の SPIDevice と同じく pin_factory.spi() で行うので、
+  port, device や clock_pin などのピンの指定も同じです（ハードウェア SPI の
+  ピン以外を指定するとソフトウェア SPI）。SPI の引数でない項目は SPIBadArgs です。
+
+  MCP3004/MCP3008 は CS の立ち下がりで変換を始めるため、チャネルごとに
+  CS を上げ下げする 3 バイトの転送が必要です。値は MCP3004.value と
+  同じ式で [0,1] に変換します。
+
+  プログラムを実行する際は、以下のコマンドを実行して下さい。
+  読み出した値と 1 回の読み出しにかかった時間を表示します。
+
+　　$ python3 eiclab_photorefs_array.py
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+参考サイト
+	https://gpiozero.readthedocs.io/en/stable/index.html
+	https://gpiozero.readthedocs.io/en/stable/api_spi.html
+"""
+from gpiozero import SPIDevice, SPIBadArgs, SPIBadChannel, SPISoftwareFallback
+from time import perf_counter, sleep
+import threading
+import warnings
+import numpy as np
+
+# A/D変換チャネル数
+NUM_CH = 4
+
+# MCP3004/MCP3008 の分解能 bit とチャネル数の上限
+BITS = 10
+MAX_CH = 8
+
+class PhotoRefArray(SPIDevice):
+	""" フォトリフレクタ（複数）の一括読み出しクラス
+
+		read() で全チャネルを続けて読み出し、[0,1] の値の配列を返します。
+		out を与えるとその配列に書き込み、与えなければ構築時に確保した
+		配列を使い回します（呼び出しごとにはメモリを確保しません）。
+	"""
+
+	def __init__(self, channels = NUM_CH, differential = False, max_voltage = 3.3, \
+			hardware = None, **spi_args):
+		channels = tuple(range(channels)) if np.ndim(channels) == 0 else tuple(channels)
+		if not channels or not all(0 <= ch < MAX_CH for ch in channels):
+			raise SPIBadChannel('channels must be between 0 and {}'.format(MAX_CH-1))
+		self._channels = channels
+		self._differential = bool(differential)
+		self._max_voltage = float(max_voltage)
+		# pin_factory.spi() で接続（ソフトウェア SPI への切り替えは警告で通知される）
+		with warnings.catch_warnings():
+			if hardware is not None:
+				warnings.simplefilter('error' if hardware else 'ignore',SPISoftwareFallback)
+			try:
+				super().__init__(shared=True,**spi_args)
+			except SPISoftwareFallback as e:
+				raise SPIBadArgs('hardware SPI is not available: {}'.format(e)) from None
+		self._lock = threading.Lock()
+
+		# 変換要求（チャネルごとの 3 バイト）
+		#     Byte        0        1        2
+		#     Tx   00000001 MCCCxxxx xxxxxxxx
+		#     Rx   xxxxxxxx xxxxx0RR RRRRRRRR
+		mode = 0x00 if self._differential else 0x80
+		self._frames = [ [ 0x01, mode | (ch << 4), 0x00 ] for ch in channels ]
+
+		# 出力バッファと変換係数（MCP3004.value と同じ (2*raw+1)/(2^(bits+1)-1)）
+		self._raw = np.zeros(len(channels))
+		self._values = np.zeros(len(channels))
+		self._scale = 2.0/(2**(BITS+1)-1)
+		self._offset = 1.0/(2**(BITS+1)-1)
+
+	def __len__(self):
+		return len(self._channels)
+
+	@property
+	def channels(self):
+		return self._channels
+
+	@property
+	def differential(self):
+		return self._differential
+
+	@property
+	def max_voltage(self):
+		return self._max_voltage
+
+	def read_raw(self):
+		""" 全チャネルの変換値（0〜1023）の読み出し（1 回のロックの中で続けて転送） """
+		self._check_open()
+		raw = self._raw
+		transfer = self._spi.transfer
+		with self._lock:
+			for idx, frame in enumerate(self._frames):
+				rx = transfer(frame)
+				raw[idx] = ((rx[1] & 0x03) << 8) | rx[2]
+		return raw
+
+	def read(self, out = None):
+		""" 全チャネルの値 [0,1] の読み出し """
+		raw = self.read_raw()
+		if out is None:
+			out = self._values
+		np.multiply(raw,self._scale,out=out)
+		out += self._offset
+		return out
+
+	@property
+	def values(self):
+		""" 全チャネルの値 [0,1]（読み出しごとに同じ配列を更新） """
+		return self.read()
+
+	@property
+	def voltages(self):
+		""" 全チャネルの電圧 V """
+		return self.read()*self._max_voltage
+
+def main():
+	""" メイン関数 """
+	# フォトリフレクタ（複数）設定（A/D変換）
+	photorefs = PhotoRefArray(NUM_CH)
+
+	# ループ処置
+	while True:
+		t0 = perf_counter()
+		values = photorefs.read()
+		elapsed = perf_counter() - t0
+		for idx, v in enumerate(values):
+			print('{}:{:4.2f} '.format(idx+1,v),end=' ')
+		print('({:.1f} us)'.format(elapsed*1e6))
+		# 0.1秒待機
+		sleep(0.1)
+
+if __name__ == '__main__':
+	main()
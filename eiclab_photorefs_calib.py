@@ -0,0 +1,171 @@
+# coding: UTF-8
+"""
+フォトリフレクタの較正
+
+説明
+
+　フォトリフレクタの値は個体差やコースの照明で変わります。
+  シミュレータのフォトリフレクタ（LFPhotoReflector）は白で 1、黒で 0 を
+  返すので、実機でも同じ範囲に揃えてから制御に使うと、シミュレータで
+  調整した係数をそのまま使えます。
+
+    - 較正　　# 車体を手で動かしてフォトリフレクタに白と黒の両方を通過させ、
+                チャネルごとの白と黒の値を求めてファイルに保存
+    - 正規化　# (値 - 黒)/(白 - 黒) を [0,1] に制限（係数は読み込み時に計算済み）
+
+  白と黒の値は、記録した値の上下 PERCENTILE % 点とします（外れ値の影響を
+  受けにくい最大値・最小値）。ACTIVE_WHITE が True のときは白で値が
+  大きいとし、False のときは逆とします。
+
+  プログラムを実行する際は、以下のコマンドを実行して下さい。
+  1 つ目は DURATION 秒間の較正、2 つ目は較正した値の表示です。
+
+　　$ python3 eiclab_photorefs_calib.py
+　　$ python3 eiclab_photorefs_calib.py --check
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+参考サイト
+	https://gpiozero.readthedocs.io/en/stable/index.html
+"""
+from time import perf_counter, sleep
+import numpy as np
+import argparse
+import json
+
+# 較正ファイル
+CALIB_FILE = 'photorefs_calib.json'
+
+# 較正の時間 s とレート Hz
+DURATION = 10.0
+RATE = 200
+
+# 白と黒の値とする上下の % 点、白と黒の差の下限
+PERCENTILE = 1.0
+MIN_SPAN = 0.05
+
+# 白で値が大きいか（False のときは黒で値が大きい）
+ACTIVE_WHITE = True
+
+class PhotoRefCalibration:
+	""" フォトリフレクタの較正クラス
+
+		source（read(out) を持つ PhotoRefArray, PhotoRefSampler,
+		PhotoRefFilter など）の値を、白で 1、黒で 0 になるように
+		チャネルごとに正規化します。係数は構築時に求め、read() では
+		その場で 1 次変換と制限を行うだけです。
+	"""
+
+	def __init__(self, source, white, black):
+		self._source = source
+		self._white = np.array(white,dtype=float)
+		self._black = np.array(black,dtype=float)
+		if self._white.shape != (len(source),) or self._black.shape != (len(source),):
+			raise ValueError('white and black need one value per channel.')
+		span = self._white - self._black
+		if np.any(np.abs(span) < 1e-9):
+			raise ValueError('white and black must differ on every channel.')
+		self._gain = 1.0/span
+		self._offset = -self._black*self._gain
+		self._out = np.zeros(len(source))
+
+	def __len__(self):
+		return len(self._gain)
+
+	@property
+	def source(self):
+		return self._source
+
+	@property
+	def white(self):
+		return self._white
+
+	@property
+	def black(self):
+		return self._black
+
+	def read(self, out = None):
+		""" 正規化した値 [0,1]（白で 1、黒で 0） """
+		if out is None:
+			out = self._out
+		self._source.read(out=out)
+		out *= self._gain
+		out += self._offset
+		np.minimum(out,1.0,out=out)
+		np.maximum(out,0.0,out=out)
+		return out
+
+	@property
+	def values(self):
+		return self.read()
+
+	def save(self, filename = CALIB_FILE):
+		""" 較正ファイルの保存 """
+		with open(filename,'w',encoding='utf-8') as f:
+			json.dump({ "white": self._white.tolist(), "black": self._black.tolist() },f,indent=2)
+
+	@classmethod
+	def load(cls, source, filename = CALIB_FILE):
+		""" 較正ファイルの読み込み """
+		with open(filename,'r',encoding='utf-8') as f:
+			table = json.load(f)
+		return cls(source,table['white'],table['black'])
+
+def calibrate(source, duration = DURATION, rate = RATE, active_white = ACTIVE_WHITE, \
+		percentile = PERCENTILE, min_span = MIN_SPAN):
+	""" 較正
+
+		duration 秒間 rate [Hz] で source を読み出し、チャネルごとの
+		白と黒の値を求めて PhotoRefCalibration を返します。
+		白と黒の差が min_span に満たないチャネルがあれば ValueError です。
+	"""
+	num = int(duration*rate)
+	samples = np.zeros((num,len(source)))
+	start = perf_counter()
+	for idx in range(num):
+		source.read(out=samples[idx])
+		wait = start + (idx+1)/rate - perf_counter()
+		if wait > 0:
+			sleep(wait)
+	low, high = np.percentile(samples,[ percentile, 100.0-percentile ],axis=0)
+	white, black = (high, low) if active_white else (low, high)
+	short = np.nonzero(np.abs(white-black) < min_span)[0]
+	if short.size:
+		raise ValueError('Channels {} did not see both white and black.'.format( \
+			', '.join(str(ch+1) for ch in short)))
+	return PhotoRefCalibration(source,white,black)
+
+def main():
+	""" メイン関数 """
+	from eiclab_photorefs_array import PhotoRefArray, NUM_CH
+
+	parser = argparse.ArgumentParser(description='Calibrate the photoreflectors')
+	parser.add_argument('--check',action='store_true',help='show calibrated values')
+	parser.add_argument('--duration',type=float,default=DURATION)
+	parser.add_argument('--file',default=CALIB_FILE)
+	args = parser.parse_args()
+
+	# フォトリフレクタ（複数）設定（A/D変換）
+	photorefs = PhotoRefArray(NUM_CH)
+
+	if not args.check:
+		# 較正（この間に白と黒の上を通過させる）
+		print('Move the sensors over white and black for {} s...'.format(args.duration))
+		calib = calibrate(photorefs,duration=args.duration)
+		calib.save(args.file)
+		for idx in range(NUM_CH):
+			print('{}: white {:4.2f}, black {:4.2f}'.format(idx+1,calib.white[idx],calib.black[idx]))
+		return
+
+	# 較正した値の表示（停止(Ctr+c)まで）
+	calib = PhotoRefCalibration.load(photorefs,args.file)
+	while True:
+		values = calib.read()
+		for idx, v in enumerate(values):
+			print('{}:{:4.2f} '.format(idx+1,v),end=' ')
+		print()
+		# 0.1秒待機
+		sleep(0.1)
+
+if __name__ == '__main__':
+	main()
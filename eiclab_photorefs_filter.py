@@ -0,0 +1,165 @@
+# coding: UTF-8
+"""
+フォトリフレクタの値のフィルタ
+
+説明
+
+　PhotoRefSampler（eiclab_photorefs_sampler.py）が記録した直近 window 回分の
+  読み出しをまとめて取り出し、NumPy の配列演算でチャネルごとに処理します。
+  読み出しは制御より速いレートで行うため、制御のレートを下げずに
+  雑音の少ない値が得られます。
+
+    - window    # 処理する直近の読み出し回数
+    - median    # False: 平均（オーバーサンプリング）、True: 中央値（外れ値の除去）
+    - tau       # 1 次 IIR ローパスフィルタの時定数 s（None で使わない）
+    - ambient   # 外乱光の除去（発光側の LED の点灯時の値から消灯時の値を引く）
+
+  ambient=True には、発光側の LED を emitter に与えて読み出しごとに
+  点灯・消灯を切り替える PhotoRefSampler が必要です。IIR フィルタは
+  読み出しの時刻の間隔から係数 1-exp(-dt/tau) を求めるので、
+  read() を呼ぶ間隔によらず同じ時定数になります。
+
+  プログラムを実行する際は、以下のコマンドを実行して下さい。
+  フォトリフレクタの発光側を PIN_LD に接続した場合は --ambient で
+  外乱光を除去します。
+
+　　$ python3 eiclab_photorefs_filter.py
+　　$ python3 eiclab_photorefs_filter.py --median --ambient
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+参考サイト
+	https://gpiozero.readthedocs.io/en/stable/index.html
+"""
+from time import sleep
+import numpy as np
+import argparse
+
+# 処理する直近の読み出し回数
+WINDOW = 8
+
+class PhotoRefFilter:
+	""" フォトリフレクタの値のフィルタクラス
+
+		read() で「平均または中央値（外乱光の除去）→ IIR ローパスフィルタ」の
+		順に処理した値を返します。PhotoRefSampler と同じく read(out) を
+		持つので、LineFollower にフォトリフレクタの代わりに与えられます。
+	"""
+
+	def __init__(self, sampler, window = WINDOW, median = False, tau = None, \
+			ambient = False):
+		if ambient and sampler.emitter is None:
+			raise ValueError('ambient=True requires a sampler with an emitter.')
+		if window < (2 if ambient else 1):
+			raise ValueError('window is too small: {}'.format(window))
+		self._sampler = sampler
+		self._median = median
+		self._tau = tau
+		self._ambient = ambient
+		num = len(sampler)
+		self._window = np.zeros((window,num))
+		self._lit = np.zeros(window,dtype=bool)
+		self._dark = np.zeros(num)
+		self._out = np.zeros(num)
+		self.reset()
+
+	def __len__(self):
+		return self._window.shape[1]
+
+	@property
+	def sampler(self):
+		return self._sampler
+
+	@property
+	def window(self):
+		return len(self._window)
+
+	def reset(self):
+		""" IIR フィルタの状態の消去 """
+		self._state = np.zeros(len(self))
+		self._t = None
+
+	def _reduce(self, rows, out):
+		""" 読み出しの平均または中央値 """
+		if self._median:
+			return np.median(rows,axis=0,out=out)
+		return np.mean(rows,axis=0,out=out)
+
+	def read(self, out = None):
+		""" フィルタ処理した値（待たずに返す） """
+		if out is None:
+			out = self._out
+		valid = self._sampler.recent(self._window,lit=self._lit if self._ambient else None)
+		if valid == 0:
+			out[:] = np.nan
+			return out
+		rows = self._window[-valid:]
+
+		# 平均または中央値（外乱光の除去は点灯時と消灯時を別に処理して差をとる）
+		if self._ambient:
+			lit = self._lit[-valid:]
+			if lit.all() or not lit.any():
+				out[:] = np.nan
+				return out
+			self._reduce(rows[lit],out)
+			out -= self._reduce(rows[~lit],self._dark)
+			np.maximum(out,0.0,out=out)
+		else:
+			self._reduce(rows,out)
+
+		# 1 次 IIR ローパスフィルタ（読み出しの時刻の間隔で係数を決める）
+		if self._tau is not None:
+			t = self._sampler.timestamp
+			if self._t is None:
+				self._state[:] = out
+			elif t > self._t:
+				alpha = -np.expm1(-(t-self._t)/self._tau)
+				self._state += alpha*(out-self._state)
+			self._t = t
+			out[:] = self._state
+		return out
+
+	@property
+	def values(self):
+		return self.read()
+
+def main():
+	""" メイン関数 """
+	from gpiozero import LED
+	from eiclab_photorefs_array import PhotoRefArray, NUM_CH
+	from eiclab_photorefs_sampler import PhotoRefSampler
+
+	parser = argparse.ArgumentParser(description='Filtered photoreflector values')
+	parser.add_argument('--window',type=int,default=WINDOW)
+	parser.add_argument('--median',action='store_true')
+	parser.add_argument('--tau',type=float,default=None,help='IIR time constant in seconds')
+	parser.add_argument('--ambient',action='store_true', \
+		help='subtract ambient light by toggling the emitter on PIN_LD')
+	args = parser.parse_args()
+
+	# 接続ピン（フォトリフレクタの発光側）
+	PIN_LD = 23
+
+	# フォトリフレクタ（複数）設定（A/D変換、バックグラウンドで読み出し）
+	emitter = LED(PIN_LD) if args.ambient else None
+	sampler = PhotoRefSampler(PhotoRefArray(NUM_CH),emitter=emitter)
+	photorefs = PhotoRefFilter(sampler,window=args.window,median=args.median, \
+		tau=args.tau,ambient=args.ambient)
+	sampler.start()
+
+	# ループ処置（停止(Ctr+c)まで）
+	try:
+		while True:
+			values = photorefs.read()
+			for idx, v in enumerate(values):
+				print('{}:{:4.2f} '.format(idx+1,v),end=' ')
+			print()
+			# 0.1秒待機
+			sleep(0.1)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		sampler.stop()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,258 @@
+# coding: UTF-8
+"""
+フォトリフレクタの読み出し（バックグラウンド版）
+
+説明
+
+　prs2mtrs() の中でフォトリフレクタを読み出すと、A/D変換の時間が
+  そのままモーター出力までの遅れになります。PhotoRefSampler は別スレッドで
+  一定のレートでフォトリフレクタを読み出し続け、時刻付きで
+  リングバッファに記録します。制御側は read() で最新の値（または
+  直近 average 回分の平均）を待たずに取り出します。
+
+    - rate      # 読み出しのレート Hz（制御のレートとは独立）
+    - depth     # リングバッファの長さ（記録しておく読み出し回数）
+    - average   # read() で平均する直近の読み出し回数（オーバーサンプリング）
+    - emitter   # 発光側の LED（gpiozero の出力デバイス）。与えると読み出しごとに
+                  点灯・消灯を切り替え、点灯していたかを値と一緒に記録
+
+  バッファは構築時に確保し、読み出しスレッドは行を書き終えてから
+  読み出し回数を進めます。read() はロックを使わず、読み出し回数から
+  最新の行を求めて複写し、その間に書き換えられていたら読み直します。
+
+  LineFollower（eiclab_line_follower_advanced.py）にフォトリフレクタの
+  代わりに与えると、最新の値で制御します。直近の値をまとめて
+  取り出す recent() は、フィルタ（eiclab_photorefs_filter.py）が使います。
+
+  プログラムを実行する際は、以下のコマンドを実行して下さい。
+
+　　$ python3 eiclab_photorefs_sampler.py
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+参考サイト
+	https://gpiozero.readthedocs.io/en/stable/index.html
+"""
+from eiclab_control_loop import ControlLoop
+from time import perf_counter_ns, sleep
+import numpy as np
+
+# 読み出しのレート Hz、リングバッファの長さ
+SAMPLE_RATE = 4000
+DEPTH = 1024
+
+class PhotoRefSampler:
+	""" フォトリフレクタのバックグラウンド読み出しクラス
+
+		photorefs は read(out) を持つ一括読み出しのオブジェクト
+		（eiclab_photorefs_array.PhotoRefArray）、または value を持つ
+		フォトリフレクタのリストです。
+	"""
+
+	def __init__(self, photorefs, rate = SAMPLE_RATE, depth = DEPTH, average = 1, \
+			emitter = None):
+		if not 1 <= average <= depth - 1:
+			raise ValueError('average must be between 1 and {}'.format(depth-1))
+		self._prs = photorefs
+		self._read = getattr(photorefs,'read',None)
+		self._depth = depth
+		self._average = average
+		num = len(photorefs)
+		self._samples = np.zeros((depth,num))               # 読み出した値
+		self._times = np.zeros(depth,dtype=np.int64)        # 読み出した時刻 ns
+		self._lit = np.ones(depth,dtype=bool)               # 発光側が点灯していたか
+		self._emitter = emitter
+		self._lit_now = True
+		self._rows = [ self._samples[idx] for idx in range(depth) ]
+		self._out = np.zeros(num)
+		self._tmp = np.zeros(num)
+		self._count = 0 # 読み出し回数（行を書き終えてから進める）
+		# 読み出しスレッドは sleep のみで待機（空回りで制御側を妨げない）
+		self._loop = ControlLoop(self._sample,rate=rate,spin_us=0)
+
+	def __len__(self):
+		return self._samples.shape[1]
+
+	@property
+	def rate(self):
+		return self._loop.rate
+
+	@property
+	def depth(self):
+		return self._depth
+
+	@property
+	def average(self):
+		return self._average
+
+	@average.setter
+	def average(self, average):
+		if not 1 <= average <= self._depth - 1:
+			raise ValueError('average must be between 1 and {}'.format(self._depth-1))
+		self._average = average
+
+	@property
+	def emitter(self):
+		return self._emitter
+
+	@property
+	def count(self):
+		""" 読み出し回数 """
+		return self._count
+
+	@property
+	def running(self):
+		return self._loop.running
+
+	@property
+	def timestamp(self):
+		""" 最新の値を読み出した時刻 s（time.perf_counter() と同じ基準） """
+		count = self._count
+		return self._times[(count-1) % self._depth]*1e-9 if count else float('nan')
+
+	@property
+	def age(self):
+		""" 最新の値を読み出してからの経過時間 s """
+		return perf_counter_ns()*1e-9 - self.timestamp
+
+	@property
+	def loop(self):
+		""" 読み出しループ（統計量は loop.stats()） """
+		return self._loop
+
+	def _sample(self):
+		""" 1 回分の読み出し（読み出しスレッド） """
+		count = self._count
+		idx = count % self._depth
+		row = self._rows[idx]
+		if self._read is not None:
+			self._read(out=row)
+		else:
+			for ch in range(len(row)):
+				row[ch] = self._prs[ch].value
+		self._times[idx] = perf_counter_ns()
+		self._lit[idx] = self._lit_now
+		self._count = count + 1 # 書き終えてから公開
+		if self._emitter is not None: # 次の読み出しまでに切り替え
+			self._lit_now = not self._lit_now
+			self._emitter.value = self._lit_now
+
+	def start(self, timeout = 1.0):
+		""" 読み出しの開始（average 回分を読み出すまで待機） """
+		if self._emitter is not None:
+			self._lit_now = True
+			self._emitter.value = True
+		self._loop.start()
+		end = perf_counter_ns() + int(timeout*1e9)
+		while self._count < self._average and perf_counter_ns() < end:
+			sleep(1e-4)
+		if self._count < self._average:
+			self._loop.stop()
+			raise RuntimeError('No samples were acquired in {} s.'.format(timeout))
+
+	def stop(self):
+		""" 読み出しの停止 """
+		self._loop.stop()
+		if self._emitter is not None:
+			self._emitter.value = True
+
+	def read(self, out = None):
+		""" 最新の値（直近 average 回分の平均）
+
+			待たずに返します。まだ一度も読み出していなければ nan です。
+			emitter を与えた場合は点灯・消灯時の値が混ざるため、
+			recent() の記録をフィルタで処理して下さい。
+		"""
+		if out is None:
+			out = self._out
+		depth = self._depth
+		samples = self._samples
+		while True:
+			count = self._count
+			num = min(self._average,count)
+			if num == 0:
+				out[:] = np.nan
+				return out
+			end = count % depth
+			if num == 1:
+				np.copyto(out,self._rows[end-1])
+			elif end >= num:
+				np.add.reduce(samples[end-num:end],axis=0,out=out)
+			else: # バッファの先頭に折り返している
+				np.add.reduce(samples[end-num:],axis=0,out=out)
+				np.add.reduce(samples[:end],axis=0,out=self._tmp)
+				out += self._tmp
+			# 複写中に読み出しスレッドが追い越していなければ完了
+			if self._count - count < depth - num:
+				break
+		if num > 1:
+			out *= 1.0/num
+		return out
+
+	@property
+	def values(self):
+		return self.read()
+
+	def recent(self, out, lit = None):
+		""" 直近 len(out) 回分の値を古い順に out に複写
+
+			lit を与えると発光側が点灯していたかも複写します。
+			待たずに複写した回数（読み出し回数が足りなければ len(out) 未満）を返し、
+			out の末尾のその行数分が有効です。
+		"""
+		num = len(out)
+		depth = self._depth
+		if num > depth - 1:
+			raise ValueError('Cannot copy more than {} samples.'.format(depth-1))
+		samples = self._samples
+		flags = self._lit
+		while True:
+			count = self._count
+			valid = min(num,count)
+			end = count % depth
+			first = min(valid,end) # バッファの先頭側 [end-first, end)
+			rest = valid - first   # 折り返した末尾側 [depth-rest, depth)
+			out[num-first:] = samples[end-first:end]
+			if rest:
+				out[num-valid:num-first] = samples[depth-rest:]
+			if lit is not None:
+				lit[num-first:] = flags[end-first:end]
+				if rest:
+					lit[num-valid:num-first] = flags[depth-rest:]
+			# 複写中に読み出しスレッドが追い越していなければ完了
+			if self._count - count < depth - valid:
+				return valid
+
+	def history(self, num = None):
+		""" 直近 num 回分の読み出し時刻 s と値（古い順、複写して返す） """
+		count = self._count
+		num = min(count,self._depth - 1) if num is None else min(num,count,self._depth - 1)
+		idx = np.arange(count-num,count) % self._depth
+		return self._times[idx]*1e-9, self._samples[idx]
+
+def main():
+	""" メイン関数 """
+	from eiclab_photorefs_array import PhotoRefArray, NUM_CH
+
+	# フォトリフレクタ（複数）設定（A/D変換、バックグラウンドで読み出し）
+	sampler = PhotoRefSampler(PhotoRefArray(NUM_CH),average=8)
+	sampler.start()
+
+	# ループ処置（停止(Ctr+c)まで）
+	try:
+		while True:
+			values = sampler.read()
+			for idx, v in enumerate(values):
+				print('{}:{:4.2f} '.format(idx+1,v),end=' ')
+			print('({} samples, {:.1f} us old)'.format(sampler.count,sampler.age*1e6))
+			# 0.1秒待機
+			sleep(0.1)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		sampler.stop()
+		stats = sampler.loop.stats()
+		print('sampling rate {:.1f} Hz, overruns {}'.format(stats['rate'],stats['overruns']))
+
+if __name__ == '__main__':
+	main()
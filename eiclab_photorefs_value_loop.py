@@ -8,7 +8,10 @@
 	https://gpiozero.readthedocs.io/en/stable/index.html
 """
 import gpiozero
-from gpiozero import MCP3004, PWMLED
+from gpiozero import PWMLED
+from eiclab_photorefs_array import PhotoRefArray
+from eiclab_photorefs_sampler import PhotoRefSampler
+from eiclab_photorefs_filter import PhotoRefFilter
 from time import sleep
 
 def main():
@@ -20,17 +23,19 @@ def main():
 	
 	# 赤色LED設定(PWM)
 	red = PWMLED(PIN_LD)
-	# フォトリフレクタ（複数）設定（A/D変換）
-	photorefs = [ MCP3004(channel=idx) for idx in range(0,NUM_CH) ]
+	# フォトリフレクタ（複数）設定（A/D変換、直近 8 回分の読み出しの中央値）
+	sampler = PhotoRefSampler(PhotoRefArray(NUM_CH))
+	photorefs = PhotoRefFilter(sampler,window=8,median=True)
+	sampler.start()
 	
 	# ループ処置
 	while True:
 		# 計測値平均の初期化
 		ave = 0.0
 		# 計測データの取得
+		values = photorefs.read()
 		for idx in range(0,NUM_CH):
-			pr = photorefs[idx]
-			v = pr.value
+			v = values[idx]
 			ave += v
 			print('{}:{:4.2f} '.format(idx+1,v),end=' ')
 		print()
@@ -0,0 +1,28 @@
+# coding: UTF-8
+"""
+ライントレース制御パッケージ
+
+説明
+
+　シミュレータ（mbd_phs1, mbd_phs2）と実機（eiclab_line_follower_advanced.py,
+  eiclab_control_loop.py）で共通に使う制御器です。シミュレータで調整・
+  計測した制御器を、書き換えずにそのまま実機で動かせます。
+
+    - LFControllerBase  # 制御器の基底クラス（配列入力・配列出力）
+    - LFController      # 係数行列とバイアスによる線形の制御器
+
+  制御器は control(vec_prs, vec_mtrs) でフォトリフレクタの値の配列 (P,) から
+  モータ制御信号の配列 (2,) を計算します。step(vec_prs) は値の配列を、
+  prs2mtrs() は photorefs に設定したフォトリフレクタを読み出して
+  control() を呼び、[-1,1] に制限した出力を返します。photorefs には
+  シミュレータのフォトリフレクタアレイ（values）、実機の一括読み出し
+  （read(out)）、value を持つフォトリフレクタのリストのいずれも使えます。
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+from .base import LFControllerBase, clamped
+from .linear import LFController
+
+__all__ = [ 'LFControllerBase', 'LFController', 'clamped' ]
@@ -0,0 +1,124 @@
+# coding: UTF-8
+"""
+ライントレース制御の基底クラス
+
+説明
+
+　制御器は LFControllerBase を継承して作ります。入出力のバッファは構築時に
+  一度だけ確保し、read(out) でその場に書き込むフォトリフレクタを与えた場合は
+  1 回の呼び出しでメモリを確保しません（values や value で読み出す場合は
+  フォトリフレクタ側で値の配列や float を確保します）。実機で高いレートで
+  制御する場合にも、メモリ確保やガベージコレクションによる時間のばらつきが
+  生じにくくなります。measure_latency() で 1 回あたりの処理時間を計測し、
+  LATENCY_TARGET_US と比較できます。
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+from time import perf_counter_ns
+import numpy as np
+
+def clamped(v):
+    """ 値の制限 [-1,1] """
+    return max(-1,min(1,v))
+
+class LFControllerBase:
+    """ ライントレース制御の基底クラス
+
+        フォトリフレクタの値の入力バッファ vec_prs (P,) と
+        モータ制御信号の出力バッファ vec_mtrs (2,) を構築時に確保し、
+        step() は値の配列を、prs2mtrs() はセンサ値をバッファに読み込んで
+        control() を呼び、出力を [-1,1] にその場で制限してバッファを
+        そのまま返します（返り値は次の呼び出しで上書きされます）。
+
+        派生クラスでは control(vec_prs, vec_mtrs) で vec_mtrs に
+        その場で書き込んでください。センサ数 P は構築時の num_prs で
+        決まり、photorefs の数が P と異なる場合は ValueError になります。
+    """
+
+    # 1 回あたりの処理時間の目標 us（measure_latency() の 99% 点と比較）
+    LATENCY_TARGET_US = 50.0
+
+    def __init__(self,prs = None,num_prs = 4):
+        self._allocate(num_prs)
+        self._vec_mtrs = np.zeros(2)
+        # 出力範囲の上下限（スカラーを渡すと呼び出しごとに 0 次元配列を確保するため）
+        self._upper = np.array(1.0)
+        self._lower = np.array(-1.0)
+        self._prs = None
+        self.photorefs = prs
+
+    def _allocate(self,num_prs):
+        """ 入力バッファの確保（末尾に定数項 1 を付けた P+1 要素） """
+        self._vec_in = np.ones(num_prs+1)
+        self._vec_prs = self._vec_in[:num_prs]
+
+    def control(self,vec_prs,vec_mtrs):
+        """ フォトリフレクタの値 vec_prs からモータ制御信号 vec_mtrs を計算 """
+        raise NotImplementedError
+
+    def step(self,vec_prs):
+        """ フォトリフレクタの値の配列 (P,) からモータ制御信号 (2,) への変換 """
+        if vec_prs is not self._vec_prs:
+            np.copyto(self._vec_prs,vec_prs)
+        vec_mtrs = self._vec_mtrs
+        self.control(self._vec_prs,vec_mtrs)
+        # 出力範囲を[-1,1]にその場で制限
+        np.minimum(vec_mtrs,self._upper,out=vec_mtrs)
+        return np.maximum(vec_mtrs,self._lower,out=vec_mtrs)
+
+    def prs2mtrs(self):
+        """ フォトリフレクタからモータ制御信号への変換メソッド """
+        return self.step(self._read_photorefs())
+
+    def _read_photorefs(self):
+        """ フォトリフレクタの値の入力バッファへの読み出し """
+        vec_prs = self._vec_prs
+        prs = self._prs
+        if self._prs_read:
+            # 実機の一括読み出しは入力バッファに直接書き込む
+            prs.read(out=vec_prs)
+        elif self._prs_values:
+            # フォトリフレクタアレイは一括計算済みの値をそのまま利用
+            np.copyto(vec_prs,prs.values)
+        else:
+            for idx in range(len(vec_prs)):
+                vec_prs[idx] = prs[idx].value
+        return vec_prs
+
+    def measure_latency(self,number = 10000):
+        """ prs2mtrs() の 1 回あたりの処理時間 us の統計量
+
+            出力　{ "mean", "p50", "p99", "max": 処理時間 us,
+                    "target": LATENCY_TARGET_US,
+                    "ok": 99% 点が目標以下か }
+        """
+        durations = np.empty(number,dtype=np.int64)
+        prs2mtrs = self.prs2mtrs
+        prs2mtrs() # ウォームアップ
+        for idx in range(number):
+            t0 = perf_counter_ns()
+            prs2mtrs()
+            durations[idx] = perf_counter_ns() - t0
+        us = durations*1e-3
+        p50, p99 = np.percentile(us,[50,99])
+        return { "mean": float(us.mean()), "p50": float(p50), "p99": float(p99), \
+                 "max": float(us.max()), "target": self.LATENCY_TARGET_US, \
+                 "ok": bool(p99 <= self.LATENCY_TARGET_US) }
+
+    @property
+    def photorefs(self):
+        return self._prs
+
+    @photorefs.setter
+    def photorefs(self,prs):
+        self._prs = prs
+        # 読み出し方は設定時に一度だけ判定（呼び出しごとの hasattr() もメモリを確保する）
+        # read を持つ実機のフォトリフレクタは values を参照すると読み出すので先に判定
+        self._prs_read = hasattr(prs,'read')
+        self._prs_values = not self._prs_read and hasattr(prs,'values')
+        # 制御則（係数行列の列数など）はセンサ数を固定しているので確保し直さない
+        if prs is not None and len(prs) != len(self._vec_prs):
+            raise ValueError('{} expects {} photoreflectors, got {}'.format(
+                type(self).__name__,len(self._vec_prs),len(prs)))
@@ -0,0 +1,89 @@
+# coding: UTF-8
+"""
+ライントレース制御クラス（線形）
+
+説明
+
+　制御アルゴリズムの変更については係数 MAT_A, BIAS および control() メソッドを編集してください。
+  ここで変更した制御器は、シミュレータと実機の両方でそのまま使われます。
+
+参考資料
+
+- 三平 満司：「非ホロノミック系のフィードバック制御」計測と制御
+　1997 年 36 巻 6 号 p. 396-403
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+from .base import LFControllerBase
+import numpy as np
+
+class LFController(LFControllerBase):
+    """ ライントレース制御クラス
+
+        ライントレース制御アルゴリズムを実装する。
+
+        入力　フォトリフレクの値 [0,1]x4
+        出力　モータ制御信号 [-1,1]x2
+    """
+
+    # モーター制御の強度値を計算する係数（ここを工夫）
+    # Left <- 0 1 2 3 -> Right
+    MAT_A = ((-1.0,-0.2,0.2,1.0),
+             (1.0,0.2,-0.2,-1.0))
+    BIAS = 0.2
+
+    def __init__(self,prs = None,mat_A = None,bias = None):
+        self._mat_A = np.array(self.MAT_A if mat_A is None else mat_A,dtype=float)
+        self._bias = self.BIAS if bias is None else bias
+        # バイアスを最後の列に加えた係数行列（定数項 1 との積でバイアスを加える）
+        self._mat_Ab = np.column_stack((self._mat_A, \
+            np.broadcast_to(self._bias,(self._mat_A.shape[0],))))
+        super().__init__(prs,num_prs=self._mat_A.shape[1])
+
+    def control(self,vec_prs,vec_mtrs):
+        """ フォトリフレクタからモータ制御信号への変換
+
+            4つフォトリフレクタの応答を2つのモーター制御信号に
+            変換する制御の最も重要な部分を実装しています。
+
+            このメソッドに実装するアルゴリズムは、
+            細かい調整を除いて実機でも利用できるはずです。
+
+            実機での調整を減らすためには物理モデルの洗練化も必要です。
+            工夫の余地が多く残されています。各自で改善してください。
+
+            作成するライントレーサーは2輪車両であり非線形なシステムです。
+            PID制御のような通常のフィードバック制御で安定して制御することは難しく，
+            安定な制御のためには状態方程式から考察される時変の状態フィードバックや
+            不連続フィードバックなどが必要です。
+            現代制御（カルマンフィルタ，パーティクルフィルタ）や
+            強化学習（人工知能）など高度な技術などこの部分に実装することになります。
+
+        """
+        # モーター制御の強度値を計算（ここを工夫）
+        # 白を検出すると 0，黒を検出すると 1
+        if vec_prs is self._vec_prs:
+            # 入力バッファの後ろには定数項 1 が続いており、A x + bias を 1 回の積で計算
+            np.dot(self._mat_Ab,self._vec_in,out=vec_mtrs)
+        else:
+            np.dot(self._mat_A,vec_prs,out=vec_mtrs)
+            vec_mtrs += self._bias
+
+    def prs2mtrs_batch(self,mat_prs):
+        """ 複数台分の変換メソッド
+
+            フォトリフレクタの値 (M,P) を一括でモータ制御信号 (M,2) に
+            変換します。prs2mtrs() と同じ制御則を行列演算で計算します。
+        """
+        mat_mtrs = np.dot(mat_prs,self._mat_A.T)+self._bias
+        return np.clip(mat_mtrs,-1.0,1.0,out=mat_mtrs)
+
+    @property
+    def mat_A(self):
+        return self._mat_A
+
+    @property
+    def bias(self):
+        return self._bias
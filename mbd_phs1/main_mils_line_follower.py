@@ -37,10 +37,16 @@
 
 All rights revserved 2019-2025 (c) Shogo MURAMATSU
 """
+import os
+import sys
+
+if __name__ == '__main__':
+    # 実機と共通の制御パッケージ lfcontrol（リポジトリの最上位）の参照
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from mils_line_follower_body import LFPhysicalModel
 from transitions import Machine
 import pygame
-import sys
 import math
 
 # コースデータ画像
@@ -9,6 +9,27 @@
 
     - COURSE_IMG # コース画像
     - COURSE_RES # コース画像解像度 
+    - COURSE_MAP_RES # センサ読み出し用のコースデータの解像度
+                       （None で COURSE_RES と同じ、'native' でコース画像の画素そのまま）
+
+　物理シミュレーションのレートは描画レートとは独立に設定できます。
+
+    - FPS      # 描画レート Hz
+    - SIM_RATE # 物理シミュレーションのレート Hz 
+
+　PROFILE = True とすると、イベント処理・センサ・制御・物理モデル・描画・
+  画面更新の段階別の処理時間を画面に表示し（[p] で表示切替）、
+  終了時に PROFILE_CSV に書き出します。
+
+　走行開始後はコースに沿った道のりから、スタート・ゴールと
+  チェックポイントの通過を自動で判定して周回時間と区間時間を表示し、
+  LAPS 周を走り終えると停止します。
+
+    - LAPS        # 周回数（None で停止しない）
+    - CHECKPOINTS # チェックポイント（道のり mm、またはゲート ((x1,y1),(x2,y2)) mm）
+
+　RECORD_LOG にファイル名を指定すると走行を記録します。記録は
+  mils_line_follower_log.py で再生できます。
 
   このプログラムの実行には、以下のモジュールが必要です。
 
@@ -37,16 +58,46 @@
 
 All rights revserved 2019-2025 (c) Shogo MURAMATSU
 """
+import os
+import sys
+
+if __name__ == '__main__':
+    # 実機と共通の制御パッケージ lfcontrol（リポジトリの最上位）の参照
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from mils_line_follower_body import LFPhysicalModel
+from mils_line_follower_course import LFCourse, unwrap_progress
+from mils_line_follower_prof import LFStageProfiler
+from mils_line_follower_log import LFRecorder
+from mils_line_follower_lap import LFLapTimer
 from transitions import Machine
+import numpy as np
 import pygame
-import sys
 import math
 
 # コースデータ画像
 #COURSE_IMG = '../images/lfcourse.png'
 COURSE_IMG = '../images/course2025.png'
 COURSE_RES = 2.5 # 解像度
+COURSE_MAP_RES = None # センサ読み出し用の解像度（例 0.5 mm/pixel）
+
+# 描画レートと物理シミュレーションのレート（互いに独立）
+FPS = 20 # Hz
+SIM_RATE = 20 # Hz
+
+# 処理時間計測（True で段階別の処理時間を表示し、終了時に CSV 出力）
+PROFILE = False
+PROFILE_CSV = 'mils_profile.csv'
+
+# 周回数とチェックポイント（道のり mm、またはゲート ((x1,y1),(x2,y2)) mm）
+LAPS = 1
+CHECKPOINTS = ()
+
+# ヘッドレス実行で打ち切るまでにコースアウト（横ずれが OFFTRACK_MM 超）が続く時間 s
+OFFTRACK_TIMEOUT = 1.0
+
+# 走行記録（ファイル名を指定すると 1 ステップごとに .npy ファイルへ記録）
+RECORD_LOG = None # 例 'mils_run.npy'
 
 # 色の定義
 BLUE   = (  0, 0, 255 )
@@ -64,56 +115,108 @@ def main():
 
     """
     # コースデータの読み込み
-    course = LFCourse(COURSE_IMG,res=COURSE_RES)
+    course = LFCourse(COURSE_IMG,res=COURSE_RES,map_res=COURSE_MAP_RES)
 
     # 車体のインスタンス生成
     lf = LFPhysicalModel(course)
+    if RECORD_LOG:
+        lf.recorder = LFRecorder(RECORD_LOG,len(lf.photorefs))
 
     # MILSオブジェクトのインスタンス生成
-    mils = LFModelInTheLoopSimulation(lf)
+    profiler = LFStageProfiler() if PROFILE else None
+    mils = LFModelInTheLoopSimulation(lf,fps=FPS,rate=SIM_RATE, \
+        profiler=profiler,profile_csv=PROFILE_CSV,laps=LAPS,checkpoints=CHECKPOINTS)
 
     # シミュレーションの実行
     mils.run()
 
-class LFCourse:
-    """ コースデータ 
-    
-        ライントレース用のコースデータを保持する。
+class LFFixedStepClock:
+    """ 固定ステップ時計
 
-        res [mm/pixel]
+        物理シミュレーションを描画とは独立した一定のレート rate [Hz] で
+        進めるための時計です。描画 1 フレームごとに実時間の経過 dt を
+        advance() に与えると、その間に実行すべき物理ステップ数を返します。
+        シミュレーション時間はステップ数だけで決まるため、描画の負荷が
+        変わっても物理計算の結果は変わりません。
 
+        1 フレームあたりのステップ数は max_steps で打ち切り、
+        描画が間に合わないときは実時間より遅れて進みます。
     """
-    def __init__(self,filename,res=1.25):
-        self._filename = filename
-        self._width  = 640
-        self._height = 360
-        self._res = res
-        image = pygame.image.load(self._filename)
-        self._image = pygame.transform.scale(image,(640,360))
-
-    @property
-    def width(self):
-        return self._width
-
-    @property
-    def height(self):
-        return self._height
+    def __init__(self, rate, max_steps):
+        self._rate = rate
+        self._max_steps = max_steps
+        self.reset()
 
     @property
-    def resolution(self):
-        return self._res
+    def rate(self):
+        return self._rate
 
     @property
-    def realwidth(self):
-        return self._width*self._res
+    def steps(self):
+        return self._steps
 
     @property
-    def realheight(self):
-        return self._height*self._res
+    def time(self):
+        return self._steps/self._rate
 
-    @property
-    def image(self):
-        return self._image
+    def reset(self):
+        self._steps = 0
+        self._acc = 0.0
+
+    def advance(self, dt):
+        """ 実時間 dt [s] の経過に対応する物理ステップ数 """
+        self._acc += dt*self._rate
+        nsteps = int(self._acc)
+        if nsteps > self._max_steps: # 遅れは切り捨て
+            nsteps = self._max_steps
+            self._acc = 0.0
+        else:
+            self._acc -= nsteps
+        self._steps += nsteps
+        return nsteps
+
+class LFDirtyRectRenderer:
+    """ 差分描画クラス
+
+        前のフレームで描画した矩形の部分だけ背景を描き直し、
+        画面更新も前のフレームと今のフレームで描画した矩形に限ります。
+        コース全体の転送と全画面の更新を毎フレーム行わずに済みます。
+
+        invalidate() を呼ぶと次のフレームは全画面を描き直します。
+    """
+    def __init__(self, screen, background):
+        self._screen = screen
+        self._background = background
+        self._bounds = screen.get_rect()
+        self._prev = [] # 前のフレームで描画した矩形
+        self._curr = [] # 今のフレームで描画した矩形
+        self._full = True
+
+    def invalidate(self):
+        """ 次のフレームで全画面を描き直す """
+        self._full = True
+
+    def restore(self):
+        """ 前のフレームで描画した部分の背景を復元 """
+        if self._full:
+            self._screen.blit(self._background,(0,0))
+        else:
+            for rect in self._prev:
+                self._screen.blit(self._background,rect,rect)
+
+    def add(self, rect):
+        """ 今のフレームで描画した矩形の登録 """
+        if rect is not None:
+            self._curr.append(rect.clip(self._bounds))
+
+    def update(self):
+        """ 画面更新 """
+        if self._full:
+            pygame.display.update()
+            self._full = False
+        else:
+            pygame.display.update(self._prev+self._curr)
+        self._prev, self._curr = self._curr, []
 
 class LFModelInTheLoopSimulation(object):
     """ ライントレースMILSクラス 
@@ -154,17 +257,40 @@ class LFModelInTheLoopSimulation(object):
         {'trigger': 'quit',        'source': 'srun',    'dest': 'squit',   'after': 'close'  }
     )
 
-    def __init__(self, linefollower, fps = 20):
+    def __init__(self, linefollower, fps = 20, headless = False, rate = None, \
+            profiler = None, profile_csv = None, laps = None, checkpoints = (), \
+            pose = None):
+
+        self._fps = fps # 描画レート
+        self._rate = fps if rate is None else rate # 物理シミュレーションのレート
+        self._headless = headless
+        self._simclock = LFFixedStepClock(self._rate, \
+            max(1,int(4*self._rate/self._fps)))
 
-        self._clock = pygame.time.Clock()
-        self._fps = fps
+        # 処理時間計測（オプション）
+        self._profiler = profiler
+        self._profile_csv = profile_csv
+        self._overlay = profiler is not None
 
         # スクリーン設定
         self._linefollower = linefollower
         self._course = self._linefollower.course
         self._width  = self._course.width
         self._height = self._course.height
-        self._screen = pygame.display.set_mode((self._width,self._height))
+
+        # 周回・区間計測
+        self._laps = laps
+        self._checkpoints = checkpoints
+        self._laptimer = LFLapTimer(self._course,laps=laps,checkpoints=checkpoints)
+
+        # 初期姿勢 (x mm, y mm, angle rad)（None のときはマウスで設定）
+        self._pose = pose
+        if self._headless: # ヘッドレス実行では画面もクロックも使わない
+            self._clock = None
+            self._screen = None
+        else:
+            self._clock = pygame.time.Clock()
+            self._screen = pygame.display.set_mode((self._width,self._height))
 
         # 状態遷移機械(SFM)の設定
         self._sfm = Machine(\
@@ -183,15 +309,24 @@ class LFModelInTheLoopSimulation(object):
         pygame.display.set_caption('ライントレース・シミュレーター')
         font40 = pygame.font.Font(None, 40)
         font20 = pygame.font.Font(None, 20)        
-        elapsedtime = 0 # 経過時間をリセット
+        frametime = 0.0 # 前フレームからの実時間
+        prof = self._profiler
+        renderer = LFDirtyRectRenderer(self._screen,self._course.image)
 
         while True:
+            if prof: prof.begin_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     self.quit()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_p:
+                    self._overlay = not self._overlay # [p] 処理時間表示の切替
+                if event.type == pygame.VIDEOEXPOSE:
+                    renderer.invalidate() # ウィンドウの再表示
+            if prof: prof.mark('event')
 
-            # 背景描画
-            self._screen.blit(self._course.image,[0, 0])
+            # 背景描画（前フレームで描画した部分のみ）
+            renderer.restore()
+            if prof: prof.mark('draw')
 
             # 位置設定
             mouseX, mouseY = pygame.mouse.get_pos()
@@ -203,8 +338,16 @@ class LFModelInTheLoopSimulation(object):
             if self.state == 'sinit': 
                 #msg = 'Initializing　...'
                 # 初期化設定
-                self._linefollower.set_position_mm(60,60) # mm
-                self.initialized()
+                if self._pose is None:
+                    self._linefollower.set_position_mm(*self._course.start[:2]) # mm
+                    self.initialized()
+                else: # 初期姿勢の指定があれば位置・角度設定を省略
+                    x_mm, y_mm, angle = self._pose
+                    self._linefollower.set_position_mm(x_mm,y_mm)
+                    self._linefollower.rotate(angle)
+                    self.initialized()
+                    self.located()
+                    self.rotated()
 
             #msg = '' # font20.render('', True, BLUE) 
             if self.state == 'slocate': 
@@ -240,7 +383,8 @@ class LFModelInTheLoopSimulation(object):
 
             if self.state == 'swait':
                 msg = 'Please click to run the car.'                                
-                elapsedtime = 0 # 経過時間をリセット
+                self._simclock.reset() # 経過時間をリセット
+                self._laptimer.reset()
                 if mBtn1 == 1:
                     if not self._flag_drag:
                         self._flag_drag = True
@@ -253,8 +397,14 @@ class LFModelInTheLoopSimulation(object):
                 if mBtn1 == 1:
                     self.stop()
                 else:
-                    self._linefollower.drive(self._fps)
-                    elapsedtime += 1/self._fps # 経過時間を更新
+                    # 実時間の経過分だけ固定ステップで物理計算
+                    if prof: prof.mark('event')
+                    for _ in range(self._simclock.advance(frametime)):
+                        self._linefollower.drive(self._rate,profiler=prof)
+                        self._laptimer.update(self._simclock.time, \
+                            *self._linefollower.get_position_mm())
+                    if self._laptimer.finished: # 規定の周回数を走り終えたら停止
+                        self.stop()
 
             # キーボード入力
             if key[pygame.K_ESCAPE] == 1: # [ESP] ストップ
@@ -263,21 +413,140 @@ class LFModelInTheLoopSimulation(object):
                 self.start()                                                                
             if key[pygame.K_q] == 1: # [q] 終了
                 self.quit()                                                                                                
+            if prof: prof.mark('event')
 
             # 画面描画
-            self._linefollower.draw_body(self._screen)
+            renderer.add(self._linefollower.draw_body(self._screen))
             sur = font20.render(msg, True, BLUE)            
-            self._screen.blit(sur,[10,self._height-20])
+            renderer.add(self._screen.blit(sur,[10,self._height-20]))
+            elapsedtime = self._simclock.time # 経過時間
             smin = int(elapsedtime/60)%60
             ssec = int(elapsedtime)%60
             smsc = int(100*elapsedtime)%100
             stime = '{:02d}\'{:02d}\"{:02d}'.format(smin,ssec,smsc)
             surtime = font40.render(stime, True, GREEN)          
-            self._screen.blit(surtime,[self._width-120,self._height-30])
-            pygame.display.update()
+            renderer.add(self._screen.blit(surtime,[self._width-120,self._height-30]))
+            slaps = self._lap_text()
+            if slaps:
+                surlaps = font20.render(slaps, True, BLUE)
+                renderer.add(self._screen.blit(surlaps, \
+                    [self._width-surlaps.get_width()-10,self._height-50]))
+            if prof and self._overlay:
+                renderer.add(prof.draw_overlay(self._screen,font20,1/self._fps))
+            if prof: prof.mark('draw')
+            renderer.update()
+            if prof: prof.mark('display')
 
             # クロック
-            self._clock.tick(self._fps)
+            frametime = self._clock.tick(self._fps)/1000.0
+            if prof:
+                prof.mark('wait')
+                prof.end_frame()
+
+    def _lap_text(self):
+        """ 周回数・直前の周回時間・区間時間の表示文字列 """
+        timer = self._laptimer
+        if not timer.started:
+            return ''
+        completed = int(timer.completed[0])
+        laptimes = timer.laptimes()
+        text = 'Lap {}'.format(completed)
+        if self._laps:
+            text += '/{}'.format(self._laps)
+        if len(laptimes) > 0:
+            text += '  last {:.2f}s  best {:.2f}s'.format(laptimes[-1],laptimes.min())
+        splits = timer.splits()
+        row = splits[min(completed,len(splits)-1)]
+        if len(row) > 1 and np.isfinite(row[0]):
+            text += '  splits ' + ' '.join([ '{:.2f}'.format(v) for v in row if np.isfinite(v) ])
+        return text
+
+    def run_headless(self, x_mm, y_mm, angle, duration = 60.0, laps = None, \
+            checkpoints = None, offtrack_timeout = OFFTRACK_TIMEOUT):
+        """ ヘッドレス実行
+
+            画面描画・イベント処理・クロック待ちを一切行わず、
+            指定した初期姿勢 (x_mm, y_mm, angle) から最大 duration 秒
+            （シミュレーション時間）の走行を物理シミュレーションのレート
+            rate の固定ステップで、計算機の速度で実行します。
+            車体の中心がコース画像の外に出た時点、またはコースアウト
+            （course.offtrack()、中心線からの横ずれが OFFTRACK_MM 超）が
+            offtrack_timeout 秒続いてラインを見失った時点で走行を打ち切り、
+            courseout とします（交差部などで一時的に離れて戻る場合は続行）。
+            laps を与えると laps 周を走り終えた時点でも打ち切ります
+            （None でコンストラクタの laps、checkpoints も同様）。
+
+            走行後に軌跡の全姿勢について、コースの前処理で求めた場を
+            1 回参照して、各ステップの中心線からの横ずれと
+            コースに沿った道のり（周回ごとに折り返さない値）を求めます。
+
+            出力　{ "laptime": 走行時間 s,
+                    "courseout": コース外に出たかラインを見失ったか否か,
+                    "trajectory": 軌跡 [[t, x_mm, y_mm, angle], ...],
+                    "lateral_mm": 中心線からの横ずれ mm（コース外は nan）,
+                    "progress_mm": コースに沿った道のり mm,
+                    "laps": 走り終えた周回数,
+                    "laptimes": 周回ごとの時間 s のリスト,
+                    "splits": 周回ごとの区間時間 s のリスト,
+                    "finished": 規定の周回数を走り終えたか否か }
+        """
+        lf = self._linefollower
+        course = self._course
+        realwidth = self._course.realwidth
+        realheight = self._course.realheight
+
+        # 初期姿勢の設定
+        lf.reset()
+        lf.set_position_mm(x_mm,y_mm)
+        lf.rotate(angle)
+
+        # 周回・区間計測
+        if laps is None:
+            laps = self._laps
+        if checkpoints is None:
+            checkpoints = self._checkpoints
+        timer = LFLapTimer(self._course,laps=laps,checkpoints=checkpoints)
+        timer.update(0.0,x_mm,y_mm)
+
+        # 軌跡バッファ（事前確保）
+        nsteps = int(duration*self._rate+0.5)
+        trajectory = np.empty((nsteps+1,4))
+        trajectory[0] = (0.0, x_mm, y_mm, angle)
+
+        # 走行
+        courseout = False
+        lost_steps = 0
+        max_lost_steps = max(1,int(offtrack_timeout*self._rate+0.5))
+        step = 0
+        while step < nsteps:
+            lf.drive(self._rate)
+            step += 1
+            x_mm, y_mm = lf.get_position_mm()
+            trajectory[step] = (step/self._rate, x_mm, y_mm, lf.angle)
+            if not (0 <= x_mm < realwidth and 0 <= y_mm < realheight):
+                courseout = True
+                break
+            lost_steps = lost_steps + 1 if course.offtrack(x_mm,y_mm) else 0
+            if lost_steps >= max_lost_steps:
+                courseout = True
+                break
+            timer.update(step/self._rate,x_mm,y_mm)
+            if timer.finished:
+                break
+
+        # 横ずれと道のり
+        trajectory = trajectory[:step+1]
+        lateral, progress, _ = course.locate(trajectory[:,1],trajectory[:,2])
+
+        return { "laptime": step/self._rate, \
+                 "courseout": courseout, \
+                 "trajectory": trajectory, \
+                 "lateral_mm": lateral, \
+                 "progress_mm": unwrap_progress(progress,course.length), \
+                 "laps": int(timer.completed[0]), \
+                 "laptimes": timer.laptimes().tolist(), \
+                 "splits": timer.splits().tolist(), \
+                 "finished": timer.finished }
 
     def lflag_false(self):
         self._flag_drag = False
@@ -289,6 +558,10 @@ class LFModelInTheLoopSimulation(object):
         self._linefollower.reset()
 
     def close(self):
+        if self._profiler and self._profile_csv:
+            self._profiler.save_csv(self._profile_csv)
+        if self._linefollower.recorder is not None:
+            self._linefollower.recorder.close()
         pygame.quit()
         sys.exit()
 
@@ -8,10 +8,14 @@
 　物理モデルの変更については以下のパラメータおよび mtrs2twist() メソッドを編集してください。
   
   - LF_MOUNT_POS_PRF # フォトリフレクタの配置
+  - LF_FOOTPRINT_PRF # フォトリフレクタの読み取り範囲の半径 mm
   - LF_WEIGHT        # 車体の重さ g
   - SHAFT_LENGTH     # シャフト長 mm (１本あたり)
   - TIRE_DIAMETER    # タイヤ直径 mm
 
+　状態方程式の係数は fold_params() メソッドで構築時に一度だけ計算し、
+  数値積分は mils_line_follower_intg.py の LFIntegrator で行います。
+
 参考資料
 
 - 三平 満司：「非ホロノミック系のフィードバック制御」計測と制御
@@ -25,10 +29,12 @@
 All rights revserved 2019-2023 (c) Shogo MURAMATSU
 """
 from mils_line_follower_ctrl import LFController
-from mils_line_follower_phrf import LFPhotoReflector
-from scipy.integrate import odeint
+from mils_line_follower_phrf import LFPhotoReflector, LFPhotoReflectorArray
+from mils_line_follower_intg import LFIntegrator
+from collections import OrderedDict
 import numpy as np
 import pygame
+import math
 
 # 車体のパラメータ
 #
@@ -44,6 +50,7 @@ import pygame
 # ((dx1,dy1), (dx2,dy2), (dx3,dy3), (dx4,dy4)) 
 #
 LF_MOUNT_POS_PRF = ((120,-60), (100,-20), (100,20), (120,60)) # mm
+LF_FOOTPRINT_PRF = None # mm 読み取り範囲の半径（None で 3x3 画素の平均）
 LF_WEIGHT = 360    # 車体の重さ g（グラム）
 SHAFT_LENGTH = 50  # シャフト長 mm （１本あたり）
 TIRE_DIAMETER = 58 # タイヤ直径 mm
@@ -70,7 +77,7 @@ PARAMS_IOTA_M = 1e-6 # kg·m^2/s モータの粘性摩擦係数（概算）
 PARAMS_IOTA_G = 0 # kg·m^2/s ギヤの粘性摩擦係数 (ギヤ比 n>>1 より近似)
 
 # フォトリフレクタ数
-NUM_PHOTOREFS = 4
+NUM_PHOTOREFS = len(LF_MOUNT_POS_PRF)
 
 # 色の定義
 WHITE  = (255, 255, 255)
@@ -87,6 +94,135 @@ def rotate_pos(pos,center,angle):
     ])
     return rotmtx.dot(pos-center) + center
 
+def fold_params(weight = LF_WEIGHT, k_p = COEF_K_P, \
+        mu_c = PARAMS_MU_C, ell_c = PARAMS_ELL_C):
+    """ 動力学モデルの係数の畳み込み
+
+        物理パラメータから状態方程式の係数を計算します。
+        weight, k_p, mu_c, ell_c には配列を与えることもでき、
+        そのときは車体ごとの係数の配列を返します。
+    """
+    # 車体重量の換算
+    mc_kg = 1e-3*weight # g -> kg
+
+    # 各種パラメータ
+    n = PARAMS_N
+    r_w = PARAMS_R_W
+    k_t = PARAMS_K_T
+    k_b = PARAMS_K_B
+    R_a = PARAMS_R_A
+    J_m = PARAMS_J_M
+    J_g = PARAMS_J_G       
+    iota_m = PARAMS_IOTA_M
+    iota_g = PARAMS_IOTA_G
+    # 
+    iota_bar_m = iota_m + k_t*k_b/R_a
+    iota_bar_g = iota_g + (n**2)*iota_bar_m
+    J_bar_g = J_g + (n**2)*J_m
+    zeta = n*k_t/R_a 
+
+    # 直線速度の係数（mu_c: 直線運動の粘性摩擦係数）
+    #
+    D_lin = iota_bar_g + (1/2)*mu_c*(r_w**2) 
+    J_lin = J_bar_g + (1/2)*mc_kg*(r_w**2)
+    T_lin = J_lin / D_lin # 時定数
+    K_lin = k_p*(zeta*r_w) / D_lin
+    N_lin = (1/2)*mc_kg*(r_w**2)
+
+    # 回転速度の係数
+    iota_c = PARAMS_IOTA_C # 回転運動の粘性摩擦係数
+    l_c = ell_c # 車体の重心から車輪間の中心までの距離
+    L_c = PARAMS_L_C
+    J_c = PARAMS_J_C
+    r_c = (2*r_w/L_c)
+    #
+    D_rot = iota_bar_g + (1/2)*(mu_c*(l_c**2)+iota_c )*(r_c**2)
+    J_rot = J_bar_g + (1/2)*(J_c + mc_kg*(l_c**2))*(r_c**2)
+    T_rot = J_rot / D_rot # 時定数
+    K_rot = k_p*(zeta*r_c) / D_rot
+    N_rot = (1/2)*mc_kg*(r_c**2)
+
+    # dv/dt = ( -v + c_lin*w*w + K_lin*u_lin ) / T_lin
+    # dw/dt = ( -w - c_rot*v*w + K_rot*u_rot ) / T_rot
+    return { "T_lin": T_lin, "K_lin": K_lin, "c_lin": l_c*(N_lin/D_lin), \
+             "T_rot": T_rot, "K_rot": K_rot, "c_rot": l_c*(N_rot/D_rot) }
+
+class LFCarSprite:
+    """ 車体のスプライトクラス
+
+        車体とタイヤを一度だけ画像に描画しておき、向きを angle_steps 段階に
+        量子化して回転した画像を最大 maxsize 枚まで保持します（LRU）。
+        車体の描画は回転済み画像の転送 1 回とフォトリフレクタの点で済みます。
+
+        複数台を描画する場合は 1 つのインスタンスを共有してください。
+    """
+    def __init__(self, res, angle_steps = 360, maxsize = 128):
+        self._res = res # mm/pixel
+        self._angle_steps = angle_steps
+        self._maxsize = maxsize
+        self._base = None
+        self._cache = OrderedDict()
+
+    @property
+    def resolution(self):
+        return self._res
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        self._cache.clear()
+
+    def image(self, angle):
+        """ 向き angle rad の車体画像（シャフト中心が画像の中心） """
+        key = int(round(angle*self._angle_steps/(2*math.pi))) % self._angle_steps
+        surface = self._cache.get(key)
+        if surface is not None:
+            self._cache.move_to_end(key)
+            return surface
+        if self._base is None:
+            self._base = self._render()
+        degree = -360.0*key/self._angle_steps # 画面は y 軸が下向き
+        surface = pygame.transform.rotate(self._base,degree)
+        self._cache[key] = surface
+        if len(self._cache) > self._maxsize:
+            self._cache.popitem(last=False)
+        return surface
+
+    def blit(self, screen, center_px, angle):
+        """ 車体画像の転送（転送した領域の矩形 pygame.Rect を返す） """
+        surface = self.image(angle)
+        rect = surface.get_rect(center=(int(center_px[0]+.5),int(center_px[1]+.5)))
+        return screen.blit(surface,rect)
+
+    def _render(self):
+        """ 向き 0 の車体画像の描画 """
+        res = self._res
+        # 車体・タイヤの範囲（シャフト中心からの距離 mm）
+        front = 0.7*SHAFT_LENGTH + 60
+        rear = max(0.7*SHAFT_LENGTH,TIRE_DIAMETER/2+6)
+        side = SHAFT_LENGTH + 6
+        hx = int(math.ceil(max(front,rear)/res)) + 2
+        hy = int(math.ceil(side/res)) + 2
+        surface = pygame.Surface((2*hx,2*hy),pygame.SRCALPHA)
+        center = np.asarray([hx,hy])
+
+        # 車体
+        pos00 = center + np.asarray([-0.7*SHAFT_LENGTH,-0.7*SHAFT_LENGTH])/res
+        size = np.asarray([1.4*SHAFT_LENGTH+60,1.4*SHAFT_LENGTH])/res
+        pygame.draw.rect(surface,YELLOW,(*pos00.tolist(),*size.tolist()),0)
+
+        # タイヤ
+        for dy in (-SHAFT_LENGTH,SHAFT_LENGTH):
+            pos_tf = (center + np.asarray([TIRE_DIAMETER/2,dy])/res + .5).astype(np.int32).tolist()
+            pos_tr = (center + np.asarray([-TIRE_DIAMETER/2,dy])/res + .5).astype(np.int32).tolist()
+            pygame.draw.line(surface,BLACK,pos_tf,pos_tr,int(12/res))
+            pygame.draw.circle(surface,BLACK,pos_tf,int(6/res))
+            pygame.draw.circle(surface,BLACK,pos_tr,int(6/res))
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        return surface
+
 class LFPhysicalModel:
     """ ライントレーサ物理モデルクラス 
         
@@ -96,32 +232,58 @@ class LFPhysicalModel:
         左右の和を前後運動、左右の差を回転運動に換算しています。
 
         入力　モータ制御信号 [-1,1]x2        
-        出力　フォトリフレクタの値 [0,1]x4 
+        出力　フォトリフレクタの値 [0,1]xN（N: LF_MOUNT_POS_PRF の個数）
     """    
     
     def __init__(self, course, \
             weight = LF_WEIGHT, \
-            mntposprs = LF_MOUNT_POS_PRF):
+            mntposprs = LF_MOUNT_POS_PRF, \
+            dynamics = 'exp', \
+            kinematics = 'arc', \
+            substeps = None, \
+            k_p = COEF_K_P, \
+            mu_c = PARAMS_MU_C, \
+            ell_c = PARAMS_ELL_C, \
+            controller = None, \
+            sprite = None, \
+            footprint = LF_FOOTPRINT_PRF):
 
         # プロパティの設定
         self._course = course
         self._weight = weight # g 
         self._mntposprs = mntposprs
+        self._k_p = k_p
+        self._mu_c = mu_c
+        self._ell_c = ell_c
         self._x_mm = SHAFT_LENGTH + 10 # mm
         self._y_mm = SHAFT_LENGTH + 10 # mm
         self._angle_rad = 0.0 # rad
+        self._recorder = None
 
         # 初期化
         self.reset()
 
+        # 数値積分器（係数は構築時に一度だけ計算）
+        self._integrator = LFIntegrator(self.fold_params(), \
+            dynamics=dynamics, kinematics=kinematics, substeps=substeps)
+
         # 制御機とフォトリフレクタ設定
-        self._controller = LFController()
-        self._prs = [ LFPhotoReflector(self._course) \
-            for idx in range(NUM_PHOTOREFS)]
-        for idx in range(NUM_PHOTOREFS):
-            self._prs[idx].value = 0.0
+        self._controller = LFController() if controller is None else controller
+        self._prs = LFPhotoReflectorArray(self._course,self._mntposprs, \
+            footprint=footprint)
         self._controller.photorefs = self._prs
 
+        # 車体のスプライト（複数台で共有可）
+        self._sprite = LFCarSprite(course.resolution) if sprite is None else sprite
+
+    def fold_params(self):
+        """ 動力学モデルの係数の畳み込み
+
+            構築時に一度だけ呼び出し、LFIntegrator に渡します。
+        """
+        return fold_params(weight=self._weight,k_p=self._k_p, \
+            mu_c=self._mu_c,ell_c=self._ell_c)
+
     def mtrs2twist(self,mtrs,v0,w0,fps):
         """ モータ制御信号→速度変換
             h = 1/fps 間隔で制御信号をゼロ次ホールドすると仮定
@@ -135,81 +297,36 @@ class LFPhysicalModel:
         u_lin = (u_r + u_l)/2.0 # 直線運動
         u_rot = (u_r - u_l)/2.0 # 回転運動
 
-        # 速度・角速度計算（微分方程式の数値解）
-        t = np.linspace(0,h,2)
-        y0 = [ 0.0 for idx in range(2) ]
-        y0[0] = v0
-        y0[1] = w0
-        y1 = odeint(self._odedydt,y0,t,args=(u_lin,u_rot))
-        v1 = y1[-1][0]
-        w1 = y1[-1][1]
+        # 速度・角速度計算（動力学モデルの数値解）
+        v1, w1 = self._integrator.step_dynamics(v0,w0,u_lin,u_rot,h)
 
         # 出力
         twist = { "linear":{"x":v1, "y":0., "z":0.}, "angular":{"x":0., "y":0., "z":w1} }
         return twist
 
-    def _odedydt(self,y,t,u_lin,u_rot):
-        """ 動力学(Dynamic)モデルの状態方程式 """
-        v = y[0]
-        w = y[1]
-
-        # 車体重量の換算
-        mc_kg = 1e-3*self._weight # g -> kg
-
-        # 各種パラメータ
-        n = PARAMS_N
-        r_w = PARAMS_R_W
-        k_t = PARAMS_K_T
-        k_b = PARAMS_K_B
-        R_a = PARAMS_R_A
-        J_m = PARAMS_J_M
-        J_g = PARAMS_J_G       
-        iota_m = PARAMS_IOTA_M
-        iota_g = PARAMS_IOTA_G
-        # 
-        iota_bar_m = iota_m + k_t*k_b/R_a
-        iota_bar_g = iota_g + (n**2)*iota_bar_m
-        J_bar_g = J_g + (n**2)*J_m
-        zeta = n*k_t/R_a 
-
-        # 直線速度の計算
-        mu_c = PARAMS_MU_C  # 直線運動の粘性摩擦係数
-        #
-        D_lin = iota_bar_g + (1/2)*mu_c*(r_w**2) 
-        J_lin = J_bar_g + (1/2)*mc_kg*(r_w**2)
-        T_lin = J_lin / D_lin # 時定数
-        K_lin = COEF_K_P*(zeta*r_w) / D_lin
-        N_lin = (1/2)*mc_kg*(r_w**2)
-
-        # 回転速度の計算
-        iota_c = PARAMS_IOTA_C # 回転運動の粘性摩擦係数
-        l_c = PARAMS_ELL_C
-        L_c = PARAMS_L_C
-        J_c = PARAMS_J_C
-        r_c = (2*r_w/L_c)
-        #
-        D_rot = iota_bar_g + (1/2)*(mu_c*(l_c**2)+iota_c )*(r_c**2)
-        J_rot = J_bar_g + (1/2)*(J_c + mc_kg*(l_c**2))*(r_c**2)
-        T_rot = J_rot / D_rot # 時定数
-        K_rot = COEF_K_P*(zeta*r_c) / D_rot
-        N_rot = (1/2)*mc_kg*(r_c**2)
-
-        # dy/dt = f(y,t,v,w)
-        dydt0 = (1/T_lin) * ( -l_c*(N_lin/D_lin)*(-w*w) - v + K_lin*u_lin )
-        dydt1 = (1/T_rot) * ( -l_c*(N_rot/D_rot)*( v*w) - w + K_rot*u_rot )
-
-        return [ dydt0, dydt1 ]
+    def drive(self,fps,profiler=None):
+        """ 車体駆動メソッド
 
-    def drive(self,fps):
-        """ 車体駆動メソッド"""
+            profiler (LFStageProfiler) を与えると段階別の処理時間を記録
+        """
         # センサ値更新 
         self._sense()
+        if profiler: profiler.mark('sense')
         
         # モーター制御信号取得
         mtrs = np.asarray(self._controller.prs2mtrs())
+        if profiler: profiler.mark('control')
 
         # 車体状態更新
         self.updatestate(mtrs,fps)        
+        if profiler: profiler.mark('dynamics')
+
+        # 走行記録
+        self._time_s += 1/fps
+        if self._recorder is not None:
+            self._recorder.append(self._time_s,self._x_mm,self._y_mm, \
+                self._angle_rad,self._v_mm_s,self._w_rad_s, \
+                self._prs.values,mtrs)
          
     def updatestate(self,mtrs,fps):
         """ 車体駆動メソッド （2020）"""
@@ -221,29 +338,17 @@ class LFPhysicalModel:
         v1_m_s = twist["linear"]["x"]    # 現時刻直線速度 m/s
         w1_rad_s = twist["angular"]["z"] # 現時刻角速度  rad/s
 
-        # 位置・角度情報更新（微分方程式の数値解）
-        t = np.linspace(0,1/fps,2)
-        pos = [ 0.0 for idx in range(3) ]
-        pos[0] = 1e-3*self._x_mm # m
-        pos[1] = 1e-3*self._y_mm # m
-        pos[2] = self._angle_rad # rad
-        p = odeint(self._odefun,pos,t,args=(v1_m_s,w1_rad_s))
-        pos = p[-1]
+        # 位置・角度情報更新（運動モデルの数値解）
+        x1_m, y1_m, angle1_rad = self._integrator.step_kinematics( \
+            1e-3*self._x_mm, 1e-3*self._y_mm, self._angle_rad, \
+            v1_m_s, w1_rad_s, 1/fps)
 
         # 状態更新 
         self._v_mm_s = 1e3*v1_m_s # m/s -> mm/s
-        self._rad_s = w1_rad_s
-        self._x_mm = 1e3*pos[0] # m -> mm 
-        self._y_mm = 1e3*pos[1] # m -> mm
-        self._angle_rad = pos[2]
-
-    def _odefun(self,pos,t,v,w):
-        """ 運動(Kinematic)モデルの状態方程式 """
-        # d_ (  x ) = ( cosθ )v + ( 0 )ω
-        # dt (  y )   ( sinθ )    ( 0 )
-        #    (  θ )   (  0   )    ( 1 )
-        phi = pos[2]
-        return [ np.cos(phi)*v, np.sin(phi)*v, w ]
+        self._w_rad_s = w1_rad_s
+        self._x_mm = 1e3*x1_m # m -> mm 
+        self._y_mm = 1e3*y1_m # m -> mm
+        self._angle_rad = angle1_rad
 
     @property
     def course(self):
@@ -253,14 +358,35 @@ class LFPhysicalModel:
     def angle(self):
         return self._angle_rad
 
+    @property
+    def photorefs(self):
+        return self._prs
+
+    @property
+    def sprite(self):
+        return self._sprite
+
+    @property
+    def recorder(self):
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self,recorder):
+        """ 走行記録（LFRecorder）の設定，None で記録しない """
+        self._recorder = recorder
+
     def reset(self):
         self._v_mm_s = 0.0 # mm/s
         self._w_rad_s = 0.0 # rad/s
+        self._time_s = 0.0 # s
 
     def set_position_mm(self,x,y):
         self._x_mm = x # mm
         self._y_mm = y # mm
 
+    def get_position_mm(self):
+        return [self._x_mm,self._y_mm]
+
     def move_px(self,dx_px,dy_px):
         res = self._course.resolution # mm/pixel        
         self._x_mm = self._x_mm + dx_px*res # mm
@@ -273,58 +399,24 @@ class LFPhysicalModel:
         self._interval = interval
 
     def draw_body(self,screen):
-        rect = np.asarray(self.get_rect_px())
-        center = np.asarray(self.get_center_px())
-
-        # 車体の描画
-        apos00 = np.dot([[1,0,0,0],[0,1,0,0]],rect)
-        apos10 = np.dot([[1,0,0,0],[0,1,0,1]],rect)
-        apos01 = np.dot([[1,0,1,0],[0,1,0,0]],rect)
-        apos11 = np.dot([[1,0,1,0],[0,1,0,1]],rect)
-        # 
-        angle = self._angle_rad
-        apos00 = rotate_pos(apos00,center,angle)
-        apos10 = rotate_pos(apos10,center,angle)
-        apos01 = rotate_pos(apos01,center,angle)
-        apos11 = rotate_pos(apos11,center,angle)
-        #
-        pos00 = apos00.tolist()
-        pos10 = apos10.tolist()
-        pos01 = apos01.tolist()
-        pos11 = apos11.tolist()
-        #
-        pygame.draw.polygon(screen, YELLOW, [pos00,pos01,pos11,pos10],0)
-
-        # 解像度の読み込み
-        res = self._course.resolution # mm/pixel
+        """ 車体の描画（描画した領域の矩形 pygame.Rect を返す）
 
-        # 左タイヤの描画
-        pos_ltf = center + np.asarray([TIRE_DIAMETER/2,-SHAFT_LENGTH])/res
-        pos_ltr = center + np.asarray([-TIRE_DIAMETER/2,-SHAFT_LENGTH])/res
-        pos_ltf = (rotate_pos(pos_ltf,center,angle)+.5).astype(np.int32).tolist()
-        pos_ltr = (rotate_pos(pos_ltr,center,angle)+.5).astype(np.int32).tolist()        
-        pygame.draw.line(screen, BLACK, pos_ltf,pos_ltr,int(12/res))
-        pygame.draw.circle(screen, BLACK, pos_ltf,int(6/res))
-        pygame.draw.circle(screen, BLACK, pos_ltr,int(6/res))
-
-        # 右タイヤ の描画     
-        pos_rtf = center + np.asarray([TIRE_DIAMETER/2,SHAFT_LENGTH])/res
-        pos_rtr = center + np.asarray([-TIRE_DIAMETER/2,SHAFT_LENGTH])/res
-        pos_rtf = (rotate_pos(pos_rtf,center,angle)+.5).astype(np.int32).tolist()
-        pos_rtr = (rotate_pos(pos_rtr,center,angle)+.5).astype(np.int32).tolist()        
-        pygame.draw.line(screen, BLACK, pos_rtf,pos_rtr,int(12/res))   
-        pygame.draw.circle(screen, BLACK, pos_rtf,int(6/res))
-        pygame.draw.circle(screen, BLACK, pos_rtr,int(6/res))        
+            車体はスプライトの転送、フォトリフレクタは値に応じた色の点で描画します。
+        """
+        center = self.get_center_px()
+        angle = self._angle_rad
+        dirty = self._sprite.blit(screen,center,angle)
 
         # フォトリフレクタ描画
-        for idx in range(NUM_PHOTOREFS):
-            pos = center + np.asarray(self._mntposprs[idx])/res
-            pos = (rotate_pos(pos,center,angle)+.5).astype(np.int32).tolist()
+        poss = (self._prs.positions(center,angle)+.5).astype(np.int32).tolist()
+        values = self._prs.values
+        for idx in range(len(self._prs)):
             if LFPhotoReflector.ACTIVE_WHITE:
-                red = (int(self._prs[idx].value*255.0), 0, 0)
+                red = (int(values[idx]*255.0), 0, 0)
             else:
-                red = (int((1.0-self._prs[idx].value)*255.0), 0, 0)
-            pygame.draw.circle(screen, red, pos, 4)
+                red = (int((1.0-values[idx])*255.0), 0, 0)
+            dirty = dirty.union(pygame.draw.circle(screen, red, poss[idx], 4))
+        return dirty
 
     def get_rect_px(self):
         # 車体の四隅の座標
@@ -350,15 +442,153 @@ class LFPhysicalModel:
         return [cx_px,cy_px]
 
     def _sense(self):
-        """ フォトリフレクタの位置情報の更新 """
+        """ フォトリフレクタの位置と値の一括更新 """
 
-        # 解像度
-        res = self._course.resolution # mm/pixel                
         # 車体の位置と向き
         center_px = self.get_center_px()
         angle = self._angle_rad
 
-        # フォトリフレクタ位置を設定
-        for idx in range(NUM_PHOTOREFS):
-            pos = center_px + np.asarray(self._mntposprs[idx])/res
-            self._prs[idx].pos_px = rotate_pos(pos,center_px,angle)
+        # フォトリフレクタの位置と値を一括計算
+        return self._prs.measure(center_px,angle)
+
+class LFPhysicalModelFleet:
+    """ ライントレーサ物理モデル（複数台一括）クラス
+
+        num 台のライントレーサの位置・向き・速度・角速度を
+        長さ num の配列で保持し、共通のコース上で一括して動かします。
+        センサ計算・制御・数値積分はいずれも配列演算で行うため、
+        台数を増やしても Python レベルの処理は増えません。
+
+        weight, k_p, mu_c, ell_c はスカラー（全車共通）または
+        長さ num の配列（台ごと）で与えます。
+        mntposprs は (P,2) で全車共通、(num,P,2) で台ごとに指定できます。
+
+        入力　モータ制御信号 [-1,1]x2 x num
+        出力　フォトリフレクタの値 [0,1]xP x num
+    """
+
+    def __init__(self, course, num, \
+            weight = LF_WEIGHT, \
+            mntposprs = LF_MOUNT_POS_PRF, \
+            k_p = COEF_K_P, \
+            mu_c = PARAMS_MU_C, \
+            ell_c = PARAMS_ELL_C, \
+            dynamics = 'exp', \
+            substeps = None, \
+            controller = None, \
+            footprint = LF_FOOTPRINT_PRF):
+        if dynamics == 'odeint':
+            raise ValueError('odeint cannot step a fleet')
+
+        # プロパティの設定
+        self._course = course
+        self._num = num
+        self._mntposprs = np.asarray(mntposprs,dtype=float)
+        self._x_mm = np.full(num,SHAFT_LENGTH + 10.0) # mm
+        self._y_mm = np.full(num,SHAFT_LENGTH + 10.0) # mm
+        self._angle_rad = np.zeros(num) # rad
+
+        # 初期化
+        self.reset()
+
+        # 数値積分器（台ごとの係数を構築時に一度だけ計算）
+        params = [ np.broadcast_to(np.asarray(p,dtype=float),(num,)) \
+            for p in (weight,k_p,mu_c,ell_c) ]
+        self._integrator = LFIntegrator(fold_params(*params), \
+            dynamics=dynamics, kinematics='arc', substeps=substeps)
+
+        # 制御機とフォトリフレクタ設定
+        self._controller = LFController() if controller is None else controller
+        self._prs = LFPhotoReflectorArray(self._course,self._mntposprs, \
+            footprint=footprint)
+        self._controller.photorefs = self._prs
+
+    @property
+    def num(self):
+        return self._num
+
+    @property
+    def course(self):
+        return self._course
+
+    @property
+    def x_mm(self):
+        return self._x_mm
+
+    @property
+    def y_mm(self):
+        return self._y_mm
+
+    @property
+    def angle(self):
+        return self._angle_rad
+
+    @property
+    def v_mm_s(self):
+        return self._v_mm_s
+
+    @property
+    def w_rad_s(self):
+        return self._w_rad_s
+
+    @property
+    def photorefs(self):
+        return self._prs
+
+    @property
+    def values(self):
+        return self._prs.values
+
+    def reset(self):
+        self._v_mm_s = np.zeros(self._num) # mm/s
+        self._w_rad_s = np.zeros(self._num) # rad/s
+
+    def set_pose_mm(self,x,y,angle):
+        """ 位置 mm と向き rad の設定（スカラーは全車共通） """
+        self._x_mm[:] = x
+        self._y_mm[:] = y
+        self._angle_rad[:] = angle
+
+    def get_center_px(self):
+        # 車体の回転の中心（シャフトの中心） (num,2)
+        res = self._course.resolution # mm/pixel
+        return np.stack((self._x_mm,self._y_mm),axis=1)/res
+
+    def drive(self,fps):
+        """ 車体駆動メソッド（全車一括）"""
+        # センサ値更新
+        mat_prs = self._sense()
+
+        # モーター制御信号取得
+        mat_mtrs = self._controller.prs2mtrs_batch(mat_prs)
+
+        # 車体状態更新
+        self.updatestate(mat_mtrs,fps)
+
+    def updatestate(self,mat_mtrs,fps):
+        """ 車体状態更新メソッド（全車一括）"""
+        h = 1/fps
+
+        # モーター電圧から速度・角速度の計算
+        u_r = mat_mtrs[:,1]
+        u_l = mat_mtrs[:,0]
+        u_lin = (u_r + u_l)/2.0 # 直線運動
+        u_rot = (u_r - u_l)/2.0 # 回転運動
+        v1_m_s, w1_rad_s = self._integrator.step_dynamics( \
+            1e-3*self._v_mm_s, self._w_rad_s, u_lin, u_rot, h)
+
+        # 位置・角度情報更新
+        x1_m, y1_m, angle1_rad = self._integrator.step_kinematics( \
+            1e-3*self._x_mm, 1e-3*self._y_mm, self._angle_rad, \
+            v1_m_s, w1_rad_s, h)
+
+        # 状態更新
+        self._v_mm_s[:] = 1e3*v1_m_s # m/s -> mm/s
+        self._w_rad_s[:] = w1_rad_s
+        self._x_mm[:] = 1e3*x1_m # m -> mm
+        self._y_mm[:] = 1e3*y1_m # m -> mm
+        self._angle_rad[:] = angle1_rad
+
+    def _sense(self):
+        """ 全車のフォトリフレクタの位置と値の一括更新 """
+        return self._prs.measure(self.get_center_px(),self._angle_rad)
@@ -0,0 +1,558 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+コースデータクラス
+
+説明
+
+　コース画像の読み込み・縮小・二値化と、ラインの中心線および
+  中心線までの距離場の計算を前処理として一度だけ行い、結果を
+  キャッシュディレクトリ（既定ではコース画像と同じ場所の __lfcache__）に
+  .npy ファイルとして保存します。キャッシュは画像ファイルの内容の
+  ハッシュ値と解像度で識別し、次回以降の起動やパラメータスイープの
+  ワーカーではメモリマップで読み込むだけで済みます。
+
+　表示用の画像と、センサ読み出し用の配列（二値化したコース・中心線・
+  距離場）は別の解像度で保持できます。
+
+　ラインの中心線を走行開始位置から一周たどった経路と、コース上の
+  各画素について以下の場を前処理で求めておきます。シミュレータは
+  車体の位置から配列を 1 回参照するだけで、ラインに対する横ずれ・
+  コースに沿った進み具合・コースアウトを求められます。
+
+    - sdf      # ラインの縁までの符号付き距離 mm（ライン上で負，白地で正）
+    - lateral  # 最も近い経路上の点から見た横ずれ mm（進行方向の左が正）
+    - progress # 最も近い経路上の点までの道のり mm（走行開始位置で 0）
+
+    - res     # 表示用の画像の解像度 mm/pixel（コースの実寸は画素数 x res）
+    - map_res # センサ読み出し用の配列の解像度 mm/pixel
+                （None で res と同じ、'native' でコース画像の画素そのまま）
+
+  例えば res=2.5, map_res=0.5 とすると、表示は 640x360 のまま、
+  センサは 3200x1800 の配列から読み出します。配列はメモリマップで
+  参照するため、実際に読み出した部分だけがメモリに載ります。
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+from scipy import ndimage
+from scipy.spatial import cKDTree
+import numpy as np
+import pygame
+import warnings
+import hashlib
+import math
+import os
+
+# キャッシュの形式（前処理の内容を変えたら更新）
+CACHE_VERSION = 5
+CACHE_DIR = '__lfcache__'
+
+# キャッシュする配列
+CACHE_ARRAYS = ('rgb','binary','grayscale','centerline','distance', \
+    'sdf','lateral','progress','path')
+
+# 表示用の画像の画素数
+DISPLAY_SIZE = (640, 360)
+
+# 付属のコース画像の走行開始位置（スタートライン上の点と進行方向）
+# (x pixel, y pixel, 向き rad)、位置は DISPLAY_SIZE の画像の画素
+# 一周しないコース（2020〜2022）はラインの端から始めます
+COURSE_STARTS = {
+    'course2020.png': (54.8, 112.0, 0.0),
+    'course2021.png': (80.0, 63.2, 0.0),
+    'course2022.png': (424.0, 54.8, math.pi),
+    'course2023.png': (443.2, 52.0, 0.0),
+    'course2024.png': (424.8, 46.8, 0.0),
+    'course2025.png': (390.0, 38.0, 0.0),
+}
+
+# COURSE_STARTS にないコース画像の走行開始位置 (x mm, y mm, 向き rad)
+DEFAULT_START = (60.0, 60.0, 0.0)
+
+# 車体の中心の中心線からの横ずれがこれを超えるとコースアウト mm
+# （センサは車体の中心より前にあるため、カーブでは中心が内側にずれる）
+OFFTRACK_MM = 100.0
+
+# 1 ステップの道のりの変化としてありうる最大値 mm（交差部の判定に使用）
+MAX_PROGRESS_STEP_MM = 100.0
+
+# 道のりが飛んだ先の区間をこれだけ進んだら、その区間に移ったとみなす mm
+REANCHOR_PROGRESS_MM = 200.0
+
+def course_start(filename, res = 2.5):
+    """ コース画像の走行開始位置 (x mm, y mm, 向き rad)
+
+        res は DISPLAY_SIZE の画像の解像度 mm/pixel です。
+        COURSE_STARTS になければ DEFAULT_START を返します。
+    """
+    start = COURSE_STARTS.get(os.path.basename(filename))
+    if start is None:
+        return DEFAULT_START
+    x, y, angle = start
+    return (x*res, y*res, angle)
+
+def course_key(filename, size, map_size, map_res, start = DEFAULT_START):
+    """ コース画像の内容と画素数・解像度・走行開始位置から決まるキャッシュの識別子 """
+    digest = hashlib.sha1()
+    with open(filename,'rb') as f:
+        for block in iter(lambda: f.read(1 << 20),b''):
+            digest.update(block)
+    digest.update('{}:{}x{}:{}x{}:{!r}:{!r}'.format(CACHE_VERSION,*size,*map_size, \
+        float(map_res),tuple(float(v) for v in start)).encode())
+    return digest.hexdigest()[:16]
+
+def trace_centerline(centerline, map_res, start = DEFAULT_START, step_mm = None):
+    """ 中心線を走行開始位置から step_mm 刻みでたどった経路
+
+        start (x mm, y mm, 向き rad) に最も近い中心線上の点から、
+        向きに近い方向へ進みます。交差部では進行方向に中心線の続きが
+        あればそのまま直進し、既に通った中心線よりまだ通っていない
+        中心線を選びます（二度目に交差部を通るときに通った枝へ
+        曲がらない）。開始点に戻るか中心線が途切れると終了します。
+
+        出力　経路上の点 (K,2) [mm] と、開始点に戻ったか否か
+    """
+    if step_mm is None:
+        step_mm = max(5.0,2.0*map_res)
+    ys, xs = np.nonzero(np.asarray(centerline))
+    if len(xs) == 0:
+        return np.zeros((0,2)), False
+    pts = np.stack((xs,ys),axis=1)*float(map_res)
+    tree = cKDTree(pts)
+    _, i0 = tree.query(start[:2])
+    p0 = pts[i0]
+    p = p0
+    h = np.array([math.cos(start[2]),math.sin(start[2])])
+    path = [p0]
+    passed = np.full(len(pts),np.iinfo(np.intp).max) # 各点を最初に通った番号
+    maxlen = len(pts)*map_res + 10*step_mm # 中心線の画素数から見た道のりの上限
+    travelled, blind = 0.0, 0.0
+    closed = False
+    while travelled < maxlen:
+        near = tree.query_ball_point(p,1.5*step_mm)
+        passed[near] = np.minimum(passed[near],len(path))
+        pred = p + h*step_mm
+        idx = np.asarray(tree.query_ball_point(p,2.5*step_mm),dtype=np.intp)
+        cand = pts[idx]
+        d = cand - p
+        dn = np.hypot(d[:,0],d[:,1])
+        # 前方の，直前の数点から十分離れた候補
+        ok = (dn > 0.5*step_mm) & (d @ h > -0.3*dn)
+        for prev in path[-4:-1]:
+            ok &= np.hypot(*(cand-prev).T) > 0.9*step_mm
+        if not ok.any():
+            # 中心線の切れ目は進行方向にしばらく直進して探す
+            if blind >= 12*step_mm:
+                break
+            q = pred
+            blind += step_mm
+        else:
+            blind = 0.0
+            cosb = (d[ok] @ h)/dn[ok]
+            # 直前の 10 点より前に通った点は選びにくくする
+            old = passed[idx[ok]] < len(path) - 10
+            j = np.argmax(cosb - 2.0*old)
+            q = cand[ok][j]
+            if cosb[j] < 0.9:
+                # 交差部：進行方向の先に中心線があれば直進
+                far = pts[tree.query_ball_point(p,5*step_mm)] - p
+                fdn = np.hypot(far[:,0],far[:,1])
+                if np.any((fdn > 2.5*step_mm) & (far @ h > 0.95*fdn)):
+                    q = pred
+        ref = path[-4] if len(path) >= 4 else path[0]
+        dq = q - ref if np.any(q != ref) else q - p
+        h = dq/np.hypot(*dq)
+        travelled += np.hypot(*(q-p))
+        p = q
+        path.append(p)
+        if travelled > 4*step_mm and np.hypot(*(p-p0)) < step_mm:
+            closed = True
+            path.pop() # 開始点と重なる点は除く
+            break
+    return np.asarray(path), closed
+
+def course_path(points, closed):
+    """ 経路の平滑化と道のり・接線の向き
+
+        出力　(K+1,4) [x mm, y mm, 道のり mm, 接線の向き rad]
+              最後の行は一周したときは開始点（道のりは一周の長さ）、
+              途切れたときは終点の複製です。
+    """
+    K = len(points)
+    if K < 2:
+        return np.zeros((0,4))
+    # 5 点の移動平均で平滑化（一周したときは循環させる）
+    mode = 'wrap' if closed else 'nearest'
+    smooth = ndimage.uniform_filter1d(points,5,axis=0,mode=mode)
+    # 前後 2 点の差から接線の向き
+    if closed:
+        tangent = np.roll(smooth,-2,axis=0) - np.roll(smooth,2,axis=0)
+    else:
+        tangent = np.gradient(smooth,axis=0)
+    heading = np.arctan2(tangent[:,1],tangent[:,0])
+    nxt = np.vstack((smooth[1:],smooth[:1] if closed else smooth[-1:]))
+    seg = np.hypot(*(nxt-smooth).T)
+    s = np.concatenate(([0.0],np.cumsum(seg)))
+    path = np.empty((K+1,4))
+    path[:K,0:2] = smooth
+    path[:K,3] = heading
+    path[K] = path[0] if closed else path[K-1]
+    path[:,2] = s
+    return path
+
+def course_fields(binary, path, map_res):
+    """ 符号付き距離・横ずれ・道のりの場 [y, x] (float32)
+
+        横ずれと道のりは、各画素に最も近い経路上の点（距離変換の
+        最近傍の添字で求める）での接線方向と法線方向の成分です。
+    """
+    binary = np.asarray(binary)
+    line = ~binary
+    sdf = map_res*(ndimage.distance_transform_edt(binary) \
+        - ndimage.distance_transform_edt(line))
+    sdf = sdf.astype(np.float32)
+    K = len(path) - 1
+    if K < 1:
+        nan = np.full(binary.shape,np.nan,dtype=np.float32)
+        return sdf, nan, nan.copy()
+
+    # 経路上の点を配列に描き、各画素に最も近い点の番号を求める
+    height, width = binary.shape
+    ix = np.clip(np.rint(path[:K,0]/map_res).astype(np.intp),0,width-1)
+    iy = np.clip(np.rint(path[:K,1]/map_res).astype(np.intp),0,height-1)
+    label = np.full(binary.shape,-1,dtype=np.int32)
+    label[iy,ix] = np.arange(K,dtype=np.int32)
+    _, (ny, nx) = ndimage.distance_transform_edt(label < 0,return_indices=True)
+    nearest = label[ny,nx]
+    del ny, nx, label
+
+    # 最近傍の点から見た接線方向・法線方向の成分
+    px, py, s, heading = (path[:K,k][nearest] for k in range(4))
+    del nearest
+    dx = np.arange(width)*map_res - px
+    dy = np.arange(height)[:,np.newaxis]*map_res - py
+    del px, py
+    c, sn = np.cos(heading), np.sin(heading)
+    del heading
+    lateral = (c*dy - sn*dx).astype(np.float32)
+    progress = s + c*dx + sn*dy
+    length = path[K,2]
+    closed = np.all(path[K,0:2] == path[0,0:2])
+    if closed and length > 0:
+        progress = np.mod(progress,length)
+    return sdf, lateral, progress.astype(np.float32)
+
+def unwrap_progress(progress, length, maxstep = MAX_PROGRESS_STEP_MM, \
+        reanchor = REANCHOR_PROGRESS_MM):
+    """ 一周ごとに折り返す道のりの系列を連続した道のりに変換
+
+        1 ステップの変化は ±length/2 に折り返します。maxstep を超える変化
+        （交差部で別の区間に最も近くなった場合や、ショートカットした場合）
+        の間は直前の値を保持し、元の区間に戻ったときに間の変化を加えます。
+        飛んだ先の区間を reanchor 以上進んだ場合は、その区間に移ったとみなし、
+        飛びと進んだ分を加えて以降はその区間の道のりをたどります
+        （LFLapTimer と同じ）。開始点の少し手前から走り出した場合は
+        負の値から始まります。
+    """
+    progress = np.asarray(progress,dtype=float)
+    if len(progress) == 0:
+        return np.empty(0)
+    half = length/2
+    def wrap(d):
+        return (d + half) % length - half if length > 0 else d
+
+    # 1 ステップの変化と，その変化が続いている区間の切れ目
+    delta = wrap(np.diff(progress))
+    with np.errstate(invalid='ignore'):
+        valid = np.abs(delta) <= maxstep # nan も除く
+    delta[~valid] = 0.0
+    starts = np.nonzero(~valid)[0] + 1
+    ends = np.append(starts,len(progress))
+
+    # 区間ごとに、元の区間へ戻ったか（飛びを加える）、飛んだ先を
+    # reanchor 以上進んだか（そこまでを保持して移る）、保持したままかを判定
+    held = progress[ends[0]-1] if np.isfinite(progress[0]) else 0.0
+    base = wrap(progress[0]) if np.isfinite(progress[0]) else 0.0
+    for s, e in zip(starts.tolist(),ends[1:].tolist()):
+        bridge = wrap(progress[s] - held)
+        if abs(bridge) <= maxstep: # nan も除く
+            delta[s-1] = bridge
+            held = progress[e-1]
+            continue
+        travel = np.cumsum(delta[s:e-1])
+        moved = np.nonzero(np.abs(travel) >= reanchor)[0]
+        if not np.isfinite(bridge) or len(moved) == 0:
+            delta[s:e-1] = 0.0
+            continue
+        k = moved[0]
+        delta[s:s+k] = 0.0
+        delta[s+k] = bridge + travel[k]
+        held = progress[e-1]
+    return base + np.concatenate(([0.0],np.cumsum(delta)))
+
+def preprocess_course(filename, size, map_size, map_res, start = DEFAULT_START):
+    """ コース画像の前処理
+
+        size は表示用の画像の画素数、map_size と map_res は
+        センサ読み出し用の配列の画素数と解像度 mm/pixel、
+        start は中心線をたどり始める走行開始位置 (x mm, y mm, 向き rad) です。
+
+        出力　{ "rgb": 表示用の画像 [x, y, 3] (uint8),
+                "binary": 二値化したコース [y, x]（白で True）,
+                "grayscale": 輝度 [0,1] [y, x] (float32),
+                "centerline": ラインの中心線 [y, x]（中心線上で True）,
+                "distance": 中心線までの距離 mm [y, x] (float32),
+                "sdf": ラインの縁までの符号付き距離 mm [y, x] (float32),
+                "lateral": 経路からの横ずれ mm [y, x] (float32),
+                "progress": 経路に沿った道のり mm [y, x] (float32),
+                "path": 経路 (K+1,4) [x mm, y mm, 道のり mm, 向き rad] }
+    """
+    source = pygame.image.load(filename)
+    rgb = pygame.surfarray.array3d(pygame.transform.scale(source,size))
+    image = pygame.transform.scale(source,map_size)
+    binary = np.ascontiguousarray(pygame.surfarray.array2d(image).T > 0)
+    gray = np.dot(pygame.surfarray.array3d(image).transpose(1,0,2), \
+        np.asarray([0.299,0.587,0.114],dtype=np.float32))/255.0
+    grayscale = np.ascontiguousarray(gray,dtype=np.float32)
+    del image
+
+    # ラインの中心線（ライン内部での境界までの距離がほぼ極大となる画素，
+    # 途切れないよう近傍の最大値との差 0.5 画素まで含める）
+    line = ~binary
+    inside = ndimage.distance_transform_edt(line)
+    ridge = inside >= ndimage.maximum_filter(inside,size=3) - 0.5
+    centerline = line & ridge
+    del inside, ridge
+
+    # 中心線までの距離
+    if centerline.any():
+        distance = map_res*ndimage.distance_transform_edt(~centerline)
+    else:
+        distance = np.full(binary.shape,np.inf)
+
+    # 中心線をたどった経路と，符号付き距離・横ずれ・道のりの場
+    path = course_path(*trace_centerline(centerline,map_res,start))
+    sdf, lateral, progress = course_fields(binary,path,map_res)
+    return { "rgb": rgb, "binary": binary, "grayscale": grayscale, \
+             "centerline": centerline, "distance": distance.astype(np.float32), \
+             "sdf": sdf, "lateral": lateral, "progress": progress, "path": path }
+
+def load_course(filename, size, map_size, map_res, cache_dir = None, \
+        start = DEFAULT_START):
+    """ 前処理済みのコースデータの読み込み
+
+        キャッシュがあればメモリマップで読み込み、なければ前処理を
+        行ってキャッシュに保存します。cache_dir=False でキャッシュを使いません。
+    """
+    if cache_dir is False:
+        return preprocess_course(filename,size,map_size,map_res,start)
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filename)),CACHE_DIR)
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    prefix = os.path.join(cache_dir,'{}-{}'.format(stem, \
+        course_key(filename,size,map_size,map_res,start)))
+    paths = { name: '{}.{}.npy'.format(prefix,name) for name in CACHE_ARRAYS }
+    try:
+        return { name: np.load(path,mmap_mode='r') for name, path in paths.items() }
+    except (OSError, ValueError):
+        pass
+    arrays = preprocess_course(filename,size,map_size,map_res,start)
+    try:
+        os.makedirs(cache_dir,exist_ok=True)
+        for name, path in paths.items():
+            # 並列に起動したプロセスと衝突しないよう一時ファイルから置き換え
+            tmppath = '{}.{}.tmp'.format(path,os.getpid())
+            with open(tmppath,'wb') as f:
+                np.save(f,arrays[name])
+            os.replace(tmppath,path)
+    except OSError: # 書き込めない場所ではキャッシュしない
+        return arrays
+    # 大きな配列をメモリに残さないようメモリマップで読み直す
+    del arrays
+    return { name: np.load(path,mmap_mode='r') for name, path in paths.items() }
+
+class LFCourse:
+    """ コースデータ
+
+        ライントレース用のコースデータを保持する。
+
+        res [mm/pixel]      表示用の画像 image (size 画素) の解像度
+        map_res [mm/pixel]  センサ読み出し用の配列の解像度
+
+        表示用の画像 image に加えて、センサ読み出し用に
+        二値化したコースデータ binary（白で True，黒で False）を
+        NumPy 配列として一度だけ作成して保持します。
+        grayscale=True のときは輝度 [0,1] の配列 grayscale も保持します。
+        ラインの中心線 centerline と中心線までの距離 distance [mm] も保持します。
+
+        走行開始位置 start (x mm, y mm, 向き rad、省略するとコース画像ごとの
+        COURSE_STARTS) から中心線を一周たどった
+        経路 path と一周の長さ length [mm]、ラインの縁までの符号付き距離 sdf、
+        経路からの横ずれ lateral、経路に沿った道のり progress [mm] の場も
+        保持し、locate() で任意の位置の値を一括で参照できます。
+        配列の添字は [y, x]（行が y，列が x）で、大きさは map_height x map_width です。
+
+        cache_dir にキャッシュディレクトリを指定できます（False で不使用）。
+
+    """
+    def __init__(self,filename,res=1.25,grayscale=False,cache_dir=None, \
+            map_res=None,size=DISPLAY_SIZE,start=None):
+        self._filename = filename
+        self._width, self._height = size
+        self._res = res
+
+        # センサ読み出し用の配列の解像度と画素数
+        if map_res == 'native':
+            srcwidth, _ = pygame.image.load(filename).get_size()
+            map_res = self.realwidth/srcwidth
+        elif map_res is None:
+            map_res = res
+        self._map_res = map_res
+        self._map_width = int(round(self.realwidth/map_res))
+        self._map_height = int(round(self.realheight/map_res))
+
+        if start is None:
+            start = course_start(filename,self.realwidth/DISPLAY_SIZE[0])
+        arrays = load_course(filename,size,(self._map_width,self._map_height), \
+            map_res,cache_dir=cache_dir,start=start)
+        self._image = pygame.surfarray.make_surface(arrays["rgb"])
+
+        # センサ読み出し用のコースデータ
+        self._binary = arrays["binary"]
+        self._centerline = arrays["centerline"]
+        self._distance = arrays["distance"]
+        self._grayscale = arrays["grayscale"] if grayscale else None
+
+        # 経路と符号付き距離・横ずれ・道のりの場
+        self._start = tuple(start)
+        self._path = np.asarray(arrays["path"])
+        self._sdf = arrays["sdf"]
+        self._lateral = arrays["lateral"]
+        self._progress = arrays["progress"]
+        self._check_path()
+
+    def _check_path(self):
+        """ 経路の確認（走行開始位置がライン上にない・一周しない場合は警告） """
+        name = os.path.basename(self._filename)
+        if len(self._path) == 0:
+            warnings.warn('{}: no centre line was found.'.format(name),RuntimeWarning)
+            return
+        _, _, sdf = self.locate(self._start[0],self._start[1])
+        if not sdf < 0: # コース外（nan）も含む
+            warnings.warn('{}: start {} is not on the line ({:.0f} mm from its edge); ' \
+                'pass the start line of the course as start.'.format(name,self._start,sdf), \
+                RuntimeWarning)
+        if not self.closed:
+            warnings.warn('{}: the centre line traced from {} does not close ' \
+                '({:.0f} mm); progress and laps are only valid along the traced part.'.format( \
+                name,self._start,self.length),RuntimeWarning)
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def resolution(self):
+        return self._res
+
+    @property
+    def map_width(self):
+        return self._map_width
+
+    @property
+    def map_height(self):
+        return self._map_height
+
+    @property
+    def map_resolution(self):
+        return self._map_res
+
+    @property
+    def realwidth(self):
+        return self._width*self._res
+
+    @property
+    def realheight(self):
+        return self._height*self._res
+
+    @property
+    def image(self):
+        return self._image
+
+    @property
+    def binary(self):
+        return self._binary
+
+    @property
+    def grayscale(self):
+        return self._grayscale
+
+    @property
+    def centerline(self):
+        return self._centerline
+
+    @property
+    def distance(self):
+        return self._distance
+
+    @property
+    def start(self):
+        return self._start
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def length(self):
+        """ 経路の長さ mm（一周したときは一周の長さ） """
+        return float(self._path[-1,2]) if len(self._path) > 0 else 0.0
+
+    @property
+    def closed(self):
+        """ 経路が一周しているか """
+        path = self._path
+        return len(path) > 1 and bool(np.all(path[-1,0:2] == path[0,0:2]))
+
+    @property
+    def sdf(self):
+        return self._sdf
+
+    @property
+    def lateral(self):
+        return self._lateral
+
+    @property
+    def progress(self):
+        return self._progress
+
+    def locate(self, x_mm, y_mm):
+        """ 位置 [mm]（配列可）での横ずれ・道のり・符号付き距離 mm
+
+            コース外の位置では横ずれと道のりは nan、符号付き距離は inf です。
+        """
+        x = np.asarray(x_mm,dtype=float)/self._map_res
+        y = np.asarray(y_mm,dtype=float)/self._map_res
+        with np.errstate(invalid='ignore'):
+            ix = np.floor(x+0.5)
+            iy = np.floor(y+0.5)
+            inside = (0 <= ix) & (ix < self._map_width) & (0 <= iy) & (iy < self._map_height)
+        idx = np.where(inside,iy*self._map_width+ix,0).astype(np.intp)
+        lateral = np.where(inside,self._lateral.reshape(-1)[idx],np.nan)
+        progress = np.where(inside,self._progress.reshape(-1)[idx],np.nan)
+        sdf = np.where(inside,self._sdf.reshape(-1)[idx],np.inf)
+        if lateral.ndim == 0:
+            return float(lateral), float(progress), float(sdf)
+        return lateral, progress, sdf
+
+    def offtrack(self, x_mm, y_mm, limit = OFFTRACK_MM):
+        """ 位置 [mm]（配列可）がコースアウトしているか """
+        lateral, _, _ = self.locate(x_mm,y_mm)
+        with np.errstate(invalid='ignore'):
+            return ~(np.abs(lateral) <= limit)
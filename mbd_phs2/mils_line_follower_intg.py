@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレーサー数値積分クラス
+
+説明
+
+  ライントレーサー物理モデルの状態方程式を固定ステップで数値積分します。
+  モデルの係数は LFPhysicalModel で一度だけ畳み込み（fold_params）、
+  ここでは畳み込み済みの係数のみを用いて計算します。
+
+  動力学(Dynamic)モデル
+
+    dv/dt = ( -v + c_lin*ω^2   + K_lin*u_lin ) / T_lin
+    dω/dt = ( -ω - c_rot*v*ω   + K_rot*u_rot ) / T_rot
+
+  運動(Kinematic)モデル
+
+    dx/dt = v cosθ,  dy/dt = v sinθ,  dθ/dt = ω
+
+  選択できる積分法
+
+  - dynamics
+    - 'exp'    : 線形部分を厳密に解く指数積分（結合項はステップ内で一定）
+    - 'rk4'    : 4段4次のルンゲ・クッタ法（ステップを substeps 個に分割）
+    - 'euler'  : 半陰的オイラー法（減衰項を陰的、結合項を陽的に扱う）
+    - 'odeint' : scipy.integrate.odeint（従来の参照実装）
+  - kinematics
+    - 'arc'    : 速度・角速度一定の円弧として厳密に解く
+    - 'odeint' : scipy.integrate.odeint（従来の参照実装）
+
+  'odeint' 以外はスカラーだけでなく NumPy 配列の状態にもそのまま適用できます。
+
+  'rk4' は時定数に比べて長いステップ（20 Hz で h/T_lin≈1.4）では誤差が大きく、
+  閉ループではラインを見失います。substeps=None（既定）のときは分割後の
+  ステップ幅が時定数の RK4_MAX_STEP_RATIO 倍以下になるように分割数を決めます。
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+from scipy.integrate import odeint
+import numpy as np
+import math
+
+# 角速度がこれより小さいときは直線として扱う
+EPS_OMEGA = 1e-9 # rad/s
+
+# 'rk4' の分割後のステップ幅の上限（時定数 T_lin, T_rot の小さい方に対する比）
+RK4_MAX_STEP_RATIO = 0.25
+
+class LFIntegrator:
+    """ 数値積分クラス
+
+        coefs は T_lin, K_lin, c_lin, T_rot, K_rot, c_rot を
+        キーに持つ辞書（LFPhysicalModel.fold_params() の出力）
+
+        substeps は 'rk4' の 1 ステップあたりの分割数（None で時定数から決定）
+
+    """
+    DYNAMICS = ('exp','rk4','euler','odeint')
+    KINEMATICS = ('arc','odeint')
+
+    def __init__(self, coefs, dynamics = 'exp', kinematics = 'arc', substeps = None):
+        if dynamics not in self.DYNAMICS:
+            raise ValueError('Unknown dynamics scheme: {}'.format(dynamics))
+        if kinematics not in self.KINEMATICS:
+            raise ValueError('Unknown kinematics scheme: {}'.format(kinematics))
+        self._coefs = dict(coefs)
+        self._dynamics = dynamics
+        self._kinematics = kinematics
+        self._fixed_substeps = substeps
+        self._substeps = 1 if substeps is None else substeps
+        self._h = None
+
+        # 係数の展開
+        self._T_lin = coefs["T_lin"]
+        self._K_lin = coefs["K_lin"]
+        self._c_lin = coefs["c_lin"]
+        self._T_rot = coefs["T_rot"]
+        self._K_rot = coefs["K_rot"]
+        self._c_rot = coefs["c_rot"]
+
+        # 積分法の選択
+        self._step_dynamics = {
+            'exp': self._dynamics_exp,
+            'rk4': self._dynamics_rk4,
+            'euler': self._dynamics_euler,
+            'odeint': self._dynamics_odeint
+        }[dynamics]
+        self._step_kinematics = {
+            'arc': self._kinematics_arc,
+            'odeint': self._kinematics_odeint
+        }[kinematics]
+
+    @property
+    def coefs(self):
+        return self._coefs
+
+    @property
+    def dynamics(self):
+        return self._dynamics
+
+    @property
+    def kinematics(self):
+        return self._kinematics
+
+    @property
+    def substeps(self):
+        """ 'rk4' の分割数（substeps=None のときは直近のステップ幅 h から決めた値） """
+        return self._substeps
+
+    def step_dynamics(self,v0,w0,u_lin,u_rot,h):
+        """ 速度・角速度を h 秒進める（制御信号はゼロ次ホールド） """
+        if h != self._h:
+            self._prepare(h)
+        return self._step_dynamics(v0,w0,u_lin,u_rot,h)
+
+    def step_kinematics(self,x0,y0,theta0,v,w,h):
+        """ 位置・角度を h 秒進める（速度・角速度は一定） """
+        return self._step_kinematics(x0,y0,theta0,v,w,h)
+
+    def _prepare(self,h):
+        """ ステップ幅 h に依存する定数の計算 """
+        self._h = h
+        # 指数積分の減衰率
+        self._e_lin = np.exp(-h/self._T_lin)
+        self._e_rot = np.exp(-h/self._T_rot)
+        # 半陰的オイラー法の係数
+        self._r_lin = h/self._T_lin
+        self._r_rot = h/self._T_rot
+        # ルンゲ・クッタ法の分割数
+        if self._fixed_substeps is None:
+            T_min = min(np.min(self._T_lin),np.min(self._T_rot))
+            self._substeps = max(1,math.ceil(h/(RK4_MAX_STEP_RATIO*T_min)))
+
+    def dydt(self,v,w,u_lin,u_rot):
+        """ 動力学(Dynamic)モデルの状態方程式 """
+        dvdt = ( -v + self._c_lin*w*w + self._K_lin*u_lin ) / self._T_lin
+        dwdt = ( -w - self._c_rot*v*w + self._K_rot*u_rot ) / self._T_rot
+        return dvdt, dwdt
+
+    def _dynamics_exp(self,v0,w0,u_lin,u_rot,h):
+        # 定常値に向かって厳密に指数減衰
+        v_inf = self._c_lin*w0*w0 + self._K_lin*u_lin
+        w_inf = -self._c_rot*v0*w0 + self._K_rot*u_rot
+        v1 = self._e_lin*(v0 - v_inf) + v_inf
+        w1 = self._e_rot*(w0 - w_inf) + w_inf
+        return v1, w1
+
+    def _dynamics_rk4(self,v0,w0,u_lin,u_rot,h):
+        dt = h/self._substeps
+        v, w = v0, w0
+        for _ in range(self._substeps):
+            k1v, k1w = self.dydt(v,w,u_lin,u_rot)
+            k2v, k2w = self.dydt(v+0.5*dt*k1v,w+0.5*dt*k1w,u_lin,u_rot)
+            k3v, k3w = self.dydt(v+0.5*dt*k2v,w+0.5*dt*k2w,u_lin,u_rot)
+            k4v, k4w = self.dydt(v+dt*k3v,w+dt*k3w,u_lin,u_rot)
+            v = v + (dt/6.0)*(k1v+2.0*k2v+2.0*k3v+k4v)
+            w = w + (dt/6.0)*(k1w+2.0*k2w+2.0*k3w+k4w)
+        return v, w
+
+    def _dynamics_euler(self,v0,w0,u_lin,u_rot,h):
+        # 減衰項は陰的、結合項は陽的（v は更新後の値を利用）
+        v1 = ( v0 + self._r_lin*(self._c_lin*w0*w0 + self._K_lin*u_lin) ) \
+            / (1.0 + self._r_lin)
+        w1 = ( w0 + self._r_rot*(-self._c_rot*v1*w0 + self._K_rot*u_rot) ) \
+            / (1.0 + self._r_rot)
+        return v1, w1
+
+    def _dynamics_odeint(self,v0,w0,u_lin,u_rot,h):
+        t = np.linspace(0,h,2)
+        y1 = odeint(self._odedydt,[v0,w0],t,args=(u_lin,u_rot))
+        return y1[-1][0], y1[-1][1]
+
+    def _odedydt(self,y,t,u_lin,u_rot):
+        return list(self.dydt(y[0],y[1],u_lin,u_rot))
+
+    def _kinematics_arc(self,x0,y0,theta0,v,w,h):
+        theta1 = theta0 + w*h
+        if np.ndim(w) == 0: # スカラーの場合
+            if abs(w) > EPS_OMEGA:
+                r = v/w # 旋回半径
+                x1 = x0 + r*(math.sin(theta1)-math.sin(theta0))
+                y1 = y0 - r*(math.cos(theta1)-math.cos(theta0))
+            else:
+                x1 = x0 + v*h*math.cos(theta0)
+                y1 = y0 + v*h*math.sin(theta0)
+            return x1, y1, theta1
+        sin0, cos0 = np.sin(theta0), np.cos(theta0)
+        sin1, cos1 = np.sin(theta1), np.cos(theta1)
+        # 円弧 (v/ω)(sinθ1-sinθ0) と直線 v h cosθ0 を ω の大きさで切り替え
+        turning = np.abs(w) > EPS_OMEGA
+        w_safe = np.where(turning,w,1.0)
+        x1 = x0 + np.where(turning,(v/w_safe)*(sin1-sin0),v*h*cos0)
+        y1 = y0 + np.where(turning,-(v/w_safe)*(cos1-cos0),v*h*sin0)
+        return x1, y1, theta1
+
+    def _kinematics_odeint(self,x0,y0,theta0,v,w,h):
+        t = np.linspace(0,h,2)
+        p = odeint(self._odefun,[x0,y0,theta0],t,args=(v,w))
+        return p[-1][0], p[-1][1], p[-1][2]
+
+    def _odefun(self,pos,t,v,w):
+        """ 運動(Kinematic)モデルの状態方程式 """
+        # d_ (  x ) = ( cosθ )v + ( 0 )ω
+        # dt (  y )   ( sinθ )    ( 0 )
+        #    (  θ )   (  0   )    ( 1 )
+        phi = pos[2]
+        return [ np.cos(phi)*v, np.sin(phi)*v, w ]
@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレースシミュレータ 周回・区間計測
+
+説明
+
+　コースの前処理で求めた道のりの場（LFCourse.progress）を使って、
+  スタート・ゴールの通過と途中のチェックポイントの通過を自動で判定し、
+  周回時間と区間（スプリット）時間を記録します。
+
+    - スタート・ゴール # 道のり 0（LFCourse の走行開始位置 start に最も近い中心線上の点）
+    - チェックポイント # 道のり mm、またはコース上のゲート ((x1,y1),(x2,y2)) mm
+
+  計時は最初の update() の時刻から始まり、laps 周を走り終えると
+  finished が True になります（laps=None では周回数を限りません）。
+  ヘッドレス実行やパラメータスイープではこれを見て走行を打ち切ります。
+
+  位置を長さ M の配列で与えると M 台分を一括で計測します
+  （LFPhysicalModelFleet の一括走行 run_fleet_laps() など）。
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+from mils_line_follower_course import MAX_PROGRESS_STEP_MM, REANCHOR_PROGRESS_MM
+import numpy as np
+
+def checkpoint_progress(course, checkpoints):
+    """ チェックポイントの道のり mm（昇順）
+
+        checkpoints の要素は道のり mm、またはゲートの両端
+        ((x1,y1),(x2,y2)) mm で、ゲートはその中点の道のりとします。
+    """
+    length = course.length
+    progress = []
+    for checkpoint in checkpoints:
+        if np.ndim(checkpoint) == 0:
+            value = float(checkpoint)
+        else:
+            (x1, y1), (x2, y2) = checkpoint
+            _, value, _ = course.locate((x1+x2)/2,(y1+y2)/2)
+            if not np.isfinite(value):
+                raise ValueError('Gate {} is not on the course.'.format(checkpoint))
+        if not 0 < value < length:
+            raise ValueError('Checkpoint {} is out of range (0, {:.1f}).'.format( \
+                checkpoint,length))
+        progress.append(value)
+    return np.sort(np.asarray(progress,dtype=float))
+
+class LFLapTimer:
+    """ 周回・区間計測クラス
+
+        1 周を「チェックポイント…，スタート・ゴール」の順のゲートに分け、
+        車体の中心の道のり（周回ごとに折り返さない値）が各ゲートを
+        越えた時刻を、前後のステップの間で線形補間して記録します。
+        道のりは到達した最大値で判定するため、後退や交差部での
+        取り違えで同じゲートを二度数えることはありません。
+        道のりが maxstep を超えて飛んだ（交差部で別の区間に最も近くなった、
+        ショートカットした）間は道のりを保持し、元の区間に戻れば間の変化を、
+        飛んだ先の区間を reanchor 以上進めば飛びと進んだ分を加えます
+        （unwrap_progress() と同じ）。ショートカットした周回も周回として数えます。
+
+        入力　時刻 s と車体の中心位置 mm（M 台分は長さ M の配列）
+    """
+    def __init__(self, course, laps = 1, checkpoints = (), num = 1, \
+            maxstep = MAX_PROGRESS_STEP_MM, reanchor = REANCHOR_PROGRESS_MM):
+        self._course = course
+        self._laps = laps
+        self._num = num
+        self._maxstep = maxstep
+        self._reanchor = reanchor
+        self._length = course.length
+        self._closed = course.closed
+
+        # 1 周分のゲートの道のり（最後がスタート・ゴール）
+        self._gates = np.append(checkpoint_progress(course,checkpoints),self._length)
+        self._times = np.full((num,(laps or 1)*len(self._gates)),np.nan)
+        self.reset()
+
+    def reset(self):
+        num = self._num
+        self._t0 = None
+        self._t = np.zeros(num)
+        self._progress = np.zeros(num)  # 周回ごとに折り返さない道のり
+        self._wrapped = np.zeros(num)   # 直前の道のり（場の値）
+        self._held = np.zeros(num)      # 最後に道のりを進めたときの場の値
+        self._pending = np.zeros(num,dtype=bool) # 道のりが飛んだ先の区間にいるか
+        self._bridge = np.zeros(num)    # 飛んだときの場の値の変化
+        self._travel = np.zeros(num)    # 飛んだ先の区間で進んだ道のり
+        self._furthest = np.zeros(num)  # 到達した最大の道のり
+        self._next = np.zeros(num,dtype=np.intp) # 次に通過するゲートの番号
+        self._times[:] = np.nan
+
+    @property
+    def num(self):
+        return self._num
+
+    @property
+    def laps(self):
+        return self._laps
+
+    @property
+    def started(self):
+        """ 計測を開始したか """
+        return self._t0 is not None
+
+    @property
+    def progress(self):
+        """ 周回ごとに折り返さない道のり mm """
+        return self._progress
+
+    @property
+    def completed(self):
+        """ 走り終えた周回数 """
+        return self._next//len(self._gates)
+
+    @property
+    def done(self):
+        """ 台ごとに laps 周を走り終えたか """
+        if self._laps is None:
+            return np.zeros(self._num,dtype=bool)
+        return self._next >= self._laps*len(self._gates)
+
+    @property
+    def finished(self):
+        """ 全車が laps 周を走り終えたか """
+        return bool(np.all(self.done))
+
+    def update(self, t, x_mm, y_mm):
+        """ 時刻 t [s] での位置 mm による計測の更新 """
+        _, wrapped, _ = self._course.locate(x_mm,y_mm)
+        wrapped = np.reshape(wrapped,-1)
+        length = self._length
+        if self._t0 is None:
+            # 計測開始（開始点の少し手前から走り出した場合は負の道のり）
+            self._t0 = t
+            self._t[:] = t
+            start = np.where(np.isfinite(wrapped),wrapped,0.0)
+            if self._closed and length > 0:
+                start = (start + length/2) % length - length/2
+            self._progress[:] = start
+            self._wrapped[:] = wrapped
+            self._held[:] = np.where(np.isfinite(wrapped),wrapped,0.0)
+            self._pending[:] = False
+            self._furthest[:] = start
+            return
+
+        # 道のりの変化（周回の折り返しと，交差部やショートカットでの飛びを除く）
+        # 飛んだ間は道のりを保持し、元の区間に戻ったときは間の変化を、
+        # 飛んだ先を reanchor 以上進んだときは飛びと進んだ分を加える
+        # （unwrap_progress() と同じ）
+        delta = wrapped - self._wrapped
+        bridge = wrapped - self._held
+        if self._closed and length > 0:
+            delta = (delta + length/2) % length - length/2
+            bridge = (bridge + length/2) % length - length/2
+        with np.errstate(invalid='ignore'):
+            valid = np.abs(delta) <= self._maxstep
+            rejoin = ~valid & (np.abs(bridge) <= self._maxstep)
+        jump = ~valid & ~rejoin
+        pending = self._pending
+        grow = valid & pending
+        self._travel[grow] += delta[grow]
+        reanchor = grow & (np.abs(self._travel) >= self._reanchor)
+        increment = np.where(valid & ~pending,delta,0.0)
+        increment[rejoin] = bridge[rejoin]
+        increment[reanchor] = self._bridge[reanchor] + self._travel[reanchor]
+        self._bridge[jump] = bridge[jump]
+        self._travel[jump] = 0.0
+        self._pending = jump | (grow & ~reanchor)
+        self._held = np.where(self._pending,self._held,wrapped)
+        self._wrapped = wrapped
+        prev = self._furthest.copy()
+        self._progress += increment
+        np.maximum(self._furthest,self._progress,out=self._furthest)
+
+        # ゲートの通過（1 ステップで複数のゲートを越えた場合も含む）
+        ngates = len(self._gates)
+        while True:
+            active = ~self.done
+            if not active.any():
+                break
+            idx = self._next
+            target = (idx//ngates)*length + self._gates[idx % ngates]
+            crossed = active & (self._furthest >= target)
+            if not crossed.any():
+                break
+            span = np.where(crossed,self._furthest-prev,1.0)
+            frac = np.clip((target-prev)/np.where(span > 0,span,1.0),0.0,1.0)
+            cars = np.nonzero(crossed)[0]
+            if idx[cars].max() >= self._times.shape[1]: # 周回数を限らない場合は拡張
+                self._times = np.concatenate((self._times, \
+                    np.full(self._times.shape,np.nan)),axis=1)
+            self._times[cars,idx[cars]] = self._t[cars] + frac[cars]*(t-self._t[cars])
+            self._next[cars] += 1
+        self._t[:] = t
+
+    def laptimes(self, car = 0):
+        """ 走り終えた周回ごとの時間 s """
+        ngates = len(self._gates)
+        ends = self._times[car,ngates-1::ngates]
+        ends = ends[np.isfinite(ends)]
+        return np.diff(np.concatenate(([self._t0 if self._t0 is not None else 0.0],ends)))
+
+    def splits(self, car = 0):
+        """ 周回ごとの区間時間 s（laps x (チェックポイント数+1)，未通過は nan） """
+        ngates = len(self._gates)
+        times = self._times[car].reshape(-1,ngates)
+        if self._laps is None: # 走り始めた周回まで
+            times = times[:max(1,int(self.completed[car])+1)]
+        t0 = self._t0 if self._t0 is not None else 0.0
+        starts = np.concatenate(([t0],times[:-1,-1]))
+        return np.diff(np.concatenate((starts[:,np.newaxis],times),axis=1),axis=1)
+
+    def result(self, car = 0):
+        """ 計測結果 {"laps": 走り終えた周回数, "laptimes": [...], "splits": [[...], ...]} """
+        return { "laps": int(self.completed[car]), \
+                 "laptimes": self.laptimes(car).tolist(), \
+                 "splits": self.splits(car).tolist() }
+
+def run_fleet_laps(fleet, rate, duration, laps = 1, checkpoints = ()):
+    """ LFPhysicalModelFleet の一括ヘッドレス走行
+
+        全車が laps 周を走り終えるか、シミュレーション時間が duration 秒に
+        なるまで rate [Hz] の固定ステップで走らせ、台ごとの計測結果の
+        リストを返します。
+    """
+    timer = LFLapTimer(fleet.course,laps=laps,checkpoints=checkpoints,num=fleet.num)
+    timer.update(0.0,fleet.x_mm,fleet.y_mm)
+    nsteps = int(duration*rate+0.5)
+    step = 0
+    while step < nsteps and not timer.finished:
+        fleet.drive(rate)
+        step += 1
+        timer.update(step/rate,fleet.x_mm,fleet.y_mm)
+    return [ timer.result(car) for car in range(fleet.num) ]
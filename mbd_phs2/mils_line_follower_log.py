@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレースシミュレータ 走行記録・再生
+
+説明
+
+　LFRecorder は 1 ステップごとの位置・向き・速度・角速度・
+  フォトリフレクタの値・モータ制御信号を、あらかじめ確保した
+  NumPy 構造化配列に書き込み、満杯になるたびに .npy ファイルへ
+  追記します。メモリ使用量は記録の長さによらず一定です。
+
+  記録は load_log() でメモリマップとして読み込めます。
+
+    log = load_log('run.npy')
+    log['x_mm'], log['prs'][:,0], ...
+
+  再生ビューアは物理計算をやり直さずに記録をたどります。
+  プログラムを実行する際は、このファイルが存在するディレクトリに移動して、
+  以下のコマンドを実行して下さい。
+
+　　$ python3 mils_line_follower_log.py run.npy
+
+    [←][→] 1 ステップ移動（[Shift] で 100 ステップ）
+    [SPACE] 再生・一時停止
+    下端のバーをドラッグ 任意の位置へ移動
+    [q] 終了
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    # 実機と共通の制御パッケージ lfcontrol（リポジトリの最上位）の参照
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pygame
+
+# .npy ヘッダの長さ（記録数の書き換えに備えて固定）
+HEADER_ALIGN = 64
+
+def log_dtype(num_prs):
+    """ 記録 1 ステップ分のデータ型 """
+    return np.dtype([ \
+        ('t','<f8'),        # 時刻 s
+        ('x_mm','<f8'),     # 位置 mm
+        ('y_mm','<f8'),     # 位置 mm
+        ('angle','<f8'),    # 向き rad
+        ('v_mm_s','<f8'),   # 速度 mm/s
+        ('w_rad_s','<f8'),  # 角速度 rad/s
+        ('prs','<f4',(num_prs,)), # フォトリフレクタの値
+        ('mtrs','<f4',(2,)) # モータ制御信号（左，右）
+    ])
+
+def load_log(filename):
+    """ 記録の読み込み（メモリマップ） """
+    return np.load(filename,mmap_mode='r')
+
+class LFRecorder:
+    """ 走行記録クラス
+
+        chunk ステップ分の構造化配列をあらかじめ確保し、
+        満杯になるか flush() を呼ぶたびにファイルへ追記します。
+        ファイルの .npy ヘッダは追記のたびに記録数で更新するため、
+        flush() 後はいつでも load_log() で読み込めます。
+    """
+
+    def __init__(self, filename, num_prs, chunk = 4096):
+        self._filename = filename
+        self._dtype = log_dtype(num_prs)
+        self._buffer = np.zeros(chunk,dtype=self._dtype)
+        self._chunk = chunk
+        self._nbuf = 0
+        self._count = 0
+
+        # 固定長のヘッダを書き込み
+        self._descr = np.lib.format.dtype_to_descr(self._dtype)
+        maxheader = len(self._header_str(10**20))
+        self._header_len = -(-(10+maxheader+1)//HEADER_ALIGN)*HEADER_ALIGN - 10
+        self._file = open(filename,'wb+')
+        self._write_header()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def count(self):
+        """ 記録済みのステップ数 """
+        return self._count + self._nbuf
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def append(self, t, x_mm, y_mm, angle, v_mm_s, w_rad_s, prs, mtrs):
+        """ 1 ステップ分の記録 """
+        rec = self._buffer[self._nbuf]
+        rec['t'] = t
+        rec['x_mm'] = x_mm
+        rec['y_mm'] = y_mm
+        rec['angle'] = angle
+        rec['v_mm_s'] = v_mm_s
+        rec['w_rad_s'] = w_rad_s
+        rec['prs'] = prs
+        rec['mtrs'] = mtrs
+        self._nbuf += 1
+        if self._nbuf == self._chunk:
+            self.flush()
+
+    def flush(self):
+        """ バッファの内容をファイルに追記 """
+        if self._file is None:
+            return
+        if self._nbuf > 0:
+            self._file.seek(0,2)
+            self._buffer[:self._nbuf].tofile(self._file)
+            self._count += self._nbuf
+            self._nbuf = 0
+        self._write_header()
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def _header_str(self, count):
+        return "{{'descr': {!r}, 'fortran_order': False, 'shape': ({:d},), }}".format( \
+            self._descr,count)
+
+    def _write_header(self):
+        header = self._header_str(self._count)
+        header = header + ' '*(self._header_len-len(header)-1) + '\n'
+        self._file.seek(0)
+        self._file.write(b'\x93NUMPY\x01\x00')
+        self._file.write(np.uint16(self._header_len).tobytes())
+        self._file.write(header.encode('latin1'))
+
+class LFReplayViewer:
+    """ 走行記録の再生ビューア
+
+        記録された姿勢とセンサ値で車体を描画するだけで、
+        物理計算は行いません。
+    """
+    SLIDER_HEIGHT = 12
+
+    def __init__(self, linefollower, log, fps = 20):
+        self._linefollower = linefollower
+        self._course = linefollower.course
+        self._log = log
+        self._fps = fps
+        self._index = 0
+        self._playing = False
+        self._width = self._course.width
+        self._height = self._course.height
+        self._screen = pygame.display.set_mode((self._width,self._height))
+        self._clock = pygame.time.Clock()
+
+        # 再生速度（記録の刻みから 1 フレームあたりのステップ数を決める）
+        if len(log) > 1 and log['t'][1] > log['t'][0]:
+            self._stride = max(1,int(round(1/(fps*(log['t'][1]-log['t'][0])))))
+        else:
+            self._stride = 1
+
+        # 軌跡（表示用に間引き）
+        res = self._course.resolution
+        step = max(1,len(log)//5000)
+        self._trail = np.stack((log['x_mm'][::step],log['y_mm'][::step]),axis=1)/res
+
+    def seek(self, index):
+        self._index = int(min(max(index,0),len(self._log)-1))
+
+    def run(self):
+        pygame.init()
+        pygame.display.set_caption('ライントレース・リプレイ')
+        font20 = pygame.font.Font(None, 20)
+        nlog = len(self._log)
+        dragging = False
+
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    return
+                if event.type == pygame.KEYDOWN:
+                    big = event.mod & pygame.KMOD_SHIFT
+                    if event.key == pygame.K_RIGHT:
+                        self.seek(self._index + (100 if big else 1))
+                    elif event.key == pygame.K_LEFT:
+                        self.seek(self._index - (100 if big else 1))
+                    elif event.key == pygame.K_SPACE:
+                        self._playing = not self._playing
+                    elif event.key == pygame.K_q:
+                        pygame.quit()
+                        return
+                if event.type == pygame.MOUSEBUTTONDOWN and \
+                        event.pos[1] > self._height-self.SLIDER_HEIGHT:
+                    dragging = True
+                if event.type == pygame.MOUSEBUTTONUP:
+                    dragging = False
+            if dragging:
+                mouseX, _ = pygame.mouse.get_pos()
+                self.seek(mouseX*(nlog-1)/max(1,self._width-1))
+            elif self._playing:
+                self.seek(self._index + self._stride)
+                if self._index == nlog-1:
+                    self._playing = False
+
+            # 記録の姿勢とセンサ値で車体を描画
+            rec = self._log[self._index]
+            lf = self._linefollower
+            lf.set_position_mm(float(rec['x_mm']),float(rec['y_mm']))
+            lf.rotate(float(rec['angle']))
+            lf.photorefs.values = rec['prs']
+
+            self._screen.blit(self._course.image,[0, 0])
+            if len(self._trail) > 1:
+                pygame.draw.lines(self._screen,(0,0,255),False,self._trail.tolist(),1)
+            lf.draw_body(self._screen)
+
+            # スライダーと情報
+            y0 = self._height-self.SLIDER_HEIGHT
+            pygame.draw.rect(self._screen,(200,200,200),(0,y0,self._width,self.SLIDER_HEIGHT))
+            xpos = int(self._index*(self._width-1)/max(1,nlog-1))
+            pygame.draw.rect(self._screen,(0,0,255),(xpos-2,y0,5,self.SLIDER_HEIGHT))
+            text = 't={:.3f}s  v={:.0f}mm/s  w={:.2f}rad/s  mtrs=({:.2f},{:.2f})  [{}/{}]'.format( \
+                rec['t'],rec['v_mm_s'],rec['w_rad_s'],rec['mtrs'][0],rec['mtrs'][1], \
+                self._index,nlog-1)
+            self._screen.blit(font20.render(text,True,(0,0,0)),[10,y0-16])
+            pygame.display.update()
+            self._clock.tick(self._fps)
+
+def main():
+    """ メイン関数 """
+    from main_mils_line_follower import COURSE_IMG, COURSE_RES
+    from mils_line_follower_body import LFPhysicalModel, LF_MOUNT_POS_PRF
+    from mils_line_follower_course import LFCourse
+
+    if len(sys.argv) < 2:
+        print('Usage: python3 mils_line_follower_log.py LOGFILE.npy')
+        sys.exit(1)
+    log = load_log(sys.argv[1])
+    course = LFCourse(COURSE_IMG,res=COURSE_RES)
+    num_prs = log.dtype['prs'].shape[0]
+    # 記録にはフォトリフレクタの配置が含まれないため、個数が合えば既定の配置で描画
+    if len(LF_MOUNT_POS_PRF) == num_prs:
+        mntposprs = LF_MOUNT_POS_PRF
+    else:
+        mntposprs = [ (0,0) ]*num_prs
+    lf = LFPhysicalModel(course,mntposprs=mntposprs)
+    LFReplayViewer(lf,log).run()
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,26 @@
 
 「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
 
-All rights revserved 2019-2023 (c) Shogo MURAMATSU
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
 """
-import pygame
+import numpy as np
+import math
+
+# 円形の読み取り範囲の重みを求める際の 1 画素あたりの分割数
+FOOTPRINT_SUBDIV = 8
+
+def footprint_kernel(radius_px, subdiv = FOOTPRINT_SUBDIV):
+    """ 半径 radius_px の円が各画素を覆う面積の割合 (2R+1)x(2R+1)（合計 1） """
+    R = int(math.ceil(radius_px - 0.5)) if radius_px > 0.5 else 0
+    # 各画素を subdiv x subdiv に分割した点が円内にある割合
+    t = (np.arange(subdiv) + 0.5)/subdiv - 0.5
+    d = np.arange(-R,R+1)
+    px = (d[:,np.newaxis] + t).reshape(-1)
+    inside = (px[:,np.newaxis]**2 + px[np.newaxis,:]**2) <= radius_px**2
+    weights = inside.reshape(2*R+1,subdiv,2*R+1,subdiv).mean(axis=(1,3))
+    if weights.sum() == 0.0: # 画素より十分小さい円は中心の 1 画素
+        weights[R,R] = 1.0
+    return weights/weights.sum()
 
 class LFPhotoReflector:
     """ フォトリフレクタクラス 
@@ -17,6 +34,10 @@ class LFPhotoReflector:
         ノイズを加えたり応答をスケールするなど、
         実機のフォトリフレクタに合わせた調整は、
         この部分で行うとよいでしょう。
+
+        コースの値は LFCourse が事前に作成した二値配列から読み出します。
+        位置は表示用の画素 [pixel] で与え、センサ読み出し用の配列の
+        画素に換算して読み出します。
     
     """
     ACTIVE_WHITE = True # 白で1，黒で0．Falseのときは逆
@@ -44,16 +65,14 @@ class LFPhotoReflector:
 
     def measurement(self):
         # センサ位置周辺の値をリターン
-        x_px = int(self._pos_px[0]+0.5)
-        y_px = int(self._pos_px[1]+0.5)     
-        if 1 < y_px and y_px < self._course.height-1 and \
-            1 < x_px and x_px < self._course.width-1:
-            pxarray = pygame.PixelArray(self._course.image) 
+        course = self._course
+        scale = course.resolution/course.map_resolution
+        x_px = int(self._pos_px[0]*scale+0.5)
+        y_px = int(self._pos_px[1]*scale+0.5)     
+        if 1 < y_px and y_px < course.map_height-1 and \
+            1 < x_px and x_px < course.map_width-1:
             # 3x3 領域の平均を出力
-            acc = 0.0
-            for row in range(-1,2):
-                for col in range(-1,2):
-                    acc = acc + float(pxarray[x_px+col][y_px+row] > 0)
+            acc = float(self._course.binary[y_px-1:y_px+2,x_px-1:x_px+2].sum())
             if LFPhotoReflector.ACTIVE_WHITE:
                 value = acc/9.0 # 平均値
             else:
@@ -62,3 +81,149 @@ class LFPhotoReflector:
             value = 0.5
 
         return value
+
+class LFPhotoReflectorArray:
+    """ フォトリフレクタアレイクラス
+
+        車体に取り付けた複数のフォトリフレクタを一括で模擬しています。
+
+        全センサの取り付け位置を 1 回の行列積で回転・平行移動し、
+        全センサの 3x3 領域を 1 回のインデックス参照でまとめて読み出します。
+        センサ数を増やしても Python レベルの処理は増えません。
+
+        footprint に半径 mm を与えると、3x3 領域の平均の代わりに
+        その半径の円形の読み取り範囲を、画素未満の位置ずれも含めて
+        双線形補間で模擬します（位置のわずかな変化に対して値が滑らかに
+        変化します）。円が各画素を覆う割合は構築時に一度だけ計算し、
+        補間の 4 通りのずれに対する重みとしてまとめておきます。
+
+        車体の中心位置を (M,2)、向きを (M,) の配列で与えると
+        M 台分をまとめて計算します（取り付け位置は (P,2) で全車共通、
+        または (M,P,2) で車体ごと）。
+
+        入力　車体の中心位置 [pixel] と向き [rad]
+        出力　フォトリフレクタの値 [0,1]xP （M 台分のときは MxP）
+    """
+
+    def __init__(self,course,mntposprs,footprint = None):
+        self._course = course
+        self._offsets_px = np.asarray(mntposprs,dtype=float)/course.resolution
+        self._values = np.zeros(self._offsets_px.shape[:-1])
+        self._pos_px = np.zeros(self._offsets_px.shape)
+
+        # 表示用の画素からセンサ読み出し用の配列の画素への換算
+        self._scale = course.resolution/course.map_resolution
+
+        # 3x3 領域の一次元化したインデックスの相対値
+        width = course.map_width
+        dy, dx = np.mgrid[-1:2,-1:2]
+        self._window = (dy*width+dx).reshape(-1)
+        self._binary = course.binary.reshape(-1)
+        self._rotmtx = np.empty((2,2))
+
+        # 円形の読み取り範囲（双線形補間の 4 通りのずれごとの重み）
+        self._footprint = footprint
+        if footprint is not None:
+            kernel = footprint_kernel(footprint/course.map_resolution)
+            R = kernel.shape[0]//2
+            weights = np.zeros((4,2*R+2,2*R+2))
+            for idx, (cy, cx) in enumerate(((0,0),(0,1),(1,0),(1,1))):
+                weights[idx,cy:cy+2*R+1,cx:cx+2*R+1] = kernel
+            dy, dx = np.mgrid[-R:R+2,-R:R+2]
+            self._fwindow = (dy*width+dx).reshape(-1)
+            self._fweights = weights.reshape(4,-1).T # ((2R+2)^2, 4)
+            self._fmargin = R + 1
+
+    def __len__(self):
+        return self._offsets_px.shape[-2]
+
+    @property
+    def values(self):
+        return self._values
+
+    @values.setter
+    def values(self,values):
+        self._values = np.asarray(values)
+
+    @property
+    def pos_px(self):
+        return self._pos_px
+
+    @property
+    def footprint(self):
+        return self._footprint
+
+    def positions(self,center_px,angle):
+        """ 全センサ位置 [pixel] の計算 """
+        if np.ndim(angle) == 0: # 1 台分
+            c, s = math.cos(angle), math.sin(angle)
+            rotmtx = self._rotmtx # 右から掛ける回転行列
+            rotmtx[0,0], rotmtx[0,1], rotmtx[1,0], rotmtx[1,1] = c, s, -s, c
+            return np.dot(self._offsets_px,rotmtx) + center_px
+        # M 台分
+        center_px = np.asarray(center_px)
+        c = np.cos(angle).reshape(-1,1)
+        s = np.sin(angle).reshape(-1,1)
+        ox, oy = self._offsets_px[...,0], self._offsets_px[...,1]
+        pos_px = np.empty((len(c),)+ox.shape[-1:]+(2,))
+        pos_px[...,0] = c*ox - s*oy + center_px[:,0:1]
+        pos_px[...,1] = s*ox + c*oy + center_px[:,1:2]
+        return pos_px
+
+    def measure(self,center_px,angle):
+        """ 全センサ値の一括計算 """
+        self._pos_px = self.positions(center_px,angle)
+        self._values = self.sample(self._pos_px)
+        return self._values
+
+    def sample(self,pos_px):
+        """ 位置 (...,2) [pixel] でのセンサ値 (...) """
+        if self._footprint is not None:
+            return self._sample_footprint(pos_px)
+        course = self._course
+        width, height = course.map_width, course.map_height
+
+        # センサ位置周辺の値を一括で読み出し（コース外は (1,1) を参照）
+        if self._scale != 1.0:
+            pos_px = pos_px*self._scale
+        ixy = (pos_px+0.5).astype(np.intp)
+        x_px, y_px = ixy[...,0], ixy[...,1]
+        inside = (1 < x_px) & (x_px < width-1) & \
+            (1 < y_px) & (y_px < height-1)
+        idx = np.where(inside,y_px*width+x_px,width+1)
+        acc = self._binary[idx[...,np.newaxis]+self._window].sum(axis=-1)
+
+        # 3x3 領域の平均を出力（コース外は 0.5）
+        if LFPhotoReflector.ACTIVE_WHITE:
+            value = acc/9.0 # 平均値
+        else:
+            value = 1.0 - acc/9.0 # 平均値
+        return np.where(inside,value,0.5)
+
+    def _sample_footprint(self,pos_px):
+        """ 円形の読み取り範囲での双線形補間 """
+        course = self._course
+        width, height = course.map_width, course.map_height
+        margin = self._fmargin
+
+        # 画素の整数部と小数部
+        pos = np.asarray(pos_px,dtype=float)*self._scale
+        base = np.floor(pos)
+        fx, fy = pos[...,0]-base[...,0], pos[...,1]-base[...,1]
+        ixy = base.astype(np.intp)
+        x_px, y_px = ixy[...,0], ixy[...,1]
+        inside = (margin <= x_px) & (x_px < width-margin) & \
+            (margin <= y_px) & (y_px < height-margin)
+        idx = np.where(inside,y_px*width+x_px,margin*width+margin)
+
+        # 4 通りのずれごとの加重和を双線形補間で合成
+        acc = self._binary[idx[...,np.newaxis]+self._fwindow] @ self._fweights
+        acc = (1-fy)*((1-fx)*acc[...,0] + fx*acc[...,1]) + \
+            fy*((1-fx)*acc[...,2] + fx*acc[...,3])
+
+        # コース外は 0.5
+        if LFPhotoReflector.ACTIVE_WHITE:
+            value = acc
+        else:
+            value = 1.0 - acc
+        return np.where(inside,value,0.5)
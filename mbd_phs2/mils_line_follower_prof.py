@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレースシミュレータ 処理時間計測クラス
+
+説明
+
+　MILS のメインループの 1 フレームを以下の段階に分け、
+  段階ごとの処理時間を記録します。
+
+    - event    # イベント処理・状態遷移
+    - sense    # センサ計算
+    - control  # 制御計算
+    - dynamics # 物理モデルの状態更新
+    - draw     # 描画
+    - display  # 画面更新（pygame.display.update）
+    - wait     # クロック待ち
+
+  記録はあらかじめ確保した配列に直近 maxframes フレーム分を保持し、
+  CSV 出力・ヒストグラム・画面上のオーバーレイ表示ができます。
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+from time import perf_counter
+import numpy as np
+import pygame
+
+# 色の定義
+BLACK  = (  0,   0,   0)
+RED    = (255,   0,   0)
+STAGE_COLORS = ( (128,128,128), (255,128,0), (0,160,0), (0,0,255), \
+    (160,0,160), (0,160,160), (200,200,200) )
+
+class LFStageProfiler:
+    """ 段階別処理時間計測クラス
+
+        mark(stage) を呼ぶと、前回の mark() からの経過時間を
+        現在のフレームの stage の処理時間に加算します。
+    """
+    STAGES = ('event','sense','control','dynamics','draw','display','wait')
+
+    def __init__(self, maxframes = 6000):
+        self._index = { stage: idx for idx, stage in enumerate(self.STAGES) }
+        self._durations = np.zeros((maxframes,len(self.STAGES)))
+        self._maxframes = maxframes
+        self._nframes = 0
+        self._row = self._durations[0]
+        self._t = perf_counter()
+
+    @property
+    def nframes(self):
+        """ 記録済みのフレーム数（最大 maxframes） """
+        return min(self._nframes,self._maxframes)
+
+    def begin_frame(self):
+        """ フレームの開始 """
+        self._row = self._durations[self._nframes % self._maxframes]
+        self._row[:] = 0.0
+        self._t = perf_counter()
+
+    def mark(self, stage):
+        """ 前回からの経過時間を stage に加算 """
+        t = perf_counter()
+        self._row[self._index[stage]] += t - self._t
+        self._t = t
+
+    def end_frame(self):
+        """ フレームの終了 """
+        self._nframes += 1
+
+    def durations(self):
+        """ 記録済みの処理時間 s (フレーム数 x 段階数、古い順) """
+        n = self.nframes
+        if self._nframes <= self._maxframes:
+            return self._durations[:n]
+        start = self._nframes % self._maxframes
+        return np.roll(self._durations,-start,axis=0)
+
+    def summary(self):
+        """ 段階ごとの統計量 ms（平均，中央値，99%点，最大） """
+        d = 1e3*self.durations()
+        if len(d) == 0:
+            return {}
+        mean = d.mean(axis=0)
+        p50, p99 = np.percentile(d,[50,99],axis=0)
+        peak = d.max(axis=0)
+        return { stage: { "mean": float(mean[idx]), "p50": float(p50[idx]), \
+                          "p99": float(p99[idx]), "max": float(peak[idx]) } \
+            for idx, stage in enumerate(self.STAGES) }
+
+    def histogram(self, stage, bins = 20):
+        """ stage の処理時間 ms のヒストグラム (度数, 区間) """
+        return np.histogram(1e3*self.durations()[:,self._index[stage]],bins=bins)
+
+    def save_csv(self, filename):
+        """ フレームごとの処理時間 ms を CSV 出力 """
+        np.savetxt(filename,1e3*self.durations(),delimiter=',', \
+            header=','.join(self.STAGES),comments='',fmt='%.4f')
+
+    def draw_overlay(self, screen, font, budget, pos = (10,10), scale = 4.0):
+        """ 直前のフレームの段階別処理時間を帯グラフで表示
+
+            budget はフレームの時間予算 s（1/fps）で、赤線で示します。
+            描画した領域の矩形 pygame.Rect を返します（未計測なら None）。
+        """
+        if self._nframes == 0:
+            return None
+        row = self._durations[(self._nframes-1) % self._maxframes]
+        x0, y0 = pos
+        x = float(x0)
+        dirty = []
+        for idx, stage in enumerate(self.STAGES):
+            width = 1e3*row[idx]*scale # ms -> pixel
+            dirty.append(pygame.draw.rect(screen,STAGE_COLORS[idx], \
+                (int(x),y0,max(1,int(width+.5)),10)))
+            x += width
+        xb = x0 + int(1e3*budget*scale)
+        dirty.append(pygame.draw.line(screen,RED,(xb,y0-2),(xb,y0+12),2))
+        text = ' '.join([ '{}:{:.1f}'.format(stage[:3],1e3*row[idx]) \
+            for idx, stage in enumerate(self.STAGES) ])
+        dirty.append(screen.blit(font.render(text,True,BLACK),(x0,y0+14)))
+        return dirty[0].unionall(dirty[1:])
@@ -0,0 +1,312 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレースシミュレータ シナリオ実行
+
+説明
+
+　コース・初期姿勢・車体のパラメータ・制御器・走行時間・出力先を
+  シナリオファイルに書いておき、画面なしでまとめて実行します。
+  形式は拡張子で判別します（.json, .toml、PyYAML があれば .yaml/.yml も可）。
+
+    name = "course2025-kp3"
+    duration = 60.0         # 走行時間の上限 s
+    rate = 20               # 物理シミュレーションのレート Hz
+    laps = 1                # 周回数（走り終えたら打ち切り、省略で duration まで走行）
+    checkpoints = [ 2000 ]  # チェックポイント（道のり mm、またはゲート [[x1,y1],[x2,y2]] mm）
+    pose = [ 975, 95, 0.0 ] # 初期姿勢 (x mm, y mm, angle rad、省略でコースの走行開始位置)
+
+    [course]
+    image = "../../images/course2025.png" # シナリオファイルからの相対パス
+    res = 2.5               # 表示用の解像度 mm/pixel
+    map_res = 0.5           # センサ読み出し用の解像度 mm/pixel（省略で res と同じ）
+    start = [ 975, 95, 0.0 ] # 走行開始位置（道のり 0、省略でコース画像ごとの COURSE_STARTS）
+
+    [body]                  # LFPhysicalModel の引数
+    k_p = 3.0
+    mntposprs = [ [120,-60], [100,-20], [100,20], [120,60] ]
+
+    [controller]            # 制御器（class を省略すると LFController）
+    class = "mils_line_follower_ctrl:LFController"
+    bias = 0.2
+
+    [outputs]               # 出力先（--output-dir からの相対パス）
+    result = "kp3.json"     # 走行結果
+    log = "kp3.npy"         # 走行記録（mils_line_follower_log.py で再生）
+    trajectory = "kp3.csv"  # 軌跡と横ずれ・道のり
+
+  プログラムを実行する際は、このファイルが存在するディレクトリに移動して、
+  以下のコマンドを実行して下さい。
+
+　　$ python3 mils_line_follower_scenario.py scenarios/*.toml --summary summary.csv
+　　$ python3 mils_line_follower_scenario.py scenarios/course2025.toml --gui
+
+  1 つでも失敗したシナリオがあれば終了コード 1 で終了します。
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    # 実機と共通の制御パッケージ lfcontrol（リポジトリの最上位）の参照
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main_mils_line_follower import LFModelInTheLoopSimulation, FPS
+from mils_line_follower_course import LFCourse
+from mils_line_follower_log import LFRecorder
+from concurrent.futures import ProcessPoolExecutor
+import mils_line_follower_sweep as sweep
+import multiprocessing
+import numpy as np
+import importlib
+import argparse
+import json
+import csv
+
+# シナリオの項目と既定値
+SCENARIO_DEFAULTS = {
+    'name': None,
+    'course': {},
+    'pose': sweep.START_POSE,
+    'body': {},
+    'controller': {},
+    'duration': sweep.DURATION,
+    'rate': sweep.RATE,
+    'laps': None,
+    'checkpoints': [],
+    'outputs': {},
+}
+COURSE_DEFAULTS = {
+    'image': sweep.COURSE_IMG,
+    'res': sweep.COURSE_RES,
+    'map_res': sweep.COURSE_MAP_RES,
+    'start': None, # None でコース画像ごとの走行開始位置
+}
+BODY_KEYS = ('weight','mntposprs','dynamics','kinematics','substeps','k_p','mu_c','ell_c', \
+    'footprint')
+CONTROLLER_KEYS = ('class','mat_A','bias') # class を省略した場合（LFController の引数）
+OUTPUT_KEYS = ('result','log','trajectory')
+
+# 結果の列名
+RESULT_KEYS = ('name','laptime','courseout','finished') + sweep.RESULT_KEYS[2:]
+
+# プロセス内で読み込み済みのコースデータ
+_courses = {}
+
+def read_scenario_file(filename):
+    """ シナリオファイルの読み込み（形式は拡張子で判別） """
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == '.json':
+        with open(filename,'r',encoding='utf-8') as f:
+            return json.load(f)
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError: # Python 3.10 以前
+            import tomli as tomllib
+        with open(filename,'rb') as f:
+            return tomllib.load(f)
+    if ext in ('.yaml','.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError('PyYAML is required to read {}.'.format(filename))
+        with open(filename,'r',encoding='utf-8') as f:
+            return yaml.safe_load(f)
+    raise ValueError('Unknown scenario format: {}'.format(filename))
+
+def _check_keys(table, allowed, where):
+    unknown = set(table) - set(allowed)
+    if unknown:
+        raise ValueError('Unknown {} keys: {}'.format(where,', '.join(sorted(unknown))))
+
+def load_scenario(filename):
+    """ シナリオの読み込みと検証
+
+        既定値を補い、コース画像のパスをシナリオファイルからの
+        パスに直したシナリオ（辞書）を返します。
+    """
+    data = read_scenario_file(filename)
+    if not isinstance(data,dict):
+        raise ValueError('Scenario must be a table: {}'.format(filename))
+    _check_keys(data,SCENARIO_DEFAULTS,'scenario')
+    scenario = dict(SCENARIO_DEFAULTS)
+    scenario.update(data)
+    if scenario['name'] is None:
+        scenario['name'] = os.path.splitext(os.path.basename(filename))[0]
+
+    # コース
+    _check_keys(scenario['course'],COURSE_DEFAULTS,'course')
+    course = dict(COURSE_DEFAULTS)
+    course.update(scenario['course'])
+    if 'image' in scenario['course']:
+        course['image'] = os.path.join(os.path.dirname(os.path.abspath(filename)), \
+            course['image'])
+    scenario['course'] = course
+
+    # 車体・出力先
+    _check_keys(scenario['body'],BODY_KEYS,'body')
+    if 'class' not in scenario['controller']: # class の引数は制御器ごとに異なる
+        _check_keys(scenario['controller'],CONTROLLER_KEYS,'controller')
+    _check_keys(scenario['outputs'],OUTPUT_KEYS,'outputs')
+    if scenario['pose'] is not None and len(scenario['pose']) != 3:
+        raise ValueError('pose must be [x_mm, y_mm, angle_rad]: {}'.format(filename))
+    scenario['file'] = filename
+    return scenario
+
+def make_controller(spec):
+    """ 制御器の生成
+
+        spec の class（"モジュール:クラス名"）を読み込み、残りの項目を
+        キーワード引数として与えます。class がなければ mat_A, bias を
+        LFPhysicalModel の既定の制御器（LFController）に与えます。
+    """
+    spec = dict(spec)
+    target = spec.pop('class',None)
+    if target is None:
+        return None
+    module, _, name = target.partition(':')
+    if not name:
+        raise ValueError('controller class must be "module:Class": {}'.format(target))
+    cls = getattr(importlib.import_module(module),name)
+    return cls(**spec)
+
+def scenario_course(scenario, cache_dir = None):
+    """ シナリオのコースデータ（同じプロセス内では一度だけ読み込み） """
+    spec = scenario['course']
+    start = None if spec['start'] is None else tuple(spec['start'])
+    key = (spec['image'],spec['res'],spec['map_res'],start)
+    if key not in _courses:
+        _courses[key] = LFCourse(spec['image'],res=spec['res'],map_res=spec['map_res'], \
+            start=start,cache_dir=cache_dir)
+    return _courses[key]
+
+def scenario_model(scenario, course):
+    """ シナリオの物理モデル """
+    params = dict(scenario['body'])
+    controller = make_controller(scenario['controller'])
+    if controller is None:
+        params.update({ name: value for name, value in scenario['controller'].items() \
+            if name in ('mat_A','bias') })
+    kwargs = { name: params.pop(name) for name in ('dynamics','kinematics') if name in params }
+    return sweep.make_model(course,params,controller=controller,**kwargs)
+
+def run_scenario(scenario, cache_dir = None, output_dir = '.'):
+    """ シナリオのヘッドレス実行
+
+        走行結果（RESULT_KEYS の項目）を返し、outputs に指定した
+        ファイルを書き出します。
+    """
+    course = scenario_course(scenario,cache_dir=cache_dir)
+    lf = scenario_model(scenario,course)
+    outputs = { name: os.path.join(output_dir,path) \
+        for name, path in scenario['outputs'].items() }
+    for path in outputs.values():
+        os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+    if 'log' in outputs:
+        lf.recorder = LFRecorder(outputs['log'],len(lf.photorefs))
+
+    # 走行
+    mils = LFModelInTheLoopSimulation(lf,headless=True,rate=scenario['rate'])
+    pose = course.start if scenario['pose'] is None else scenario['pose']
+    try:
+        result = mils.run_headless(*pose,duration=scenario['duration'], \
+            laps=scenario['laps'],checkpoints=scenario['checkpoints'])
+    finally:
+        if lf.recorder is not None:
+            lf.recorder.close()
+
+    # 評価
+    laptimes = result['laptimes']
+    summary = { "name": scenario['name'], \
+                "laptime": result['laptime'], \
+                "courseout": result['courseout'], \
+                "finished": result['finished'], \
+                "laps": result['laps'], \
+                "best_laptime": min(laptimes) if laptimes else float('nan'), \
+                "splits": result['splits'] }
+    summary.update(sweep.lap_metrics(course,result))
+
+    # 出力
+    if 'result' in outputs:
+        with open(outputs['result'],'w',encoding='utf-8') as f:
+            json.dump(dict(summary,laptimes=laptimes,scenario=scenario['file']),f,indent=2)
+    if 'trajectory' in outputs:
+        table = np.column_stack((result['trajectory'],result['lateral_mm'],result['progress_mm']))
+        np.savetxt(outputs['trajectory'],table,delimiter=',',fmt='%.6g',comments='', \
+            header='t,x_mm,y_mm,angle,lateral_mm,progress_mm')
+    return summary
+
+def _run_file(filename, cache_dir, output_dir):
+    """ シナリオファイルの実行（失敗しても例外を送出せずに記録） """
+    try:
+        return run_scenario(load_scenario(filename),cache_dir=cache_dir,output_dir=output_dir)
+    except Exception as err:
+        return { "name": filename, "error": '{}: {}'.format(type(err).__name__,err) }
+
+def run_scenarios(filenames, workers = None, cache_dir = None, output_dir = '.'):
+    """ 複数のシナリオの実行（workers > 1 でプロセス並列） """
+    if workers is None or workers <= 1:
+        return [ _run_file(filename,cache_dir,output_dir) for filename in filenames ]
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(max_workers=workers,mp_context=context) as executor:
+        futures = [ executor.submit(_run_file,filename,cache_dir,output_dir) \
+            for filename in filenames ]
+        return [ future.result() for future in futures ]
+
+def write_summary(filename, results):
+    """ 結果表の CSV 出力（区間時間は JSON 文字列） """
+    with open(filename,'w',newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(RESULT_KEYS)+['error'])
+        for result in results:
+            row = [ json.dumps(result[key]) if isinstance(result.get(key),list) \
+                else result.get(key,'') for key in RESULT_KEYS ]
+            writer.writerow(row+[result.get('error','')])
+
+def run_gui(scenario, cache_dir = None):
+    """ シナリオの初期姿勢・パラメータでの対話的な実行 """
+    course = scenario_course(scenario,cache_dir=cache_dir)
+    lf = scenario_model(scenario,course)
+    mils = LFModelInTheLoopSimulation(lf,fps=FPS,rate=scenario['rate'], \
+        laps=scenario['laps'],checkpoints=scenario['checkpoints'], \
+        pose=course.start if scenario['pose'] is None else scenario['pose'])
+    mils.run()
+
+def main():
+    """ メイン関数 """
+    parser = argparse.ArgumentParser(description='Run MILS scenario files')
+    parser.add_argument('scenarios',nargs='+',help='scenario files (.json, .toml, .yaml)')
+    parser.add_argument('--workers',type=int,default=1)
+    parser.add_argument('--output-dir',default='.', \
+        help='base directory of the outputs in the scenarios')
+    parser.add_argument('--summary',default=None,help='CSV file of all results')
+    parser.add_argument('--cache-dir',default=None)
+    parser.add_argument('--gui',action='store_true', \
+        help='run the first scenario interactively')
+    args = parser.parse_args()
+
+    if args.gui:
+        run_gui(load_scenario(args.scenarios[0]),cache_dir=args.cache_dir)
+        return
+
+    results = run_scenarios(args.scenarios,workers=args.workers, \
+        cache_dir=args.cache_dir,output_dir=args.output_dir)
+    failed = 0
+    for result in results:
+        if 'error' in result:
+            failed += 1
+            print('{}: FAILED {}'.format(result['name'],result['error']))
+        else:
+            print('{}: laps={} laptime={:.2f}s courseout={}'.format(result['name'], \
+                result['laps'],result['laptime'],result['courseout']))
+    if args.summary:
+        write_summary(args.summary,results)
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレースシミュレータ パラメータスイープ
+
+説明
+
+　制御係数や物理パラメータを変えながらヘッドレス走行を多数回行い、
+  結果を CSV ファイルに書き出します。走行は ProcessPoolExecutor で
+  全コアに分散して実行します。各走行は LAPS 周を走り終えた時点で
+  打ち切り、周回時間と区間時間（CHECKPOINTS で区切る）も書き出します。
+
+　スイープするパラメータについては以下のプロパティを編集してください。
+
+    - SWEEP_GRID   # 格子状に組み合わせるパラメータの候補
+    - SWEEP_RANGE  # 一様乱数で選ぶパラメータの範囲 [下限, 上限]
+
+  指定できるパラメータ名は以下の通りです。
+
+    - mat_A      # 制御の係数行列 (2xP)
+    - bias       # 制御のバイアス
+    - k_p        # 比例制御係数 (COEF_K_P)
+    - mu_c       # 直線運動の粘性摩擦係数 (PARAMS_MU_C)
+    - ell_c      # 重心から車輪間の中心までの距離 (PARAMS_ELL_C)
+    - weight     # 車体の重さ g (LF_WEIGHT)
+    - mntposprs  # フォトリフレクタの配置 (LF_MOUNT_POS_PRF)
+    - footprint  # フォトリフレクタの読み取り範囲の半径 mm (LF_FOOTPRINT_PRF)
+    - substeps   # 数値積分 'rk4' の 1 ステップあたりの分割数（None で自動）
+
+  プログラムを実行する際は、このファイルが存在するディレクトリに移動して、
+  以下のコマンドを実行して下さい。
+
+　　$ python3 mils_line_follower_sweep.py -o results.csv
+　　$ python3 mils_line_follower_sweep.py --random 200 -o results.csv
+
+  コースデータは親プロセスで一度だけ読み込み、fork で各ワーカーに
+  引き継ぎます（fork できない環境ではワーカーごとに前処理済みの
+  キャッシュをメモリマップで読み込みます）。
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    # 実機と共通の制御パッケージ lfcontrol（リポジトリの最上位）の参照
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main_mils_line_follower import LFModelInTheLoopSimulation
+from mils_line_follower_body import LFPhysicalModel, LF_MOUNT_POS_PRF
+from mils_line_follower_course import LFCourse, OFFTRACK_MM
+from mils_line_follower_ctrl import LFController
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import numpy as np
+import itertools
+import argparse
+import json
+import csv
+
+# コースデータ画像
+COURSE_IMG = '../images/course2025.png'
+COURSE_RES = 2.5 # 解像度
+COURSE_MAP_RES = None # センサ読み出し用の解像度
+
+# 初期姿勢 (x mm, y mm, angle rad、None でコースの走行開始位置 LFCourse.start)、
+# 走行時間 s、物理シミュレーションのレート Hz
+START_POSE = None
+DURATION = 60.0
+RATE = 20
+
+# 周回数（走り終えたら打ち切り、None で DURATION まで走行）とチェックポイント
+LAPS = 1
+CHECKPOINTS = ()
+
+# 格子状に組み合わせるパラメータの候補
+SWEEP_GRID = {
+    'k_p': [ 2.0, 3.0, 4.0 ],
+    'bias': [ 0.1, 0.2, 0.3 ],
+    'mu_c': [ 1e-3, 1e-2 ],
+}
+
+# 一様乱数で選ぶパラメータの範囲 [下限, 上限]
+SWEEP_RANGE = {
+    'k_p': [ 1.0, 5.0 ],
+    'bias': [ 0.0, 0.5 ],
+    'ell_c': [ 0.0, 60e-3 ],
+}
+
+# 結果の列名
+RESULT_KEYS = ('laptime','courseout','laps','best_laptime','splits', \
+    'offtrack_events','max_lateral_error_mm','mean_lateral_error_mm','progress_mm')
+
+# ワーカーで共有するコースデータ
+_course = None
+
+def make_grid(grid):
+    """ 格子状のパラメータの組み合わせ """
+    names = list(grid.keys())
+    return [ dict(zip(names,values)) \
+        for values in itertools.product(*[ grid[name] for name in names ]) ]
+
+def make_random(ranges,num,seed=None):
+    """ 一様乱数によるパラメータの組み合わせ """
+    rng = np.random.default_rng(seed)
+    samples = []
+    for _ in range(num):
+        params = {}
+        for name, (low, high) in ranges.items():
+            value = rng.uniform(np.asarray(low),np.asarray(high))
+            params[name] = np.asarray(value).tolist()
+        samples.append(params)
+    return samples
+
+def lap_metrics(course,result):
+    """ 走行結果の評価
+
+        ヘッドレス走行で求めた各ステップの中心線からの横ずれから、
+        コースアウトした回数（横ずれが OFFTRACK_MM を超えた回数）、
+        横ずれの絶対値の最大値と平均値 mm、コースに沿って進んだ距離 mm を返します。
+    """
+    lateral = np.abs(result['lateral_mm'])
+    with np.errstate(invalid='ignore'):
+        lost = ~(lateral <= OFFTRACK_MM)
+    offtrack_events = int(np.count_nonzero(lost[1:] & ~lost[:-1]) + lost[0])
+    ontrack = ~lost
+    if ontrack.any():
+        max_lateral = float(lateral[ontrack].max())
+        mean_lateral = float(lateral[ontrack].mean())
+    else:
+        max_lateral = mean_lateral = float('nan')
+    progress = result['progress_mm']
+    distance = float(progress[-1] - progress[0])
+    return { "offtrack_events": offtrack_events, \
+             "max_lateral_error_mm": max_lateral, \
+             "mean_lateral_error_mm": mean_lateral, \
+             "progress_mm": distance }
+
+def make_model(course,params,**kwargs):
+    """ パラメータ params の物理モデルの生成
+
+        kwargs に controller を与えると mat_A, bias の代わりにその制御器を使います。
+    """
+    mntposprs = params.get('mntposprs',LF_MOUNT_POS_PRF)
+    controller = kwargs.pop('controller',None)
+    if controller is None:
+        controller = LFController(mat_A=params.get('mat_A'),bias=params.get('bias'))
+    kwargs.update({ name: params[name] for name in \
+        ('k_p','mu_c','ell_c','weight','footprint','substeps') if name in params })
+    return LFPhysicalModel(course,mntposprs=mntposprs,controller=controller,**kwargs)
+
+def run_lap(params,pose=START_POSE,duration=DURATION,rate=RATE,laps=LAPS, \
+        checkpoints=CHECKPOINTS):
+    """ 1 回分のヘッドレス走行（laps 周を走り終えたら打ち切り） """
+    lf = make_model(_course,params)
+    if pose is None:
+        pose = _course.start
+    mils = LFModelInTheLoopSimulation(lf,headless=True,rate=rate)
+    result = mils.run_headless(*pose,duration=duration,laps=laps,checkpoints=checkpoints)
+
+    laptimes = result['laptimes']
+    metrics = { "laptime": result['laptime'], \
+                "courseout": result['courseout'], \
+                "laps": result['laps'], \
+                "best_laptime": min(laptimes) if laptimes else float('nan'), \
+                "splits": result['splits'] }
+    metrics.update(lap_metrics(_course,result))
+    return metrics
+
+def _init_worker(filename,res,map_res,cache_dir):
+    """ ワーカーの初期化 """
+    global _course
+    if _course is None: # fork の場合は親プロセスのデータを引き継ぐ
+        _course = LFCourse(filename,res=res,map_res=map_res,cache_dir=cache_dir)
+
+def sweep(samples,filename=COURSE_IMG,res=COURSE_RES,workers=None, \
+        pose=START_POSE,duration=DURATION,rate=RATE,cache_dir=None, \
+        map_res=COURSE_MAP_RES,laps=LAPS,checkpoints=CHECKPOINTS):
+    """ パラメータスイープ
+
+        samples の各パラメータで走行し、結果のリストを返します。
+    """
+    global _course
+    _course = LFCourse(filename,res=res,map_res=map_res,cache_dir=cache_dir)
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+    with ProcessPoolExecutor(max_workers=workers,mp_context=context, \
+            initializer=_init_worker,initargs=(filename,res,map_res,cache_dir)) as executor:
+        futures = [ executor.submit(run_lap,params,pose,duration,rate,laps,checkpoints) \
+            for params in samples ]
+        return [ future.result() for future in futures ]
+
+def write_results(filename,samples,results):
+    """ 結果表の CSV 出力（パラメータと区間時間は JSON 文字列） """
+    names = sorted(set(itertools.chain(*[ params.keys() for params in samples ])))
+    with open(filename,'w',newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(names+list(RESULT_KEYS))
+        for params, result in zip(samples,results):
+            row = [ json.dumps(params[name]) if name in params else '' for name in names ]
+            writer.writerow(row+[ json.dumps(result[key]) if isinstance(result[key],list) \
+                else result[key] for key in RESULT_KEYS ])
+
+def main():
+    """ メイン関数 """
+    parser = argparse.ArgumentParser(description='MILS parameter sweep')
+    parser.add_argument('-o','--output',default='sweep_results.csv')
+    parser.add_argument('--random',type=int,default=0, \
+        help='number of random samples (grid sweep if 0)')
+    parser.add_argument('--seed',type=int,default=None)
+    parser.add_argument('--workers',type=int,default=os.cpu_count())
+    parser.add_argument('--duration',type=float,default=DURATION)
+    parser.add_argument('--laps',type=int,default=LAPS, \
+        help='stop each run after this many laps (0 runs for the whole duration)')
+    args = parser.parse_args()
+
+    if args.random > 0:
+        samples = make_random(SWEEP_RANGE,args.random,seed=args.seed)
+    else:
+        samples = make_grid(SWEEP_GRID)
+    results = sweep(samples,workers=args.workers,duration=args.duration, \
+        laps=args.laps or None)
+    write_results(args.output,samples,results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,356 @@
+#!/usr/bin/python3
+# coding: UTF-8
+"""
+ライントレースシミュレータ 複数台表示
+
+説明
+
+　複数台のライントレーサーを 1 つのコース上に重ねて表示し、
+  制御の違いによる走り方を横に並べて比較します。表示できるのは
+  以下のいずれかです。
+
+    - LFModelSource # LFPhysicalModel のリスト（台ごとに別の制御機も可）
+    - LFFleetSource # LFPhysicalModelFleet（全車一括の配列演算）
+    - LFLogSource   # mils_line_follower_log.py で記録した走行記録のリスト
+
+  車体は共有の LFCarSprite の転送、フォトリフレクタの点と台ごとの色の
+  目印は描画済みの小画像の転送とし、全車分を 1 回の blits() で描画します。
+  通過した位置は NumPy 配列に積算してヒートマップとして重ねて表示します。
+
+  プログラムを実行する際は、このファイルが存在するディレクトリに移動して、
+  以下のコマンドを実行して下さい。引数なしでは mils_line_follower_sweep.py の
+  SWEEP_GRID の組み合わせを走らせ、引数に記録ファイルを与えると再生します。
+
+　　$ python3 mils_line_follower_view.py
+　　$ python3 mils_line_follower_view.py run1.npy run2.npy
+
+    [SPACE] 一時停止・再開
+    [h] ヒートマップの表示切替
+    [c] ヒートマップの消去
+    [q] 終了
+
+「電子情報通信設計製図」新潟大学工学部工学科電子情報通信プログラム
+
+All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+import os
+import sys
+
+if __name__ == '__main__':
+    # 実機と共通の制御パッケージ lfcontrol（リポジトリの最上位）の参照
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mils_line_follower_body import LFCarSprite, LF_MOUNT_POS_PRF
+from mils_line_follower_phrf import LFPhotoReflector, LFPhotoReflectorArray
+import numpy as np
+import pygame
+import argparse
+
+# 色の定義
+BLACK  = (  0,   0,   0)
+BLUE   = (  0,   0, 255)
+
+# 台ごとの目印の色（台数が多い場合は繰り返し）
+CAR_COLORS = ( (230,25,75), (60,180,75), (0,130,200), (145,30,180), \
+    (70,240,240), (240,50,230), (128,128,0), (0,0,128), (170,110,40), (128,0,0) )
+
+# フォトリフレクタの点の色の段階数
+DOT_LEVELS = 16
+DOT_RADIUS = 4
+
+class LFModelSource:
+    """ 個別の物理モデルの一括駆動
+
+        1 フレームごとに各モデルを rate/fps ステップずつ進めます。
+    """
+    def __init__(self, models, rate, fps):
+        self._models = list(models)
+        self._rate = rate
+        self._steps = max(1,int(round(rate/fps)))
+        self._nsteps = 0
+
+    @property
+    def num(self):
+        return len(self._models)
+
+    @property
+    def time(self):
+        return self._nsteps/self._rate
+
+    @property
+    def done(self):
+        return False
+
+    def advance(self):
+        for lf in self._models:
+            for _ in range(self._steps):
+                lf.drive(self._rate)
+        self._nsteps += self._steps
+
+    def state(self):
+        """ 車体の中心 (N,2)、向き (N,)、センサ位置 (M,2)、センサ値 (M,) """
+        centers = np.asarray([ lf.get_center_px() for lf in self._models ])
+        angles = np.asarray([ lf.angle for lf in self._models ])
+        pos_px = np.concatenate([ lf.photorefs.pos_px.reshape(-1,2) for lf in self._models ])
+        values = np.concatenate([ lf.photorefs.values.reshape(-1) for lf in self._models ])
+        return centers, angles, pos_px, values
+
+class LFFleetSource(LFModelSource):
+    """ LFPhysicalModelFleet の駆動 """
+    def __init__(self, fleet, rate, fps):
+        super().__init__([],rate,fps)
+        self._fleet = fleet
+
+    @property
+    def num(self):
+        return self._fleet.num
+
+    def advance(self):
+        for _ in range(self._steps):
+            self._fleet.drive(self._rate)
+        self._nsteps += self._steps
+
+    def state(self):
+        prs = self._fleet.photorefs
+        return self._fleet.get_center_px(), self._fleet.angle, \
+            prs.pos_px.reshape(-1,2), prs.values.reshape(-1)
+
+class LFLogSource:
+    """ 走行記録の同時再生
+
+        記録は同じ刻みで、フォトリフレクタの数が同じである必要があります。
+        記録にはフォトリフレクタの配置が含まれないため mntposprs で与えます。
+    """
+    def __init__(self, logs, course, fps, mntposprs = LF_MOUNT_POS_PRF):
+        self._logs = list(logs)
+        if len(set([ log.dtype['prs'].shape for log in self._logs ])) > 1:
+            raise ValueError('Logs must have the same number of photoreflectors')
+        self._res = course.resolution
+        self._prs = LFPhotoReflectorArray(course,mntposprs)
+        log = self._logs[0]
+        if len(log) > 1 and log['t'][1] > log['t'][0]:
+            self._dt = float(log['t'][1]-log['t'][0])
+        else:
+            self._dt = 1.0/fps
+        self._stride = max(1,int(round(1/(fps*self._dt))))
+        self._t0 = float(log['t'][0]) if len(log) > 0 else 0.0
+        self._length = max([ len(log) for log in self._logs ])
+        self._index = 0
+
+    @property
+    def num(self):
+        return len(self._logs)
+
+    @property
+    def time(self):
+        return self._t0 + self._index*self._dt
+
+    @property
+    def done(self):
+        return self._index >= self._length-1
+
+    def advance(self):
+        self._index = min(self._index+self._stride,self._length-1)
+
+    def state(self):
+        recs = np.stack([ log[min(self._index,len(log)-1)] for log in self._logs ])
+        centers = np.stack((recs['x_mm'],recs['y_mm']),axis=1)/self._res
+        angles = recs['angle']
+        pos_px = self._prs.positions(centers,angles)
+        return centers, angles, pos_px.reshape(-1,2), recs['prs'].reshape(-1)
+
+class LFTrailHeatmap:
+    """ 軌跡のヒートマップ
+
+        通過した画素ごとの回数を (width, height) の配列に積算します。
+        decay < 1 とすると fade() のたびに古い軌跡が薄くなります。
+    """
+    MIN_COUNT = 0.01 # 表示する最小の積算値
+    def __init__(self, width, height, decay = 1.0, alpha = 160):
+        self._counts = np.zeros((width,height),dtype=np.float32) # [x, y]
+        self._decay = decay
+        self._alpha = alpha
+        self._rgb = np.zeros((width,height,3),dtype=np.uint8)
+        self._surface = None
+        self._dirty = False
+
+        # 色表（0 は透明色）
+        t = np.linspace(0.0,1.0,256).reshape(-1,1)
+        lut = np.clip(np.hstack((3*t,3*t-1,3*t-2)),0.0,1.0)
+        self._lut = (255*lut+.5).astype(np.uint8)
+        self._lut[1:] = np.maximum(self._lut[1:],(0,0,64))
+
+    @property
+    def counts(self):
+        return self._counts
+
+    def clear(self):
+        self._counts[:] = 0.0
+        self._rgb[:] = 0
+        self._dirty = True
+
+    def accumulate(self, pos_px):
+        """ 位置 (...,2) [pixel] の積算 """
+        ixy = (np.asarray(pos_px)+0.5).astype(np.intp).reshape(-1,2)
+        width, height = self._counts.shape
+        inside = (0 <= ixy[:,0]) & (ixy[:,0] < width) & \
+            (0 <= ixy[:,1]) & (ixy[:,1] < height)
+        np.add.at(self._counts,(ixy[inside,0],ixy[inside,1]),1.0)
+        self._dirty = True
+
+    def fade(self):
+        if self._decay < 1.0:
+            self._counts *= self._decay
+            self._dirty = True
+
+    def surface(self):
+        """ 表示用の画像（積算がなければ None） """
+        if self._surface is None:
+            self._surface = pygame.Surface(self._counts.shape)
+            self._surface.set_colorkey(BLACK)
+            self._surface.set_alpha(self._alpha)
+        if self._dirty:
+            # 通過した画素のみ、対数尺度で 1～255 に割り当て
+            counts = self._counts.reshape(-1)
+            nonzero = np.flatnonzero(counts >= self.MIN_COUNT)
+            if len(nonzero) == 0:
+                return None
+            if self._decay < 1.0: # 薄れて消えた画素を消去
+                self._rgb[:] = 0
+            counts = np.log1p(counts[nonzero])
+            level = np.ceil(counts*(255.0/counts.max())).astype(np.uint8)
+            self._rgb.reshape(-1,3)[nonzero] = self._lut[level]
+            pygame.surfarray.blit_array(self._surface,self._rgb)
+            self._dirty = False
+        return self._surface
+
+class LFMultiCarView:
+    """ 複数台表示クラス """
+
+    def __init__(self, course, fps = 20, sprite = None, heatmap = True, decay = 1.0, \
+            colors = CAR_COLORS):
+        self._course = course
+        self._fps = fps
+        self._width = course.width
+        self._height = course.height
+        self._sprite = LFCarSprite(course.resolution) if sprite is None else sprite
+        self._heatmap = LFTrailHeatmap(self._width,self._height,decay=decay)
+        self._show_heatmap = heatmap
+        self._screen = pygame.display.set_mode((self._width,self._height))
+        self._clock = pygame.time.Clock()
+
+        # 描画済みの小画像（フォトリフレクタの点と台ごとの目印）
+        self._dots = [ self._disc((int(255*k/(DOT_LEVELS-1)),0,0),DOT_RADIUS) \
+            for k in range(DOT_LEVELS) ]
+        self._markers = [ self._disc(color,3) for color in colors ]
+
+    @property
+    def sprite(self):
+        return self._sprite
+
+    @property
+    def heatmap(self):
+        return self._heatmap
+
+    @staticmethod
+    def _disc(color, radius):
+        surface = pygame.Surface((2*radius+1,2*radius+1),pygame.SRCALPHA)
+        pygame.draw.circle(surface,color,(radius,radius),radius)
+        return surface
+
+    def draw(self, screen, centers_px, angles, pos_px = None, values = None):
+        """ 全車の一括描画
+
+            centers_px (N,2), angles (N,) と、必要ならセンサ位置 pos_px (M,2)
+            とセンサ値 values (M,) を与えます。
+        """
+        sprite = self._sprite
+        cxy = (np.asarray(centers_px)+.5).astype(np.intp).tolist()
+        seq = []
+        for (cx, cy), angle in zip(cxy,np.asarray(angles).tolist()):
+            image = sprite.image(angle)
+            seq.append((image,image.get_rect(center=(cx,cy))))
+        nmarkers = len(self._markers)
+        seq.extend([ (self._markers[idx % nmarkers],(cx-3,cy-3)) \
+            for idx, (cx, cy) in enumerate(cxy) ])
+        if pos_px is not None and values is not None:
+            values = np.asarray(values)
+            red = values if LFPhotoReflector.ACTIVE_WHITE else 1.0 - values
+            levels = (red*(DOT_LEVELS-1)+.5).astype(np.intp).tolist()
+            pxy = ((np.asarray(pos_px)+.5).astype(np.intp) - DOT_RADIUS).tolist()
+            seq.extend([ (self._dots[level],xy) for level, xy in zip(levels,pxy) ])
+        screen.blits(seq,doreturn=False)
+
+    def run(self, source):
+        pygame.init()
+        pygame.display.set_caption('ライントレース・複数台表示')
+        font20 = pygame.font.Font(None, 20)
+        screen = self._screen
+        paused = False
+        state = source.state()
+        self._heatmap.accumulate(state[0])
+
+        while True:
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    return
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_SPACE:
+                        paused = not paused
+                    elif event.key == pygame.K_h:
+                        self._show_heatmap = not self._show_heatmap
+                    elif event.key == pygame.K_c:
+                        self._heatmap.clear()
+                    elif event.key == pygame.K_q:
+                        pygame.quit()
+                        return
+
+            if not paused and not source.done:
+                source.advance()
+                state = source.state()
+                self._heatmap.fade()
+                self._heatmap.accumulate(state[0])
+
+            screen.blit(self._course.image,[0, 0])
+            if self._show_heatmap:
+                surface = self._heatmap.surface()
+                if surface is not None:
+                    screen.blit(surface,[0, 0])
+            self.draw(screen,*state)
+            text = 't={:.2f}s  cars={}'.format(source.time,source.num)
+            screen.blit(font20.render(text,True,BLUE),[10,self._height-20])
+            pygame.display.update()
+            self._clock.tick(self._fps)
+
+def main():
+    """ メイン関数 """
+    from main_mils_line_follower import COURSE_IMG, COURSE_RES
+    from mils_line_follower_course import LFCourse
+    from mils_line_follower_log import load_log
+    import mils_line_follower_sweep as sweep
+
+    parser = argparse.ArgumentParser(description='MILS multi-car view')
+    parser.add_argument('logs',nargs='*',help='recorded .npy logs to replay')
+    parser.add_argument('--fps',type=int,default=20)
+    parser.add_argument('--decay',type=float,default=1.0)
+    args = parser.parse_args()
+
+    course = LFCourse(COURSE_IMG,res=COURSE_RES)
+    view = LFMultiCarView(course,fps=args.fps,decay=args.decay)
+    if args.logs:
+        source = LFLogSource([ load_log(filename) for filename in args.logs ], \
+            course,args.fps)
+    else:
+        models = []
+        for params in sweep.make_grid(sweep.SWEEP_GRID):
+            lf = sweep.make_model(course,params,sprite=view.sprite)
+            pose = course.start if sweep.START_POSE is None else sweep.START_POSE
+            lf.set_position_mm(*pose[:2])
+            lf.rotate(pose[2])
+            models.append(lf)
+        source = LFModelSource(models,sweep.RATE,args.fps)
+    view.run(source)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+# coding: UTF-8
+"""
+	ライントレースシミュレータ（mbd_phs1, mbd_phs2）のベンチマーク
+
+	シミュレータの主要な処理の 1 回あたりの実行時間、1 秒あたりの
+	実行回数（steps/s）および 1 回あたりの一時的なメモリ確保量
+	（tracemalloc によるピーク値）を計測します。
+
+	pygame, transitions, scipy の導入が必要です。
+
+	$ python3 tests/bench_mils_line_follower.py
+	$ python3 tests/bench_mils_line_follower.py --phase 2 --save after.json
+	$ python3 tests/bench_mils_line_follower.py --compare before.json
+
+	性能に関わる変更の前後で --save した結果を --compare で比較してください。
+
+
+	All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(ROOT_DIR) # 実機と共通の制御パッケージ lfcontrol
+COURSE_IMG = os.path.join(ROOT_DIR, 'images', 'course2025.png')
+COURSE_RES = 2.5
+START_POSE = (60, 60, 0.0) # コースに開始位置がない場合（mbd_phs1）
+LAP_DURATION = 60.0
+FPS = 20
+
+# フェーズごとに読み込むモジュール
+MODULES = ('main_mils_line_follower', 'mils_line_follower_body', \
+	'mils_line_follower_ctrl', 'mils_line_follower_phrf', \
+	'mils_line_follower_course', 'mils_line_follower_intg')
+
+def load_phase(phase):
+	""" mbd_phs{phase} のモジュールを読み込む """
+	for name in MODULES:
+		sys.modules.pop(name, None)
+	mbd_dir = os.path.join(ROOT_DIR, 'mbd_phs{}'.format(phase))
+	sys.path.insert(0, mbd_dir)
+	try:
+		import main_mils_line_follower
+		import mils_line_follower_body
+		import mils_line_follower_phrf
+	finally:
+		sys.path.remove(mbd_dir)
+	return main_mils_line_follower, mils_line_follower_body, mils_line_follower_phrf
+
+def measure(func, number):
+	""" 1 回あたりの実行時間 s と一時メモリ確保量 byte """
+	func() # ウォームアップ
+	start = time.perf_counter()
+	for _ in range(number):
+		func()
+	elapsed = (time.perf_counter() - start)/number
+
+	tracemalloc.start()
+	tracemalloc.reset_peak()
+	base, _ = tracemalloc.get_traced_memory()
+	func()
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return elapsed, peak - base
+
+def bench_phase(phase, number):
+	""" 1 フェーズ分のベンチマーク """
+	main, body, phrf = load_phase(phase)
+	import pygame
+
+	course = main.LFCourse(COURSE_IMG, res=COURSE_RES)
+	lf = body.LFPhysicalModel(course)
+	lf.set_position_mm(300, 120)
+	lf.rotate(0.5)
+	lf.drive(FPS)
+	screen = pygame.Surface((course.width, course.height))
+
+	pr = phrf.LFPhotoReflector(course)
+	pr.pos_px = lf.get_center_px()
+	mtrs = [ 0.5, 0.3 ]
+	controller = lf._controller
+
+	def updatestate():
+		lf.updatestate(mtrs, FPS)
+		lf.set_position_mm(300, 120)
+
+	def lap():
+		start = getattr(course, 'start', START_POSE)
+		lf.reset()
+		lf.set_position_mm(*start[:2])
+		lf.rotate(start[2])
+		for _ in range(int(LAP_DURATION*FPS)):
+			lf.drive(FPS)
+
+	cases = [
+		('LFPhotoReflector.measurement', pr.measurement, number, 1),
+		('LFPhysicalModel._sense', lf._sense, number, 1),
+		('mtrs2twist', lambda: lf.mtrs2twist(mtrs, 0.1, 0.2, FPS), number, 1),
+		('updatestate', updatestate, number, 1),
+		('LFController.prs2mtrs', controller.prs2mtrs, number, 1),
+		('draw_body', lambda: lf.draw_body(screen), number, 1),
+		('headless lap', lap, max(1, number//1000), int(LAP_DURATION*FPS)),
+	]
+	results = {}
+	for name, func, num, steps in cases:
+		elapsed, alloc = measure(func, num)
+		results[name] = { 'sec': elapsed, 'steps_per_sec': steps/elapsed, 'alloc_bytes': alloc }
+	return results
+
+def report(allresults, baseline=None):
+	""" 結果の表示 """
+	print('{:<8}{:<30}{:>12}{:>14}{:>12}{:>10}'.format( \
+		'phase', 'target', 'usec/call', 'steps/s', 'alloc[B]', 'speedup'))
+	for phase, results in allresults.items():
+		for name, r in results.items():
+			speedup = ''
+			if baseline and phase in baseline and name in baseline[phase]:
+				speedup = '{:.2f}x'.format(baseline[phase][name]['sec']/r['sec'])
+			print('{:<8}{:<30}{:>12.1f}{:>14.0f}{:>12d}{:>10}'.format( \
+				phase, name, 1e6*r['sec'], r['steps_per_sec'], r['alloc_bytes'], speedup))
+
+def main():
+	""" メイン関数 """
+	parser = argparse.ArgumentParser(description='MILS benchmark')
+	parser.add_argument('--phase', type=int, choices=(1, 2), action='append')
+	parser.add_argument('--number', type=int, default=2000)
+	parser.add_argument('--save', help='save results to JSON file')
+	parser.add_argument('--compare', help='baseline JSON file')
+	args = parser.parse_args()
+
+	phases = args.phase if args.phase else [ 1, 2 ]
+	allresults = { 'phs{}'.format(phase): bench_phase(phase, args.number) for phase in phases }
+	baseline = None
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+	report(allresults, baseline)
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump(allresults, f, indent=2)
+
+if __name__ == '__main__':
+	main()
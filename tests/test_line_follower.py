@@ -0,0 +1,374 @@
+# coding: UTF-8
+"""
+	ライントレーサー（実機）のテスト
+
+	gpiozero の導入が必要です。実機がなくても Mock で実行できます。
+
+	Raspberry Pi OS:
+	
+	$ sudo apt-get update
+	$ sudo apt-get install python3-gpiozero python3-pigpio
+
+	Windows:
+
+	> py -m pip install gpiozero pigpio
+
+
+	All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+import os
+import sys
+import time
+import tempfile
+import unittest
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from gpiozero import Device, MCP3004, SPIBadArgs, SPISoftwareFallback
+from gpiozero.pins.mock import MockFactory, MockSPIDevice
+from eiclab_control_loop import ControlLoop
+from eiclab_line_follower_advanced import LineFollower
+from lfcontrol import LFController
+from eiclab_photorefs_array import PhotoRefArray
+from eiclab_photorefs_sampler import PhotoRefSampler
+from eiclab_photorefs_filter import PhotoRefFilter
+from eiclab_photorefs_calib import PhotoRefCalibration, calibrate
+
+class MockPhotoRef:
+    """ フォトリフレクタの代わり """
+    def __init__(self, value):
+        self.value = value
+
+class MockArray:
+    """ 一定の値を出力先にその場で書き込むフォトリフレクタ（複数）の代わり """
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=float)
+
+    def __len__(self):
+        return len(self.values)
+
+    def read(self, out):
+        np.copyto(out, self.values)
+        return out
+
+class MockCounter:
+    """ 読み出すたびに 1 ずつ増える値を返すフォトリフレクタ（複数）の代わり """
+    def __init__(self, num):
+        self.num = num
+        self.count = 0
+
+    def __len__(self):
+        return self.num
+
+    def read(self, out):
+        out[:] = self.count
+        self.count += 1
+        return out
+
+class MockSweep:
+    """ 白と黒の上を行き来するフォトリフレクタ（複数）の代わり """
+    def __init__(self, white, black):
+        self.white = np.asarray(white)
+        self.black = np.asarray(black)
+        self.phase = 0.0
+
+    def __len__(self):
+        return len(self.white)
+
+    def read(self, out):
+        level = 0.5 + 0.5*np.cos(self.phase) # 1: 白, 0: 黒
+        out[:] = self.black + level*(self.white-self.black)
+        self.phase += 0.3
+        return out
+
+class MockEmitter:
+    """ 発光側の LED の代わり """
+    value = True
+
+class MockReflector:
+    """ 外乱光 0.3 と、発光側の点灯時だけの反射光 reflected を返すフォトリフレクタの代わり """
+    def __init__(self, emitter, reflected):
+        self.emitter = emitter
+        self.reflected = np.asarray(reflected)
+
+    def __len__(self):
+        return len(self.reflected)
+
+    def read(self, out):
+        out[:] = 0.3 + (self.reflected if self.emitter.value else 0.0)
+        return out
+
+class MockMCP3004(MockSPIDevice):
+    """ A/D変換器（MCP3004/MCP3008）の代わり """
+    def __init__(self, raw):
+        super().__init__(11, 10, 9, 8)
+        self.raw = raw
+
+    def on_bit(self):
+        # 開始ビット・モード・チャネル（12 ビット目まで）を受け取ったら変換値を返す
+        if self.rx_bit == 12:
+            channel = self.rx_word() & 0x7
+            self.tx_word(0, 2)
+            self.tx_word(self.raw[channel], 10)
+
+class MockClock:
+    """ 呼び出すたびに tick_ns だけ進む時計（時刻 ns）と、それを進める sleep の代わり """
+    def __init__(self, tick_ns=1000):
+        self.now = 0
+        self.tick_ns = tick_ns
+
+    def __call__(self):
+        self.now += self.tick_ns
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += int(round(seconds*1e9))
+
+class MockNoSpidevFactory(MockFactory):
+    """ ハードウェア SPI が使えない（spidev がない）場合の代わり """
+    def _get_spi_class(self, shared, hardware):
+        if hardware:
+            raise ImportError('No module named spidev')
+        return super()._get_spi_class(shared, hardware)
+
+class TestLineFollower(unittest.TestCase):
+    """ ライントレーサーテストクラス """
+
+    def test_prs2mtrs(self):
+        """ 制御テスト """
+        # ターゲット生成
+        photorefs = [ MockPhotoRef(v) for v in (1.0, 0.5, 0.0, 0.0) ]
+        lf = LineFollower(photorefs, mat_A=((2.0, 1.0, 0.0, 0.0), (0.0, 0.0, 0.5, 0.5)))
+
+        # 実際値（出力バッファは使い回す）
+        mtrs = lf.prs2mtrs()
+        mtrsSame = lf.prs2mtrs()
+
+        # 評価
+        np.testing.assert_allclose(mtrs, [ 1.0, 0.0 ]) # [-1,1] に制限
+        self.assertIs(mtrs, mtrsSame)
+
+    def test_prs2mtrs_allocation(self):
+        """ 1 回の呼び出しでメモリを確保しないことのテスト """
+        # ターゲット生成（その場で書き込む一括読み出し）
+        lf = LineFollower(MockArray([ 1.0, 0.5, 0.0, 0.0 ]))
+        for _ in range(10): # ウォームアップ（インタプリタの最適化が済むまで）
+            lf.prs2mtrs()
+
+        # 実際値（1 回の呼び出しの間に確保したメモリのピーク値）
+        tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            lf.prs2mtrs()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        # 評価
+        self.assertEqual(peak - base, 0)
+
+    def test_shared_controller(self):
+        """ シミュレータと共通の制御器テスト """
+        # ターゲット生成（シミュレータの制御器、配列の入力、一括読み出し）
+        values = np.array([ 0.0, 0.25, 0.75, 1.0 ])
+        expctd = np.clip(np.dot(LFController.MAT_A, values) + LFController.BIAS, -1.0, 1.0)
+        source = MockSweep(values, values)
+
+        # 実際値
+        actualStep = LFController().step(values).copy()
+        actualRead = LFController(source).prs2mtrs().copy()
+        actualList = LFController([ MockPhotoRef(v) for v in values ]).prs2mtrs()
+        actualCtrl = np.zeros(2) # control() は入力バッファ以外の配列でも計算（制限なし）
+        LFController().control(np.array([ 1.0, 0.0, 0.0, 0.0 ]), actualCtrl)
+
+        # 評価
+        np.testing.assert_allclose(actualCtrl, [ -0.8, 1.2 ])
+        np.testing.assert_allclose(actualStep, expctd)
+        np.testing.assert_allclose(actualRead, expctd)
+        np.testing.assert_allclose(actualList, expctd)
+        self.assertIsInstance(LineFollower(source), LFController)
+
+        # センサ数が係数行列の列数と異なれば設定時にエラー
+        photorefs = [ MockPhotoRef(0.5) ]*8
+        with self.assertRaises(ValueError):
+            LFController(photorefs)
+        lf = LFController(photorefs, mat_A=np.ones((2, 8)), bias=0.0)
+        np.testing.assert_allclose(lf.prs2mtrs(), [ 1.0, 1.0 ])
+        with self.assertRaises(ValueError):
+            lf.photorefs = source
+
+    def test_photoref_array(self):
+        """ 一括読み出しテスト """
+        Device.pin_factory = MockFactory()
+        adc = MockMCP3004([ 0, 100, 512, 1023 ])
+        try:
+            # ターゲット生成（チャネルごとの MCP3004.value）
+            expctd = [ MCP3004(channel=idx).value for idx in range(4) ]
+
+            # 実際値（ソフトウェア SPI を指定）
+            photorefs = PhotoRefArray(4, hardware=False)
+            values = photorefs.read()
+            raw = photorefs.read_raw()
+            lf = LineFollower(photorefs, mat_A=((1.0, 0.0, 0.0, 0.0), (0.0, 0.0, 0.0, 1.0)))
+            mtrs = lf.prs2mtrs()
+
+            # 評価
+            self.assertEqual(len(photorefs), 4)
+            np.testing.assert_array_equal(raw, [ 0, 100, 512, 1023 ])
+            np.testing.assert_allclose(values, expctd)
+            np.testing.assert_allclose(mtrs, [ expctd[0], expctd[3] ])
+
+            # SPI の引数でない項目はエラー
+            with self.assertRaises(SPIBadArgs):
+                PhotoRefArray(4, hardware=False, speed=1000000)
+        finally:
+            adc.close()
+            Device.pin_factory.reset()
+
+    def test_photoref_array_hardware(self):
+        """ ハードウェア SPI の指定テスト """
+        Device.pin_factory = MockNoSpidevFactory()
+        try:
+            # 評価（ハードウェア SPI を指定して使えなければエラー、既定は警告して切り替え）
+            with self.assertRaises(SPIBadArgs):
+                PhotoRefArray(4, hardware=True)
+            with self.assertWarns(SPISoftwareFallback):
+                PhotoRefArray(4).close()
+        finally:
+            Device.pin_factory.reset()
+
+    def test_photoref_sampler(self):
+        """ バックグラウンド読み出しテスト """
+        # ターゲット生成
+        sampler = PhotoRefSampler(MockCounter(4), rate=2000, depth=16, average=4)
+
+        # 実際値（停止後の最新値と平均、折り返し後の記録）
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+        count = sampler.count
+        mean = sampler.read().copy()
+        sampler.average = 1
+        latest = sampler.read()
+        times, samples = sampler.history(3)
+
+        # 評価
+        self.assertGreater(count, 16)
+        np.testing.assert_array_equal(latest, [ count-1 ]*4)
+        np.testing.assert_allclose(mean, [ count-2.5 ]*4) # (c-4)+...+(c-1) の平均
+        np.testing.assert_array_equal(samples[:,0], [ count-3, count-2, count-1 ])
+        self.assertTrue(np.all(np.diff(times) > 0))
+
+    def test_photoref_filter(self):
+        """ フィルタテスト """
+        # ターゲット生成（1 回おきの外れ値、外乱光）
+        sampler = PhotoRefSampler(MockCounter(2), depth=16)
+        for _ in range(10):
+            sampler._sample()
+        emitter = MockEmitter()
+        ambient = PhotoRefSampler(MockReflector(emitter, [ 0.5, 0.1 ]), depth=16, emitter=emitter)
+        for _ in range(7):
+            ambient._sample()
+
+        # 実際値
+        mean = PhotoRefFilter(sampler, window=4).read().copy()
+        median = PhotoRefFilter(sampler, window=3, median=True).read().copy()
+        reflected = PhotoRefFilter(ambient, window=6, ambient=True).read().copy()
+        lowpass = PhotoRefFilter(sampler, window=1, tau=1.0)
+        first = lowpass.read().copy()
+        sampler._sample() # 0.5 秒後に読み出したことにする
+        sampler._times[10] = sampler._times[9] + int(0.5e9)
+        second = lowpass.read().copy()
+
+        # 評価
+        np.testing.assert_allclose(mean, [ 7.5, 7.5 ])    # 6,7,8,9 の平均
+        np.testing.assert_allclose(median, [ 8.0, 8.0 ])  # 7,8,9 の中央値
+        np.testing.assert_allclose(reflected, [ 0.5, 0.1 ])
+        np.testing.assert_allclose(first, [ 9.0, 9.0 ])
+        np.testing.assert_allclose(second, 9.0 + (1.0 - np.exp(-0.5)))
+
+    def test_photoref_calibration(self):
+        """ 較正テスト """
+        # ターゲット生成（チャネル 2 は白と黒の差が小さい）
+        sweep = MockSweep([ 0.8, 0.9 ], [ 0.1, 0.2 ])
+        dull = MockSweep([ 0.8, 0.52 ], [ 0.1, 0.5 ])
+
+        # 実際値（較正、保存、読み込み後の正規化）
+        calib = calibrate(sweep, duration=0.2, rate=2000)
+        with self.assertRaises(ValueError):
+            calibrate(dull, duration=0.2, rate=2000)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'calib.json')
+            calib.save(filename)
+            loaded = PhotoRefCalibration.load(sweep, filename)
+        sweep.phase = np.pi/2 # 白と黒の中間
+        middle = loaded.read().copy()
+        sweep.phase = 0.0 # 白
+        white = loaded.read()
+
+        # 評価
+        np.testing.assert_allclose(calib.white, [ 0.8, 0.9 ], atol=1e-3)
+        np.testing.assert_allclose(calib.black, [ 0.1, 0.2 ], atol=1e-3)
+        np.testing.assert_allclose(middle, [ 0.5, 0.5 ], atol=1e-3)
+        np.testing.assert_allclose(white, [ 1.0, 1.0 ]) # [0,1] に制限
+
+    def test_control_loop(self):
+        """ 固定レート制御ループテスト """
+        # ターゲット生成
+        clock = MockClock()
+        count = [ 0 ]
+        def step():
+            count[0] += 1
+        loop = ControlLoop(step, rate=500, clock=clock, sleep=clock.sleep)
+
+        # 実際値
+        loop.run(iterations=100)
+        stats = loop.stats()
+
+        # 評価（締め切りは絶対時刻なので 100 周期で 99 周期分の時間）
+        self.assertEqual(count[0], 100)
+        self.assertEqual(stats['iterations'], 100)
+        self.assertEqual(stats['overruns'], 0)
+        self.assertAlmostEqual(stats['rate'], 100/(99*loop.period), delta=0.1)
+        self.assertGreaterEqual(stats['jitter_mean'], 0.0)
+        self.assertLessEqual(stats['jitter_max'], 3*clock.tick_ns*1e-3)
+
+    def test_control_loop_overrun(self):
+        """ オーバーランテスト """
+        # ターゲット生成（3 回に 1 回は 2.5 周期分かかる処理）
+        clock = MockClock()
+        count = [ 0 ]
+        def step():
+            count[0] += 1
+            if count[0] % 3 == 0:
+                clock.sleep(0.005)
+        loop = ControlLoop(step, rate=500, clock=clock, sleep=clock.sleep)
+
+        # 実際値
+        loop.run(iterations=30)
+
+        # 評価（遅れた周期は飛ばし、次の締め切りは 3 周期後）
+        self.assertEqual(loop.overruns, 10)
+        self.assertEqual(loop.skipped, 20)
+        self.assertEqual(loop.stats()['busy_max'], 5000.0+clock.tick_ns*1e-3)
+
+    def test_control_loop_thread(self):
+        """ 別スレッド実行テスト """
+        # ターゲット生成
+        loop = ControlLoop(lambda: None, rate=1000)
+
+        # 実際値
+        loop.start()
+        time.sleep(0.1)
+        loop.stop()
+
+        # 評価
+        self.assertFalse(loop.running)
+        self.assertGreater(loop.iterations, 50)
+
+if __name__ == '__main__':
+    # ユニットテスト呼び出し
+    unittest.main()
@@ -0,0 +1,555 @@
+# coding: UTF-8
+"""
+	ライントレースシミュレータ（mbd_phs2）のテスト
+
+	pygame, transitions, scipy の導入が必要です。
+
+	Raspberry Pi OS:
+
+	$ python3 -m pip install pygame transitions scipy
+
+	Windows:
+
+	> py -m pip install pygame transitions scipy
+
+
+	All rights revserved 2019-2025 (c) Shogo MURAMATSU
+"""
+import os
+import sys
+import json
+import tempfile
+import unittest
+import numpy as np
+import pygame
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MBD_DIR = os.path.join(ROOT_DIR, 'mbd_phs2')
+sys.path.insert(0, MBD_DIR)
+sys.path.append(ROOT_DIR) # 実機と共通の制御パッケージ lfcontrol
+
+from main_mils_line_follower import LFCourse, LFModelInTheLoopSimulation, LFFixedStepClock, \
+    LFDirtyRectRenderer, SIM_RATE
+from mils_line_follower_body import LFPhysicalModel, LFPhysicalModelFleet, LFCarSprite, rotate_pos
+from mils_line_follower_intg import LFIntegrator
+from mils_line_follower_phrf import LFPhotoReflector, LFPhotoReflectorArray
+from mils_line_follower_prof import LFStageProfiler
+from mils_line_follower_log import LFRecorder, load_log
+from mils_line_follower_course import unwrap_progress
+from mils_line_follower_lap import LFLapTimer
+import mils_line_follower_sweep as sweep
+import mils_line_follower_view as view
+import mils_line_follower_scenario as scenario
+
+COURSE_IMG = os.path.join(ROOT_DIR, 'images', 'course2025.png')
+COURSE_RES = 2.5
+
+class TestMILS(unittest.TestCase):
+    """ MILSテストクラス """
+
+    @classmethod
+    def setUpClass(cls):
+        """ コースデータのキャッシュは一時ディレクトリに作成 """
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.cache_dir = cls.tmpdir.name
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        """ テスト前処理 """
+        self.course = LFCourse(COURSE_IMG, res=COURSE_RES, cache_dir=self.cache_dir)
+
+    def test_course_cache(self):
+        """ コースデータのキャッシュテスト """
+        # 期待値（キャッシュなし）
+        expctd = LFCourse(COURSE_IMG, res=COURSE_RES, cache_dir=False)
+
+        # 実際値（キャッシュからメモリマップで読み込み）
+        actual = LFCourse(COURSE_IMG, res=COURSE_RES, cache_dir=self.cache_dir)
+
+        # 評価
+        self.assertIsInstance(actual.binary, np.memmap)
+        np.testing.assert_array_equal(actual.binary, expctd.binary)
+        np.testing.assert_array_equal(actual.distance, expctd.distance)
+        np.testing.assert_array_equal(
+            pygame.surfarray.array3d(actual.image), pygame.surfarray.array3d(expctd.image))
+
+        # 中心線上で距離 0、ライン（黒）の上は中心線から線幅の半分程度以内
+        self.assertTrue(np.all(expctd.distance[expctd.centerline] == 0.0))
+        self.assertLess(np.median(expctd.distance[~expctd.binary]), 10.0)
+
+        # 解像度が異なれば別のキャッシュ
+        course = LFCourse(COURSE_IMG, res=1.25, cache_dir=self.cache_dir)
+        np.testing.assert_allclose(course.distance, expctd.distance/2)
+
+    def test_course_map_resolution(self):
+        """ センサ読み出し用の解像度テスト """
+        # ターゲット生成（表示は 640x360 のまま、センサは 5 倍の解像度）
+        course = LFCourse(COURSE_IMG, res=COURSE_RES, map_res=0.5, cache_dir=self.cache_dir)
+
+        # 評価
+        self.assertEqual((course.width, course.height), (640, 360))
+        self.assertEqual((course.map_width, course.map_height), (3200, 1800))
+        self.assertEqual(course.binary.shape, (1800, 3200))
+        self.assertAlmostEqual(course.realwidth, self.course.realwidth)
+
+        # 線幅より十分内側・外側では同じ値（位置は表示用の画素で与える）
+        prs = LFPhotoReflectorArray(course, [ (0, 0) ])
+        prs_ref = LFPhotoReflectorArray(self.course, [ (0, 0) ])
+        pos_px = np.asarray([ [ 20.0, 20.0 ], [ 320.0, 180.0 ], [ -5.0, 10.0 ] ])
+        np.testing.assert_array_equal(prs.sample(pos_px), prs_ref.sample(pos_px))
+
+    def test_course_fields(self):
+        """ 符号付き距離・横ずれ・道のりの場のテスト """
+        # ターゲット生成
+        course = self.course
+        path = course.path
+
+        # 実際値（経路上の点と、コース外の点）
+        lateral, progress, sdf = course.locate(path[:-1, 0], path[:-1, 1])
+        outside = course.locate(-10.0, 50.0)
+
+        # 評価（経路は一周し、経路上では横ずれ 0・ライン上・道のりは増加）
+        self.assertTrue(course.closed)
+        self.assertGreater(course.length, course.realwidth)
+        self.assertLess(np.abs(lateral).max(), 2*course.map_resolution)
+        self.assertTrue(np.all(sdf < 0))
+        self.assertGreater(np.mean(np.diff(progress) > 0), 0.95)
+        self.assertTrue(np.isnan(outside[0]))
+        self.assertTrue(course.offtrack(-10.0, 50.0))
+        self.assertFalse(course.offtrack(path[10, 0], path[10, 1]))
+
+        # 周回ごとに折り返す道のりの連続化
+        L = course.length
+        np.testing.assert_allclose(unwrap_progress([L-10, L-5, 5, 10], L), [-10, -5, 5, 10])
+
+        # 交差部で一時的に飛んだ道のりは保持、飛んだ先を進み続ければ移る
+        np.testing.assert_allclose(unwrap_progress([0, 50, 2000, 60, 70], L), [0, 50, 50, 60, 70])
+        jumped = unwrap_progress([0, 50, 2000, 2100, 2200, 2300], L)
+        np.testing.assert_allclose(jumped, [0, 50, 50, 50, 2200, 2300])
+
+    def test_course_trace(self):
+        """ 中心線の追跡テスト（走行開始位置と交差部） """
+        # ターゲット生成（交差部を二度通る経路の点）
+        course = self.course
+        path = course.path
+        crossing = np.hypot(path[:, 0]-257.0, path[:, 1]-448.0) < 10.0
+        passes = np.split(np.nonzero(crossing)[0],
+            np.nonzero(np.diff(np.nonzero(crossing)[0]) > 1)[0]+1)
+
+        # 実際値（交差部の前後 40 mm の向きの変化）
+        turns = []
+        for idx in passes:
+            s = path[idx[0], 2]
+            before = np.interp(s-40.0, path[:, 2], path[:, 3])
+            after = np.interp(s+40.0, path[:, 2], path[:, 3])
+            turns.append(abs((after-before+np.pi) % (2*np.pi) - np.pi))
+
+        # 評価（開始位置はライン上、一周して閉じ、交差部は二度とも直進）
+        self.assertLess(np.hypot(*(path[0, :2]-course.start[:2])), 2*course.map_resolution)
+        self.assertTrue(course.closed)
+        self.assertEqual(len(passes), 2)
+        self.assertLess(max(turns), 0.5)
+
+        # ライン上にない開始位置は警告（線幅より離れていれば OFFTRACK_MM 以内でも）
+        with self.assertWarns(RuntimeWarning):
+            LFCourse(COURSE_IMG, res=COURSE_RES, start=(800.0, 150.0, 0.0), cache_dir=False)
+
+    def test_lap_timer(self):
+        """ 周回・区間計測テスト """
+        # ターゲット生成（経路上を 100 mm/s で 2 周する点）
+        course = self.course
+        L = course.length
+        timer = LFLapTimer(course, laps=2, checkpoints=[ L/2 ])
+        path = course.path
+        points = np.concatenate((path[:-1], path[:-1], path[:3]))
+        times = np.concatenate((path[:-1, 2], L+path[:-1, 2], 2*L+path[:3, 2]))/100.0
+
+        # 実際値
+        for t, (x, y) in zip(times, points[:, :2]):
+            timer.update(t, x, y)
+        result = timer.result()
+
+        # 評価
+        self.assertTrue(timer.finished)
+        self.assertEqual(result['laps'], 2)
+        np.testing.assert_allclose(result['laptimes'], [ L/100.0 ]*2, rtol=1e-2)
+        np.testing.assert_allclose(np.sum(result['splits'], axis=1), result['laptimes'])
+        np.testing.assert_allclose(result['splits'][0], [ L/200.0 ]*2, rtol=5e-2)
+
+    def test_headless_lap(self):
+        """ ヘッドレス実行での周回計測テスト """
+        # ターゲット生成（走行開始位置から 1 周）
+        course = self.course
+        lf = LFPhysicalModel(course)
+        mils = LFModelInTheLoopSimulation(lf, headless=True, rate=20)
+
+        # 実際値
+        result = mils.run_headless(*course.start, duration=120.0, laps=1)
+
+        # 評価（交差部を通っても周回を数え、道のりは一周分）
+        self.assertFalse(result['courseout'])
+        self.assertTrue(result['finished'])
+        self.assertEqual(result['laps'], 1)
+        self.assertLess(result['laptime'], 120.0)
+        self.assertGreaterEqual(result['progress_mm'][-1], course.length)
+
+    def test_run_headless(self):
+        """ ヘッドレス実行テスト """
+        # ターゲット生成
+        lf = LFPhysicalModel(self.course)
+        mils = LFModelInTheLoopSimulation(lf, fps=20, headless=True)
+
+        # 実際値（走行開始位置から 2 秒）
+        result = mils.run_headless(*self.course.start, duration=2.0)
+
+        # 評価
+        trajectory = result['trajectory']
+        self.assertFalse(result['courseout'])
+        self.assertEqual(trajectory.shape, (41, 4))
+        self.assertAlmostEqual(result['laptime'], 2.0)
+        self.assertAlmostEqual(trajectory[-1][0], result['laptime'])
+        self.assertEqual(result['lateral_mm'].shape, (len(trajectory),))
+        self.assertEqual(result['progress_mm'].shape, (len(trajectory),))
+
+        # 実際値（ラインから離れた位置から、見失ったら打ち切り）
+        lost = mils.run_headless(400, 450, 0.0, duration=10.0, offtrack_timeout=0.5)
+
+        # 評価
+        self.assertTrue(lost['courseout'])
+        self.assertLessEqual(lost['laptime'], 0.5)
+        self.assertTrue(self.course.offtrack(*lost['trajectory'][-1][1:3]))
+
+    def test_fixed_step_clock(self):
+        """ 固定ステップ時計テスト """
+        # ターゲット生成
+        clock = LFFixedStepClock(1000, 200)
+
+        # 実際値（描画間隔がばらついても合計ステップ数は同じ）
+        nsteps = [ clock.advance(dt) for dt in (0.05, 0.013, 0.037, 0.1) ]
+
+        # 評価
+        self.assertEqual(sum(nsteps), 200)
+        self.assertAlmostEqual(clock.time, 0.2)
+
+        # 遅れの切り捨て
+        self.assertEqual(clock.advance(1.0), 200)
+        self.assertEqual(clock.advance(0.0), 0)
+
+    def test_dirty_rect_renderer(self):
+        """ 差分描画テスト """
+        lf = LFPhysicalModel(self.course)
+        screen = pygame.display.set_mode((self.course.width,self.course.height))
+        expected = pygame.Surface(screen.get_size())
+
+        # ターゲット生成
+        renderer = LFDirtyRectRenderer(screen,self.course.image)
+
+        for x_mm, y_mm, angle in ((60,60,0.0),(200,150,0.7),(210,160,2.0)):
+            lf.set_position_mm(x_mm,y_mm)
+            lf.rotate(angle)
+
+            # 実際値（差分描画）
+            renderer.restore()
+            renderer.add(lf.draw_body(screen))
+            renderer.update()
+
+            # 期待値（全画面描画）
+            expected.blit(self.course.image,(0,0))
+            lf.draw_body(expected)
+
+            # 評価
+            np.testing.assert_array_equal(
+                pygame.surfarray.array3d(screen),pygame.surfarray.array3d(expected))
+
+    def test_car_sprite(self):
+        """ 車体スプライトテスト """
+        # ターゲット生成
+        sprite = LFCarSprite(COURSE_RES, angle_steps=36, maxsize=4)
+
+        # 実際値（量子化された向きは同じ画像を共有）
+        image0 = sprite.image(0.0)
+        image1 = sprite.image(0.01)
+        image2 = sprite.image(2*np.pi)
+
+        # 評価
+        self.assertIs(image0, image1)
+        self.assertIs(image0, image2)
+        self.assertEqual(len(sprite), 1)
+
+        # 最も古い画像から破棄
+        for k in range(1, 5):
+            sprite.image(k*2*np.pi/36)
+        self.assertEqual(len(sprite), 4)
+        self.assertIsNot(sprite.image(0.0), image0)
+
+        # 描画領域はシャフト中心を中心とする
+        screen = pygame.Surface((self.course.width, self.course.height))
+        rect = sprite.blit(screen, (100.0, 80.0), 0.5)
+        self.assertEqual(rect.center, (100, 80))
+
+    def test_multi_car_view(self):
+        """ 複数台表示テスト """
+        fleet = LFPhysicalModelFleet(self.course, 8, k_p=np.linspace(2.0, 4.0, 8))
+        fleet.set_pose_mm(60, 60, 0.0)
+
+        # ターゲット生成
+        mview = view.LFMultiCarView(self.course)
+        source = view.LFFleetSource(fleet, 40, 20)
+
+        # 実際値
+        source.advance()
+        centers, angles, pos_px, values = source.state()
+        mview.heatmap.accumulate(centers)
+        mview.heatmap.accumulate([[-5.0, 10.0], [10.0, 10.0]]) # コース外は無視
+        screen = pygame.Surface((self.course.width, self.course.height))
+        mview.draw(screen, centers, angles, pos_px, values)
+
+        # 評価
+        self.assertAlmostEqual(source.time, 0.05)
+        self.assertEqual(centers.shape, (8, 2))
+        self.assertEqual(pos_px.shape, (8*len(sweep.LF_MOUNT_POS_PRF), 2))
+        self.assertEqual(mview.heatmap.counts.sum(), 9.0)
+        self.assertEqual(mview.heatmap.counts[10, 10], 1.0)
+        self.assertIsNotNone(mview.heatmap.surface())
+
+    def test_stage_profiler(self):
+        """ 段階別処理時間計測テスト """
+        # ターゲット生成
+        lf = LFPhysicalModel(self.course)
+        lf.set_position_mm(300, 120)
+        prof = LFStageProfiler(maxframes=3)
+
+        # 実際値（リングバッファを一周させる）
+        for _ in range(5):
+            prof.begin_frame()
+            lf.drive(20, profiler=prof)
+            prof.end_frame()
+        durations = prof.durations()
+
+        # 評価
+        self.assertEqual(durations.shape, (3, len(LFStageProfiler.STAGES)))
+        for stage in ('sense', 'control', 'dynamics'):
+            self.assertGreater(prof.summary()[stage]['max'], 0.0)
+        self.assertEqual(prof.summary()['draw']['max'], 0.0)
+
+    def test_recorder(self):
+        """ 走行記録テスト """
+        lf = LFPhysicalModel(self.course)
+        mils = LFModelInTheLoopSimulation(lf, fps=20, headless=True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'run.npy')
+
+            # ターゲット生成
+            with LFRecorder(filename, len(lf.photorefs), chunk=7) as recorder:
+                lf.recorder = recorder
+                result = mils.run_headless(60, 60, 0.0, duration=1.0)
+                recorder.flush()
+
+                # 実際値（記録中でも読み込み可能）
+                log = load_log(filename)
+
+                # 評価
+                trajectory = result['trajectory']
+                self.assertEqual(len(log), len(trajectory)-1)
+                np.testing.assert_allclose(log['t'], trajectory[1:,0])
+                np.testing.assert_allclose(log['x_mm'], trajectory[1:,1])
+                np.testing.assert_allclose(log['angle'], trajectory[1:,3])
+                self.assertEqual(log['prs'].shape, (len(log), len(lf.photorefs)))
+                del log
+            lf.recorder = None
+
+    def test_photoreflector_array(self):
+        """ フォトリフレクタアレイ一括計算テスト """
+        # ターゲット生成
+        mntposprs = [ (100+5*idx, -60+8*idx) for idx in range(16) ]
+        prarray = LFPhotoReflectorArray(self.course, mntposprs)
+        pr = LFPhotoReflector(self.course)
+
+        rng = np.random.default_rng(0)
+        for _ in range(100):
+            center_px = rng.uniform(-20, 660, 2)
+            angle = rng.uniform(-np.pi, np.pi)
+
+            # 実際値
+            valuesActual = prarray.measure(center_px, angle)
+
+            # 期待値（センサごとに取り付け位置を車体の中心のまわりに回転）
+            res = self.course.resolution
+            posExpctd = [ rotate_pos(center_px + np.asarray(pos)/res, center_px, angle)
+                for pos in mntposprs ]
+            valuesExpctd = []
+            for pos in posExpctd:
+                pr.pos_px = pos
+                valuesExpctd.append(pr.value)
+
+            # 評価
+            np.testing.assert_allclose(prarray.pos_px, posExpctd)
+            np.testing.assert_allclose(valuesActual, valuesExpctd)
+
+    def test_photoreflector_footprint(self):
+        """ 円形の読み取り範囲のフォトリフレクタテスト """
+        # ターゲット生成
+        prs = LFPhotoReflectorArray(self.course, [ (0, 0) ], footprint=3.75)
+
+        # 実際値（ラインの縁を 0.05 画素ずつ横切る）
+        ys = np.arange(25.0, 35.0, 0.05)
+        pos_px = np.stack((np.full_like(ys, 320.0), ys), axis=1)
+        values = prs.sample(pos_px)
+
+        # 評価（値は [0,1] で、位置の小さな変化に対して滑らかに変化）
+        self.assertTrue(np.all((0.0 <= values) & (values <= 1.0 + 1e-12)))
+        self.assertGreater(values.max() - values.min(), 0.9)
+        self.assertLess(np.abs(np.diff(values)).max(), 0.05)
+        self.assertGreater(len(np.unique(values)), 50)
+
+        # コース外は 0.5
+        self.assertEqual(prs.sample(np.asarray([ -10.0, 20.0 ])), 0.5)
+
+    def test_integrator(self):
+        """ 数値積分法テスト """
+        coefs = LFPhysicalModel(self.course).fold_params()
+        h = 1e-3
+        u_lin, u_rot = 0.5, 0.2
+
+        # 期待値（odeint による参照解）
+        ref = LFIntegrator(coefs, dynamics='odeint', kinematics='odeint')
+        v, w, x, y, th = 0.0, 0.0, 0.0, 0.0, 0.0
+        for _ in range(500):
+            v, w = ref.step_dynamics(v, w, u_lin, u_rot, h)
+            x, y, th = ref.step_kinematics(x, y, th, v, w, h)
+        stateExpctd = [ v, w, x, y, th ]
+
+        for dynamics in ('exp', 'rk4', 'euler'):
+            # ターゲット生成
+            intg = LFIntegrator(coefs, dynamics=dynamics, kinematics='arc')
+
+            # 実際値
+            v, w, x, y, th = 0.0, 0.0, 0.0, 0.0, 0.0
+            for _ in range(500):
+                v, w = intg.step_dynamics(v, w, u_lin, u_rot, h)
+                x, y, th = intg.step_kinematics(x, y, th, v, w, h)
+            stateActual = [ v, w, x, y, th ]
+
+            # 評価
+            np.testing.assert_allclose(stateActual, stateExpctd, rtol=1e-2, atol=1e-4)
+
+    def test_integrator_sim_rate(self):
+        """ シミュレーションのレートでの数値積分法テスト """
+        coefs = LFPhysicalModel(self.course).fold_params()
+        h = 1.0/SIM_RATE
+        # 0.25 秒ごとに切り替わる制御信号（ゼロ次ホールド）
+        inputs = [ (0.5, 0.2), (0.3, -0.6), (0.8, 0.4), (0.2, -0.1) ]
+        inputs = [ u for u in inputs for _ in range(int(0.25*SIM_RATE)) ]
+        # 状態の最大値に対する誤差の許容値（半陰的オイラー法は 1 次精度）
+        rtols = { 'exp': 5e-2, 'rk4': 1e-3, 'euler': 3e-1 }
+
+        def simulate(intg):
+            v, w, x, y, th = 0.0, 0.0, 0.0, 0.0, 0.0
+            states = []
+            for u_lin, u_rot in inputs:
+                v, w = intg.step_dynamics(v, w, u_lin, u_rot, h)
+                x, y, th = intg.step_kinematics(x, y, th, v, w, h)
+                states.append([ v, w, x, y, th ])
+            return np.array(states)
+
+        # 期待値（odeint による参照解）
+        statesExpctd = simulate(LFIntegrator(coefs, dynamics='odeint', kinematics='odeint'))
+        scale = np.abs(statesExpctd).max(axis=0)
+
+        for dynamics, rtol in rtols.items():
+            # ターゲット生成
+            intg = LFIntegrator(coefs, dynamics=dynamics, kinematics='arc')
+
+            # 実際値
+            statesActual = simulate(intg)
+
+            # 評価
+            np.testing.assert_array_less(
+                np.abs(statesActual - statesExpctd).max(axis=0), rtol*scale)
+
+        # 'rk4' は時定数に合わせてステップを分割（分割しなければ誤差が大きい）
+        intg = LFIntegrator(coefs, dynamics='rk4', kinematics='arc', substeps=1)
+        error = np.abs(simulate(intg) - statesExpctd).max(axis=0)
+        self.assertTrue(np.any(error > rtols['rk4']*scale))
+        intg = LFIntegrator(coefs, dynamics='rk4', kinematics='arc')
+        intg.step_dynamics(0.0, 0.0, 0.5, 0.2, h)
+        self.assertGreater(intg.substeps, 1)
+
+    def test_fleet(self):
+        """ 複数台一括シミュレーションテスト """
+        poses = [ (60, 60, 0.0), (300, 120, 0.5), (800, 300, -1.0) ]
+
+        # ターゲット生成
+        fleet = LFPhysicalModelFleet(self.course, len(poses))
+        fleet.set_pose_mm(*zip(*poses))
+
+        # 実際値
+        for _ in range(100):
+            fleet.drive(20)
+
+        for idx, pose in enumerate(poses):
+            # 期待値（1 台ずつの計算）
+            lf = LFPhysicalModel(self.course)
+            lf.set_position_mm(pose[0], pose[1])
+            lf.rotate(pose[2])
+            for _ in range(100):
+                lf.drive(20)
+
+            # 評価
+            np.testing.assert_allclose( \
+                [ fleet.x_mm[idx], fleet.y_mm[idx], fleet.angle[idx] ], \
+                lf.get_position_mm() + [ lf.angle ], rtol=1e-6)
+
+    def test_sweep(self):
+        """ パラメータスイープテスト """
+        # ターゲット生成
+        samples = sweep.make_grid({ 'k_p': [ 2.0, 3.0 ], 'bias': [ 0.2 ] })
+
+        # 実際値
+        results = sweep.sweep(samples, filename=COURSE_IMG, res=COURSE_RES, \
+            workers=2, duration=1.0, cache_dir=self.cache_dir)
+
+        # 評価
+        self.assertEqual(len(samples), 2)
+        self.assertEqual(samples[1], { 'k_p': 3.0, 'bias': 0.2 })
+        for result in results:
+            self.assertEqual(set(result.keys()), set(sweep.RESULT_KEYS))
+            self.assertLessEqual(result['laptime'], 1.0)
+
+    def test_scenario(self):
+        """ シナリオ実行テスト """
+        # ターゲット生成
+        filename = os.path.join(self.cache_dir, 'scenario.json')
+        with open(filename, 'w') as f:
+            json.dump({ 'name': 'short', 'duration': 1.0, 'pose': [ 60, 60, 0.0 ], \
+                'course': { 'image': COURSE_IMG, 'res': COURSE_RES }, \
+                'body': { 'k_p': 3.0 }, 'controller': { 'bias': 0.2 }, \
+                'outputs': { 'result': 'short.json', 'trajectory': 'short.csv' } }, f)
+
+        # 実際値
+        result = scenario.run_scenario(scenario.load_scenario(filename), \
+            cache_dir=self.cache_dir, output_dir=self.cache_dir)
+
+        # 評価
+        self.assertEqual(result['name'], 'short')
+        self.assertEqual(set(result.keys()), set(scenario.RESULT_KEYS))
+        self.assertLessEqual(result['laptime'], 1.0)
+        table = np.loadtxt(os.path.join(self.cache_dir, 'short.csv'), delimiter=',', skiprows=1)
+        self.assertEqual(table.shape[1], 6)
+        with open(os.path.join(self.cache_dir, 'short.json')) as f:
+            self.assertEqual(json.load(f)['name'], 'short')
+
+        # 未知の項目はエラー
+        for data in ({ 'body': { 'kp': 3.0 } }, { 'controller': { 'bais': 5.0 } }):
+            with open(filename, 'w') as f:
+                json.dump(data, f)
+            with self.assertRaises(ValueError):
+                scenario.load_scenario(filename)
+
+if __name__ == '__main__':
+    # ユニットテスト呼び出し
+    unittest.main()